@@ -33,93 +33,56 @@
 # 
 """
 
-import time
-from adafruit_featherwing import minitft_featherwing
-
-# from mode_mainmenu import Mode_MainMenu
-from screen_menu import Screen_Menu
-from screen_dashboard import Screen_Dashboard
-from screen_summary import Screen_Summary
-from mode_config import Mode_Config
-from mode_followpath import Mode_FollowPath
-from mode_driveshapes import Mode_DriveShapes
-from mode_calibrate import Mode_Calibrate
-from mode_config import Mode_Config
-from device_motors import Device_Motors
-from device_linesense import Device_LineSense
-from device_storage import Device_Storage
-from device_battery import Device_Battery
-
-
-# create instance for TFT board
-# (note it is possible that the TFT board itself doesn't have any
-# pullups for the I2C pins used for SeeSaw -- if you use it without
-# including pullups, the display shows letters but this driver initialization
-# never completes...)
-minitft = minitft_featherwing.MiniTFTFeatherWing()
-
-# create / initialize device handlers
-mode_config = Mode_Config(minitft)
-screen_dashboard = Screen_Dashboard(minitft, mode_config)
-device_motors = Device_Motors(screen_dashboard)
-device_linesense = Device_LineSense(screen_dashboard)
-device_storage = Device_Storage()
-device_battery = Device_Battery()
-
-# create instances of mode handlers
-
-mainmenu_items = [
-    ["Calibrate Sensors", "CAL"],
-    ["Follow Path", "PATH"],
-    ["Setup Parameters", "SETUP"],
-    ["Display Linesensor", "DISPSENS"],
-]
-screen_menu = Screen_Menu(minitft, mainmenu_items, device_linesense, device_battery)
-
-mode_followpath = Mode_FollowPath(
-    screen_dashboard, device_motors, device_linesense, device_storage, mode_config
-)
-mode_driveshapes = Mode_DriveShapes(
-    screen_dashboard, device_motors, device_linesense, device_storage
-)
-mode_calibrate = Mode_Calibrate(
-    screen_dashboard, device_motors, device_linesense, device_storage
-)
-screen_summary = Screen_Summary(
-    minitft, mode_followpath, mode_config, device_storage, device_battery
+import hal
+
+hal.install()
+
+import asyncio
+from robot_session import Robot_Session
+
+# every device, mode and screen handler, and the runtime's background jobs
+session = Robot_Session(
+    print_stats=False,  # True prints display, sensor and I2C counters per run
 )
 
-next_mode = "MAINMENU"
-while True:
-    if next_mode == "PATH":
-        mode_followpath.run_mode()
-        screen_summary.run_mode()
-        next_mode = "MAINMENU"
 
-    elif next_mode == "CAL":
-        next_mode = mode_calibrate.run_mode()
-        next_mode = "MAINMENU"
+async def main():
+    session.runtime.start()
+
+    next_mode = "MAINMENU"
+    while True:
+        if next_mode == "PATH":
+            await session.mode_followpath.run_mode(session.runtime)
+            await session.screen_summary.run_mode()
+            next_mode = "MAINMENU"
+
+        elif next_mode == "CAL":
+            next_mode = await session.mode_calibrate.run_mode()
+            next_mode = "MAINMENU"
+
+        elif next_mode == "SETUP":
+            next_mode = await session.mode_config.run_mode()
+            next_mode = "MAINMENU"
+
+        elif next_mode == "STRAIGHT":
+            next_mode = await session.mode_driveshapes.run_straight()
+            next_mode = "MAINMENU"
 
-    elif next_mode == "SETUP":
-        next_mode = mode_config.run_mode()
-        next_mode = "MAINMENU"
+        elif next_mode == "CURVLEFT":
+            next_mode = await session.mode_driveshapes.run_curveleft()
+            next_mode = "MAINMENU"
 
-    elif next_mode == "STRAIGHT":
-        next_mode = mode_driveshapes.run_straight()
-        next_mode = "MAINMENU"
+        elif next_mode == "CURVRIGHT":
+            next_mode = await session.mode_driveshapes.run_curveright()
+            next_mode = "MAINMENU"
 
-    elif next_mode == "CURVLEFT":
-        next_mode = mode_driveshapes.run_curveleft()
-        next_mode = "MAINMENU"
+        elif next_mode == "DISPSENS":
+            next_mode = await session.mode_calibrate.display_linesensor()
+            next_mode = "MAINMENU"
+        else:
+            next_mode = await session.screen_menu.run_menu()
 
-    elif next_mode == "CURVRIGHT":
-        next_mode = mode_driveshapes.run_curveright()
-        next_mode = "MAINMENU"
+        await asyncio.sleep(0.1)
 
-    elif next_mode == "DISPSENS":
-        next_mode = mode_calibrate.display_linesensor()
-        next_mode = "MAINMENU"
-    else:
-        next_mode = screen_menu.run_menu()
 
-    time.sleep(0.1)
+asyncio.run(main())
@@ -50,9 +50,18 @@ class Device_Battery:
     def __init__(self):
         self.vbat_feather_pin = AnalogIn(board.VOLTAGE_MONITOR)
         self.vbat_motor_pin = AnalogIn(board.A0)
+        # most recent readings from update() (the runtime's battery watch)
+        self.vbat_feather = 0
+        self.vbat_motor = 0
 
     def get_vbat_feather(self):
         return (self.vbat_feather_pin.value * 3.3) / 65536 * 2
 
     def get_vbat_motor(self):
         return (self.vbat_motor_pin.value * 3.3) / 65536 * 2
+
+    # samples both batteries; runs periodically as a background job so
+    # the latest voltages are always available without reading the ADC
+    def update(self):
+        self.vbat_feather = self.get_vbat_feather()
+        self.vbat_motor = self.get_vbat_motor()
@@ -0,0 +1,278 @@
+"""
+# Controller for Line-Following Robot
+# This runs on an Adafruit Feather M4, with a MiniTFT board.
+# It drives a TB6612 to control 2 DC Motors (in blue servo case)
+# and talks over I2C to an ItsyBitsy that interfaces a Pololu
+# line following sensor
+#
+# Author(s): Don Korte
+# Module:  device_buttons.py is the shared button service for the MiniTFT
+#   joystick and A/B buttons.  Reading tft.buttons is a full seesaw I2C
+#   transaction on the same bus as the line sensor, so instead of each
+#   mode polling it (and spinning until release), this samples the seesaw
+#   at a low fixed rate, debounces, and queues events that modes consume
+#   without any I2C traffic.
+#
+#   A seesaw GPIO read is a write, an ~8 mS wait while the seesaw fetches
+#   the pins, then a read; through tft.buttons that wait is a blocking
+#   sleep.  Given the Device_I2CBus, each sample() instead collects the
+#   answer to the request the previous sample() sent, then sends the next
+#   request, so it never waits (sample_budget says how long a sample
+#   takes, for the runtime job's budget).
+#
+#   events are (button, kind) tuples where button is one of BUTTON_NAMES
+#   and kind is one of:
+#     "PRESS"   - button went down
+#     "RELEASE" - button came back up
+#     "LONG"    - button has been held for long_press_time (sent once)
+#     "REPEAT"  - sent every repeat_period while held past repeat_delay
+#   get_press() only returns auto-repeats for the buttons the caller asks
+#   for (eg. menu value stepping), so a button still held from the last
+#   mode can't select or exit anything by repeating.
+#
+#   Press and repeat times are kept as integer mS since the service was
+#   made (a float32 monotonic() value is too coarse for the repeat timing
+#   after a few hours of uptime).
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import device_clock
+from array import array
+
+# note these are the field names of the minitft_featherwing buttons tuple
+BUTTON_NAMES = ("up", "down", "left", "right", "select", "a", "b")
+NUM_BUTTONS = len(BUTTON_NAMES)
+
+# seesaw GPIO pin of each of BUTTON_NAMES on the MiniTFT featherwing
+SEESAW_BUTTON_PINS = (2, 4, 3, 7, 11, 10, 9)
+SEESAW_ADDRESS = 0x5E
+SEESAW_READ_GPIO = b"\x01\x04"  # GPIO base, bulk read register
+SEESAW_READ_DELAY = 0.008  # seconds the seesaw needs before the read
+
+
+class Device_Buttons:
+    def __init__(
+        self,
+        tft_device,
+        sample_period=0.05,
+        debounce_samples=2,
+        long_press_time=0.8,
+        repeat_delay=0.5,
+        repeat_period=0.15,
+        queue_size=16,
+        i2c_bus=None,
+    ):
+        self.this_tft = tft_device
+        # split seesaw transactions (see sample) when the bus is given;
+        # otherwise tft.buttons, which blocks for SEESAW_READ_DELAY
+        self.seesaw = None
+        self.sample_budget = SEESAW_READ_DELAY + 0.002
+        if i2c_bus is not None:
+            self.seesaw = i2c_bus.get_device(SEESAW_ADDRESS)
+            if self.seesaw is None:
+                self.seesaw = i2c_bus.add_device("seesaw", SEESAW_ADDRESS)
+            self.sample_budget = 0.002
+        self.gpio = bytearray(4)
+        self.raw = bytearray(NUM_BUTTONS)
+        self.request_time = None  # when the outstanding request was sent
+        self.sample_period = sample_period  # 0.05 = 20 Hz
+        self.debounce_samples = debounce_samples  # samples that must agree
+        self.long_press_time = long_press_time
+        self.repeat_delay = repeat_delay
+        self.repeat_period = repeat_period
+        self.long_press_ms = int(long_press_time * 1000)
+        self.repeat_delay_ms = int(repeat_delay * 1000)
+        self.repeat_period_ms = int(repeat_period * 1000)
+        self.time_base = device_clock.monotonic()  # mS times count from here
+
+        # per-button debounce state
+        self.pressed = bytearray(NUM_BUTTONS)  # debounced state
+        self.candidate = bytearray(NUM_BUTTONS)  # raw state being confirmed
+        self.candidate_count = bytearray(NUM_BUTTONS)
+        self.long_sent = bytearray(NUM_BUTTONS)
+        self.press_time = array("l", [0] * NUM_BUTTONS)  # mS
+        self.next_repeat = array("l", [0] * NUM_BUTTONS)  # mS
+
+        # fixed size event queue (ring); oldest event is dropped if full
+        self.queue_size = queue_size
+        self.queue = [None] * queue_size
+        self.queue_head = 0
+        self.queue_count = 0
+
+        self.next_sample_time = 0
+        self.num_samples = 0  # number of seesaw reads (I2C transactions)
+        self.num_dropped = 0  # events lost because queue was full
+        self.num_failed = 0  # seesaw reads that failed
+
+    # samples the seesaw only if a sample is due; safe to call every tick.
+    # returns True if a sample (I2C transaction) was actually taken
+    def poll(self):
+        if device_clock.monotonic() < self.next_sample_time:
+            return False
+        self.sample()
+        return True
+
+    # reads the seesaw once and turns state changes into events; the
+    # runtime calls this as a background job every sample_period
+    def sample(self):
+        now = device_clock.monotonic()
+        self.next_sample_time = now + self.sample_period
+        if self.seesaw is not None:
+            got_sample = self._collect_and_request(now)
+        else:
+            got_sample = self._read_tft()
+        if not got_sample:
+            return
+        self.num_samples += 1
+        now_ms = int((now - self.time_base) * 1000)
+
+        for i in range(NUM_BUTTONS):
+            raw = self.raw[i]
+
+            if raw != self.candidate[i]:
+                self.candidate[i] = raw
+                self.candidate_count[i] = 1
+            elif self.candidate_count[i] < self.debounce_samples:
+                self.candidate_count[i] += 1
+
+            if (
+                self.candidate_count[i] >= self.debounce_samples
+                and raw != self.pressed[i]
+            ):
+                self.pressed[i] = raw
+                if raw:
+                    self.press_time[i] = now_ms
+                    self.next_repeat[i] = now_ms + self.repeat_delay_ms
+                    self.long_sent[i] = 0
+                    self._queue_event(BUTTON_NAMES[i], "PRESS")
+                else:
+                    self._queue_event(BUTTON_NAMES[i], "RELEASE")
+
+            elif self.pressed[i]:
+                if (not self.long_sent[i]) and (
+                    now_ms - self.press_time[i] >= self.long_press_ms
+                ):
+                    self.long_sent[i] = 1
+                    self._queue_event(BUTTON_NAMES[i], "LONG")
+                if now_ms >= self.next_repeat[i]:
+                    self.next_repeat[i] = now_ms + self.repeat_period_ms
+                    self._queue_event(BUTTON_NAMES[i], "REPEAT")
+
+    # blocking read through the featherwing driver
+    def _read_tft(self):
+        try:
+            buttons = self.this_tft.buttons
+        except OSError:
+            # the bus manager refused or failed the read (see
+            # device_i2cbus.py); keep the last state til the next sample
+            self.num_failed += 1
+            return False
+        for i in range(NUM_BUTTONS):
+            self.raw[i] = 1 if getattr(buttons, BUTTON_NAMES[i]) else 0
+        return True
+
+    # reads the answer to the last request (if it has had time to be
+    # ready) into raw, then sends the next request; returns True if raw
+    # was updated.  a failed transaction just costs this sample
+    def _collect_and_request(self, now):
+        got_sample = False
+        if (self.request_time is not None) and (
+            now - self.request_time >= SEESAW_READ_DELAY
+        ):
+            self.request_time = None
+            if self.seesaw.readinto(self.gpio):
+                bits = int.from_bytes(self.gpio, "big")
+                for i in range(NUM_BUTTONS):
+                    # buttons are active low
+                    self.raw[i] = 0 if bits & (1 << SEESAW_BUTTON_PINS[i]) else 1
+                got_sample = True
+            else:
+                self.num_failed += 1
+        if self.request_time is None:
+            if self.seesaw.write(SEESAW_READ_GPIO):
+                self.request_time = now
+            else:
+                self.num_failed += 1
+        return got_sample
+
+    def _queue_event(self, button, kind):
+        if self.queue_count >= self.queue_size:
+            # drop oldest
+            self.queue_head = (self.queue_head + 1) % self.queue_size
+            self.queue_count -= 1
+            self.num_dropped += 1
+        tail = (self.queue_head + self.queue_count) % self.queue_size
+        self.queue[tail] = (button, kind)
+        self.queue_count += 1
+
+    # returns oldest queued (button, kind) event, or None if there are none
+    def get_event(self):
+        if self.queue_count == 0:
+            return None
+        event = self.queue[self.queue_head]
+        self.queue[self.queue_head] = None
+        self.queue_head = (self.queue_head + 1) % self.queue_size
+        self.queue_count -= 1
+        return event
+
+    # returns the name of the next button that was pressed, or
+    # auto-repeated if it is one of repeat_buttons (eg. the arrows that
+    # step a value), discarding any other events ahead of it; None if
+    # nothing was pressed
+    def get_press(self, repeat_buttons=()):
+        while self.queue_count > 0:
+            button, kind = self.get_event()
+            if kind == "PRESS":
+                return button
+            if (kind == "REPEAT") and (button in repeat_buttons):
+                return button
+        return None
+
+    # returns True if the named button was pressed since the last check;
+    # note this consumes (discards) all other queued events too
+    def was_pressed(self, button):
+        found = False
+        while self.queue_count > 0:
+            this_button, kind = self.get_event()
+            if (this_button == button) and (kind == "PRESS"):
+                found = True
+        return found
+
+    # discards queued events, eg. so a press that ended the last mode isn't
+    # seen by the next one
+    def clear_events(self):
+        while self.queue_count > 0:
+            self.get_event()
+
+    def is_pressed(self, button):
+        return self.pressed[BUTTON_NAMES.index(button)] == 1
+
+    def get_num_samples(self):
+        return self.num_samples
+
+    def get_num_failed(self):
+        return self.num_failed
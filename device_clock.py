@@ -0,0 +1,88 @@
+"""
+# Controller for Line-Following Robot
+# This runs on an Adafruit Feather M4, with a MiniTFT board.
+# It drives a TB6612 to control 2 DC Motors (in blue servo case)
+# and talks over I2C to an ItsyBitsy that interfaces a Pololu
+# line following sensor
+#
+# Author(s): Don Korte
+# Module:  device_clock.py is the clock service every module uses in place
+#   of time.monotonic() and time.sleep().  Call device_clock.monotonic()
+#   and device_clock.sleep() (always through the module, never imported
+#   by name, so a switched clock is seen everywhere).
+#
+#   The real clock is installed by default.  use_clock(Virtual_Clock())
+#   swaps in a virtual clock whose sleep() just moves time forward, so
+#   blocking waits (sensor read delay, bus recovery clocks)
+#   cost nothing yet keep their exact timing; on the host,
+#   linefollower_host/virtual_time.py runs the asyncio side (mode
+#   countdowns, control tick deadlines, runtime jobs) on the same clock.
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import time
+
+# the installed clock's functions; rebound by use_clock()
+monotonic = time.monotonic
+sleep = time.sleep
+
+# name of the installed clock ("real" or "virtual")
+clock_name = "real"
+
+
+class Virtual_Clock:
+    def __init__(self, start=0.0):
+        self.now = start
+        self.total_slept = 0.0  # seconds skipped by sleep()
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+            self.total_slept += seconds
+
+    # moves time forward (eg. from an event loop jumping to its next timer)
+    def advance(self, seconds):
+        if seconds > 0:
+            self.now += seconds
+
+
+# installs clock (anything with monotonic() and sleep()); None puts the
+# real clock back
+def use_clock(clock=None):
+    global monotonic, sleep, clock_name
+    if clock is None:
+        monotonic = time.monotonic
+        sleep = time.sleep
+        clock_name = "real"
+    else:
+        monotonic = clock.monotonic
+        sleep = clock.sleep
+        clock_name = "virtual"
+    return clock
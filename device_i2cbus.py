@@ -0,0 +1,455 @@
+"""
+# Controller for Line-Following Robot
+# This runs on an Adafruit Feather M4, with a MiniTFT board.
+# It drives a TB6612 to control 2 DC Motors (in blue servo case)
+# and talks over I2C to an ItsyBitsy that interfaces a Pololu
+# line following sensor
+#
+# Author(s): Don Korte
+# Module:  device_i2cbus.py owns the I2C bus (bitbangio.I2C on SCL/SDA)
+#   that the line sensor and the MiniTFT's seesaw (buttons) share, and
+#   keeps what a transaction can cost bounded:
+#     - the bus is bit-banged so that its clock stretch limit
+#       (bus_timeout) is enforced: bitbangio gives up on a device that
+#       holds SCL low for longer (TimeoutError) instead of waiting on it.
+#       busio.I2C takes a timeout too, but ignores it on the SAMD51, so a
+#       stalled transaction there lasts as long as the device stalls.
+#       a bit-banged attempt lasts its bytes' time on the bus plus at
+#       most bus_timeout per clock the device stretches
+#     - the bus lock is tried a few times, never spun on, and always
+#       released (even when the transaction raises)
+#     - each device has a priority: the control loop's (the line sensor)
+#       always goes ahead; background ones (the seesaw) are refused
+#       unless they fit in the slack before the next control tick
+#     - each device has a timeout; a transaction that fails (NACK, bus
+#       timeout) or turns out to have taken longer than that (checked
+#       once it returns) is a failure, and is retried only if the retry
+#       still fits in the slack
+#     - a device that keeps failing backs off (its requests are refused
+#       at once, for backoff_min doubling up to backoff_max), and after
+#       recover_after failures in a row the bus is recovered (9 clocks on
+#       SCL and a STOP, then a fresh bitbangio.I2C) by service(), which the
+#       runtime runs as a background job
+#   Transactions return True or False rather than raising, so a failure
+#   costs the control loop a stale reading and, if the bus stalls, about
+#   a bus_timeout per attempt (one attempt, plus one retry when the slack
+#   allows).
+#   Each device keeps latency and error counters (get_stats,
+#   print_stats).
+#
+#   Drivers that want a busio.I2C (adafruit_featherwing's seesaw) get
+#   get_proxy(): a busio.I2C lookalike whose transactions go through the
+#   bus manager (and raise OSError when they fail, as busio's would).
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import device_clock
+import bitbangio
+import board
+import digitalio
+
+PRIORITY_CONTROL = 0  # control loop: never refused for lack of slack
+PRIORITY_BACKGROUND = 1  # only run when it fits before the next tick
+
+# errno values for failed transactions (as CircuitPython raises them)
+EIO = 5  # failed, no more detail
+EBUSY = 16  # refused: backing off, recovering, no slack, or lock held
+ETIMEDOUT = 110  # bus timeout, or took longer than the device's timeout
+
+NO_CONTROL_SLACK = 1.0  # seconds of slack when no slack_function is set
+
+
+class Bus_Device:
+    # one device on the bus; its transactions return True if they worked
+    def __init__(self, bus, name, address, priority, timeout):
+        self.bus = bus
+        self.name = name
+        self.address = address
+        self.priority = priority
+        self.timeout = timeout  # seconds a transaction may take
+        self.backoff = 0  # seconds refused after the last failure
+        self.backoff_until = 0
+        self.consecutive_failures = 0
+        self.last_ok_time = device_clock.monotonic()
+        self.last_error = 0  # errno of the last failure
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.num_transactions = 0  # attempts that got onto the bus
+        self.num_errors = 0  # attempts that failed, timeouts included
+        self.num_timeouts = 0  # bus timeouts, or took longer than timeout
+        self.num_retries = 0
+        self.num_refused = 0  # requests not attempted (see transact)
+        self.total_latency = 0
+        self.last_latency = 0
+        self.max_latency = 0
+
+    def write(self, buffer):
+        return self.bus.transact(self, buffer, None)
+
+    def readinto(self, buffer):
+        return self.bus.transact(self, None, buffer)
+
+    # buffer_out then buffer_in in one transaction (repeated start)
+    def write_then_readinto(self, buffer_out, buffer_in):
+        return self.bus.transact(self, buffer_out, buffer_in)
+
+    # seconds since the last transaction that worked
+    def get_time_since_ok(self):
+        return device_clock.monotonic() - self.last_ok_time
+
+    def get_mean_latency(self):
+        if self.num_transactions == 0:
+            return 0
+        return self.total_latency / self.num_transactions
+
+
+class Device_I2CBus:
+    def __init__(
+        self,
+        max_retries=1,
+        retry_margin=0.0005,
+        backoff_min=0.01,
+        backoff_max=1.0,
+        recover_after=3,
+        recovery_interval=0.1,
+        lock_tries=3,
+        lock_wait=0.00005,
+        bus_timeout=0.001,
+    ):
+        # seconds a device may stretch the clock before bitbangio gives
+        # up on the transaction; well under the devices' timeouts
+        self.bus_timeout = bus_timeout
+        self.i2c = self._new_bus()
+        self.devices = []
+        self.slack_function = self._no_control_slack
+        self.max_retries = max_retries
+        # a retry needs the device's timeout plus this much slack
+        self.retry_margin = retry_margin
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.recover_after = recover_after  # failures in a row, any device
+        self.recovery_interval = recovery_interval  # least time between
+        self.lock_tries = lock_tries
+        self.lock_wait = lock_wait
+        self.half_clock = 0.000005  # recovery clocks at ~100 kHz
+        self.failures_in_row = 0
+        self.recovery_pending = False
+        self.next_recovery_at = 0
+        self.num_recoveries = 0
+        self.num_lock_failures = 0
+        self.proxy = None
+
+    # bitbangio.I2C takes its clock stretch limit in microseconds; 100 kHz
+    # as board.I2C() ran the bus
+    def _new_bus(self):
+        return bitbangio.I2C(
+            board.SCL,
+            board.SDA,
+            frequency=100000,
+            timeout=int(self.bus_timeout * 1000000),
+        )
+
+    def _no_control_slack(self):
+        return NO_CONTROL_SLACK
+
+    # slack_function() returns seconds until the next control tick (eg.
+    # runtime.slack); until one is set there is always enough slack
+    def set_slack_function(self, slack_function):
+        self.slack_function = slack_function
+
+    # timeout is seconds a transaction may take; a background device's
+    # must also fit in the slack its runtime job gets (budget)
+    def add_device(
+        self, name, address, priority=PRIORITY_BACKGROUND, timeout=0.002
+    ):
+        device = Bus_Device(self, name, address, priority, timeout)
+        self.devices.append(device)
+        return device
+
+    def get_device(self, address):
+        for device in self.devices:
+            if device.address == address:
+                return device
+        return None
+
+    # busio.I2C lookalike for drivers (see I2C_Proxy)
+    def get_proxy(self):
+        if self.proxy is None:
+            self.proxy = I2C_Proxy(self)
+        return self.proxy
+
+    # one request from device: write buffer_out and/or read buffer_in
+    # (either may be None); returns True if it worked.  never raises;
+    # bitbangio cuts an attempt off when the device stretches the clock
+    # past bus_timeout (the check below only runs once the attempt has
+    # returned, so it can't shorten it), and a retry is only made while
+    # the slack still holds the device's timeout plus retry_margin.  an
+    # attempt that returns but took longer than the device's timeout is
+    # a failure too (its result is too late to trust)
+    def transact(self, device, buffer_out, buffer_in):
+        if (
+            self.recovery_pending
+            or (device_clock.monotonic() < device.backoff_until)
+            or (
+                device.priority != PRIORITY_CONTROL
+                and self.slack_function() < device.timeout
+            )
+        ):
+            device.num_refused += 1
+            device.last_error = EBUSY
+            return False
+
+        attempt = 0
+        while not self._attempt(device, buffer_out, buffer_in):
+            attempt += 1
+            if (attempt > self.max_retries) or (
+                self.slack_function() < device.timeout + self.retry_margin
+            ):
+                self._failed(device)
+                return False
+            device.num_retries += 1
+
+        device.consecutive_failures = 0
+        device.backoff = 0
+        device.last_ok_time = device_clock.monotonic()
+        self.failures_in_row = 0
+        return True
+
+    # one try at the transaction, timed; the lock is always released
+    def _attempt(self, device, buffer_out, buffer_in):
+        if not self._lock():
+            self.num_lock_failures += 1
+            device.num_refused += 1
+            device.last_error = EBUSY
+            return False
+        start = device_clock.monotonic()
+        ok = True
+        try:
+            if buffer_in is None:
+                self.i2c.writeto(device.address, buffer_out)
+            elif buffer_out is None:
+                self.i2c.readfrom_into(device.address, buffer_in)
+            else:
+                self.i2c.writeto_then_readfrom(device.address, buffer_out, buffer_in)
+        except TimeoutError:
+            # bitbangio's clock stretch limit ("Clock stretch too long")
+            ok = False
+            device.last_error = ETIMEDOUT
+        except OSError as e:
+            ok = False
+            device.last_error = e.errno if e.errno else EIO
+        finally:
+            self.i2c.unlock()
+        latency = device_clock.monotonic() - start
+        device.num_transactions += 1
+        device.total_latency += latency
+        device.last_latency = latency
+        if latency > device.max_latency:
+            device.max_latency = latency
+        if ok and (latency > device.timeout):
+            # finished, but too late for its result to be trusted
+            ok = False
+            device.last_error = ETIMEDOUT
+        if not ok:
+            device.num_errors += 1
+            if device.last_error == ETIMEDOUT:
+                device.num_timeouts += 1
+        return ok
+
+    # the bus lock is only held by another user if one forgot to release
+    # it, so it isn't worth waiting long for
+    def _lock(self):
+        for _ in range(self.lock_tries):
+            if self.i2c.try_lock():
+                return True
+            device_clock.sleep(self.lock_wait)
+        return False
+
+    def _failed(self, device):
+        device.consecutive_failures += 1
+        if device.consecutive_failures >= 2:
+            # a single failure is retried next request; after that, back off
+            if device.backoff == 0:
+                device.backoff = self.backoff_min
+            else:
+                device.backoff = min(2 * device.backoff, self.backoff_max)
+            device.backoff_until = device_clock.monotonic() + device.backoff
+        self.failures_in_row += 1
+        if (self.failures_in_row >= self.recover_after) and (
+            device_clock.monotonic() >= self.next_recovery_at
+        ):
+            self.recovery_pending = True
+
+    # addresses that answer (empty if the bus couldn't be locked)
+    def scan(self):
+        if not self._lock():
+            return []
+        try:
+            return self.i2c.scan()
+        finally:
+            self.i2c.unlock()
+
+    # runtime job: recovers the bus if failures asked for it
+    def service(self):
+        if self.recovery_pending:
+            self.recover()
+
+    # frees a bus held by a device stuck part way through a byte: clocks
+    # SCL 9 times (with SDA released) so it can finish, sends a STOP, and
+    # starts a new bitbangio.I2C
+    def recover(self):
+        self.recovery_pending = False
+        self.failures_in_row = 0
+        self.next_recovery_at = device_clock.monotonic() + self.recovery_interval
+        self.num_recoveries += 1
+        self.i2c.deinit()
+        scl = digitalio.DigitalInOut(board.SCL)
+        sda = digitalio.DigitalInOut(board.SDA)
+        sda.switch_to_input()
+        # lines are driven low or released (pulled up), never driven high
+        for _ in range(9):
+            scl.switch_to_output(value=False)
+            device_clock.sleep(self.half_clock)
+            scl.switch_to_input()
+            device_clock.sleep(self.half_clock)
+        # STOP: SDA rises while SCL is high
+        sda.switch_to_output(value=False)
+        device_clock.sleep(self.half_clock)
+        sda.switch_to_input()
+        device_clock.sleep(self.half_clock)
+        scl.deinit()
+        sda.deinit()
+        self.i2c = self._new_bus()
+        # give every device a try on the fresh bus straight away (a device
+        # that still fails backs off longer, from where it was)
+        for device in self.devices:
+            device.backoff_until = 0
+        print("I2C bus recovered ({})".format(self.num_recoveries))
+
+    def reset_stats(self):
+        self.num_recoveries = 0
+        self.num_lock_failures = 0
+        for device in self.devices:
+            device.reset_stats()
+
+    # per device counters, as {name: {counter: value}}; latencies in
+    # seconds
+    def get_stats(self):
+        stats = {}
+        for device in self.devices:
+            stats[device.name] = {
+                "transactions": device.num_transactions,
+                "errors": device.num_errors,
+                "timeouts": device.num_timeouts,
+                "retries": device.num_retries,
+                "refused": device.num_refused,
+                "mean_latency": device.get_mean_latency(),
+                "max_latency": device.max_latency,
+            }
+        return stats
+
+    def print_stats(self):
+        for device in self.devices:
+            print(
+                "i2c {}: {} xfers, {} errors ({} timeouts), {} retries, "
+                "{} refused, latency mean {:.3f} max {:.3f} mS".format(
+                    device.name,
+                    device.num_transactions,
+                    device.num_errors,
+                    device.num_timeouts,
+                    device.num_retries,
+                    device.num_refused,
+                    1000 * device.get_mean_latency(),
+                    1000 * device.max_latency,
+                )
+            )
+        print("i2c recoveries:", self.num_recoveries)
+
+
+class I2C_Proxy:
+    # busio.I2C lookalike; each transaction goes through the bus manager
+    # as its address's device (added as a background device if it wasn't
+    # added already), and raises OSError if it doesn't work.  locking is
+    # the bus manager's job, so try_lock() always succeeds
+    def __init__(self, bus):
+        self.bus = bus
+
+    def try_lock(self):
+        return True
+
+    def unlock(self):
+        pass
+
+    def _device(self, address):
+        device = self.bus.get_device(address)
+        if device is None:
+            device = self.bus.add_device("0x{:02x}".format(address), address)
+        return device
+
+    def _check(self, device, ok):
+        if not ok:
+            raise OSError(device.last_error, "I2C transaction failed")
+
+    def writeto(self, address, buffer, *, start=0, end=None, stop=True):
+        if end is None:
+            end = len(buffer)
+        device = self._device(address)
+        self._check(device, device.write(memoryview(buffer)[start:end]))
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        if end is None:
+            end = len(buffer)
+        device = self._device(address)
+        self._check(device, device.readinto(memoryview(buffer)[start:end]))
+
+    def writeto_then_readfrom(
+        self,
+        address,
+        buffer_out,
+        buffer_in,
+        *,
+        out_start=0,
+        out_end=None,
+        in_start=0,
+        in_end=None
+    ):
+        if out_end is None:
+            out_end = len(buffer_out)
+        if in_end is None:
+            in_end = len(buffer_in)
+        device = self._device(address)
+        self._check(
+            device,
+            device.write_then_readinto(
+                memoryview(buffer_out)[out_start:out_end],
+                memoryview(buffer_in)[in_start:in_end],
+            ),
+        )
+
+    def scan(self):
+        return self.bus.scan()
@@ -13,6 +13,48 @@
 #   converting to CircuitPython 6.0 will need to remove the "stop=False"
 #   kwarg from the i2c.writeto call and start using write_then_read
 #
+#   The control loop's transactions (get_quickposition,
+#   start_quickposition_check, cycle_quickposition) allocate nothing: the
+#   command bytes and the register buffer are made once in __init__ and
+#   reused, and partial reads go through preallocated memoryview slices.
+#   set_alloc_counting(True) adds up gc.mem_alloc() over each cycle so
+#   this can be checked on the board (get_alloc_count() bytes stays 0).
+#
+#   The ItsyBitsy firmware the robot ships with is protocol 0: registers
+#   4 and 6 aren't defined by it, so they aren't read unless the sensor
+#   is declared newer (max_protocol; the host's sensor emulator has
+#   protocols 1 to 3, see linefollower_host/linesense_emulator.py).
+#
+#   Sensor firmware with protocol 1 (register 4) keeps a status byte in
+#   register 6: bit 7 set when no read is in progress, bits 0-6 a count
+#   of completed reads.  With it a stale result (read before the
+#   conversion finished) is recognized: get_quickposition keeps the last
+#   position and leaves the conversion running, and the next call reads
+#   again (a poll) rather than starting a new read, up to the advertised
+#   read_delay after the read was started; nothing waits in between.
+#   is_fresh() says whether the last call got a fresh result.  It also
+#   lets the wait before reading adapt to how long reads really take
+#   (read_wait, see _adapt_wait) rather than always being the worst case
+#   read_delay.  Protocol 0 gets the fixed wait.
+#
+#   Protocol 2 adds a register pointer (see has_pointer): the control
+#   loop reads only position and status (2 bytes, not 7), and
+#   read_register() / the read_xxx accessors fetch single registers, or
+#   read_all_registers() the whole block, for calibration and
+#   diagnostics.
+#
+#   Protocol 3 adds the raw frame after the block: register 7 the number
+#   of channels, then each channel's calibrated value.  With
+#   set_estimator("Centroid" or "Quadratic") the control loop reads it
+#   along with the position, in the same transaction, and the position
+#   comes from Line_Estimator instead: finer (get_fine_position), with a
+#   line-lost confidence (get_confidence, is_line_lost) and line width.
+#
+#   All transactions go through the Device_I2CBus it is given (see
+#   device_i2cbus.py) and never raise: a read that fails keeps the last
+#   position, flagged stale (is_fresh() False), and is_link_down() says
+#   when the sensor has been unreachable for link_timeout.
+#
 # github: https://github.com/dnkorte/linefollower_controller
 #
 # Reference: https://circuitpython.readthedocs.io/projects/featherwing/en/latest/_modules/adafruit_featherwing/minitft_featherwing.html
@@ -41,55 +83,266 @@
 #
 """
 
-import time
-import board
+import device_clock
+from device_i2cbus import Device_I2CBus, PRIORITY_CONTROL
+from line_estimator import Line_Estimator, FINE_SCALE
+
+try:
+    from gc import mem_alloc  # CircuitPython / MicroPython only
+except ImportError:
+    mem_alloc = None
+
+# commands understood by the line sensor processor
+CMD_CALIBRATE = 0x01
+CMD_READ = 0x02
+CMD_SET_POINTER = 0x80  # | register number (protocol 2 and later)
+
+# register numbers (offsets in the 7 byte register block)
+REG_SENSOR_TYPE = 0
+REG_READ_DELAY = 1
+REG_MODULE_ID = 2
+REG_CALIBRATED = 3
+REG_PROTOCOL = 4
+REG_POSITION = 5
+REG_STATUS = 6
+NUM_REGISTERS = 7
+# raw frame (protocol 3): number of channels, then their calibrated values
+# (0 white => 255 black), from the same read as the position
+REG_NUM_CHANNELS = 7
+REG_CHANNELS = 8
+MAX_CHANNELS = 16
+
+# newest sensor protocol this module understands
+LATEST_PROTOCOL = 3
+
+# status register bits (protocol 1 and later)
+STATUS_READY = 0x80  # no read (conversion) in progress
+STATUS_SEQUENCE = 0x7F  # number of completed reads, mod 128
+
 
 class Device_LineSense:
-    def __init__(self, screen_dashboard):
+    # combined: get the result of the last read and start the next one in a
+    # single writeto_then_readfrom transaction (see cycle_quickposition);
+    # relies on the sensor processor answering with its previous result
+    # while the new conversion is still running
+    # adaptive: learn how long reads really take (needs protocol 1) and
+    # wait only that long instead of the advertised read_delay
+    # i2c_bus: the Device_I2CBus shared with the other I2C devices (one of
+    # its own is made if not given)
+    # max_protocol: the newest protocol the sensor firmware may have; 0
+    # (the shipped firmware) means the protocol register isn't trusted
+    def __init__(
+        self,
+        screen_dashboard,
+        combined=False,
+        adaptive=True,
+        i2c_bus=None,
+        max_protocol=0,
+    ):
 
         self.i2c_address = 0x32
-        self.i2c = board.I2C()
+        if i2c_bus is None:
+            i2c_bus = Device_I2CBus()
+        self.i2c_bus = i2c_bus
+        # the control loop's reads must never wait behind anything else
+        self.bus_device = i2c_bus.add_device(
+            "linesense", self.i2c_address, PRIORITY_CONTROL, timeout=0.003
+        )
+        # failed transactions; and how long without a working one before
+        # the sensor counts as lost (see is_link_down)
+        self.num_failed = 0
+        self.link_timeout = 0.1
         self.calibrated = False
         self.position = 125
-        self.device_registers = self._read_7()
-        self.sensor_type = self.device_registers[0]
-        self.read_delay = self.device_registers[1]
-        self.module_id = self.device_registers[2]
+        self.combined = combined
+
+        # every transaction uses these preallocated buffers, so the control
+        # loop's reads allocate nothing (no bytes() / bytearray() per call)
+        self.cmd_calibrate = bytes((CMD_CALIBRATE,))
+        self.cmd_read = bytes((CMD_READ,))
+        self.device_registers = bytearray(REG_CHANNELS + MAX_CHANNELS)
+        registers = memoryview(self.device_registers)
+        # the 7 register block every protocol has
+        self.register_block = registers[0:NUM_REGISTERS]
+        # views of a single register, and of registers 0 => n, for reading
+        # one register with and without the register pointer
+        self.register_views = [
+            registers[r : r + 1] for r in range(len(self.device_registers))
+        ]
+        self.register_prefixes = [registers[0 : r + 1] for r in range(NUM_REGISTERS)]
+        self.cmd_pointer = bytearray(1)  # set to CMD_SET_POINTER | register
+        self.cmd_pointer_start = bytes((CMD_SET_POINTER,))
+        self.cmd_pointer_position = bytes((CMD_SET_POINTER | REG_POSITION,))
+        # what each read in the control loop gets: the whole block, or
+        # with the register pointer just position and status (and the raw
+        # frame, when estimating the position from it)
+        self.hot_registers = self.register_block
+
+        # allocation counter (CircuitPython only): while count_allocs is
+        # True, heap bytes allocated between the start of get_quickposition
+        # (or cycle_quickposition) and the end of the following
+        # start_quickposition_check are added up here
+        self.count_allocs = False
+        self.alloc_bytes = 0
+        self.alloc_cycles = 0
+        self.alloc_start = 0
+
+        self._read_registers()
+        if (max_protocol >= 2) and (self.device_registers[REG_MODULE_ID] != 83):
+            # may be a protocol 2 sensor still pointed at the position
+            # register by an earlier session (it wasn't reset); point it
+            # back at register 0 and try again
+            self._write_cmd(self.cmd_pointer_start)
+            self._read_registers()
+        self.sensor_type = self.device_registers[REG_SENSOR_TYPE]
+        self.read_delay = self.device_registers[REG_READ_DELAY]
+        self.module_id = self.device_registers[REG_MODULE_ID]
         if self.module_id != 83:
             raise RuntimeError("Line Sensor is not the expected module")
+        self.protocol = 0
+        if max_protocol > 0:
+            self.protocol = min(self.device_registers[REG_PROTOCOL], max_protocol)
+        # register pointer (protocol 2): CMD_SET_POINTER | n makes reads
+        # start at register n (0 after the sensor resets), and it stays
+        # there; it is kept at the position register so each tick reads 2
+        # bytes instead of 7, and moved only briefly by read_register()
+        self.has_pointer = self.protocol >= 2
+        if self.has_pointer:
+            self.hot_registers = registers[REG_POSITION : REG_STATUS + 1]
+            self._write_cmd(self.cmd_pointer_position)
+
+        # raw frame (protocol 3): see set_estimator
+        self.num_channels = 0
+        if self.protocol >= 3:
+            self.num_channels = min(self.read_register(REG_NUM_CHANNELS), MAX_CHANNELS)
+        self.channel_values = registers[REG_CHANNELS : REG_CHANNELS + self.num_channels]
+        self.line_estimator = Line_Estimator(max(self.num_channels, 2))
+        self.estimating = False
         self.screen_dashboard = screen_dashboard
         self.read_in_process = False
         self.read_will_be_ready_at = 0
+        self.read_started_at = 0
+
+        # freshness (protocol 1): a result is fresh when the status says no
+        # read is in progress and its sequence number has moved on since
+        # the last fresh one; otherwise the next get_quickposition reads
+        # again (polls), for up to read_delay after the read was started
+        self.has_status = self.protocol >= 1
+        self.sequence = 0
+        if self.has_status:
+            self.sequence = self.device_registers[REG_STATUS] & STATUS_SEQUENCE
+        self.fresh = True  # False if the last result was a stale one
+        self.polling = False  # True while a stale read awaits a re-read
+        self.num_stale = 0  # stale results returned (polling timed out)
+        self.num_polls = 0  # extra reads polling for a fresh result
+        self.poll_interval = 0.0002  # least seconds before a poll
+
+        # adaptive wait: read_wait tracks the wait_quantile point of the
+        # real read times (stochastic quantile estimate: up by
+        # wait_quantile * wait_step when a read made at read_wait was
+        # stale, down by the rest of wait_step when it was fresh), within
+        # wait_min and the advertised read_delay
+        self.adaptive = adaptive and self.has_status
+        self.wait_quantile = 0.95
+        self.wait_step = 0.0001
+        self.wait_min = 0.0002
+        # reads up to this late still count as made at read_wait (the
+        # control loop's sleep doesn't wake exactly on time)
+        self.wait_slack = 0.0005
+        self.read_wait = 0.001 * self.read_delay
 
         print("sensor type:", self.sensor_type)
         print("read_delay:", self.read_delay)
         print("module id:", self.module_id)
+        print("protocol:", self.protocol)
 
-    def _write_cmd(self, command):
-        while not self.i2c.try_lock():
-            pass
-        self.i2c.writeto(self.i2c_address, bytes([command]), stop=True)
-        self.i2c.unlock()
-        return
+    # every transaction goes through the bus manager, and returns True if
+    # it worked; a failed one leaves device_registers as they were
+    def _write_cmd(self, command_buffer):
+        if self.bus_device.write(command_buffer):
+            return True
+        self.num_failed += 1
+        return False
 
-    def _read_7(self):
-        while not self.i2c.try_lock():
-            pass
+    # reads registers into device_registers (the 7 register block, or the
+    # part of device_registers that buffer, a preallocated view, covers)
+    def _read_registers(self, buffer=None):
+        if buffer is None:
+            buffer = self.register_block
         # note the size of the buffer tells it how many bytes to read
-        result = bytearray(7)
-        self.i2c.readfrom_into(self.i2c_address, result)
-        self.i2c.unlock()
-        return result
+        if self.bus_device.readinto(buffer):
+            return True
+        self.num_failed += 1
+        return False
+
+    # sends command, then reads into buffer (a view of device_registers),
+    # in one transaction
+    def _write_then_read(self, command_buffer, buffer):
+        if self.bus_device.write_then_readinto(command_buffer, buffer):
+            return True
+        self.num_failed += 1
+        return False
+
+    # reads one register from the sensor into device_registers, and
+    # returns it
+    def read_register(self, register):
+        if self.has_pointer:
+            self.cmd_pointer[0] = CMD_SET_POINTER | register
+            self._write_then_read(self.cmd_pointer, self.register_views[register])
+            # back to where the control loop reads
+            self._write_cmd(self.cmd_pointer_position)
+        else:
+            self._read_registers(self.register_prefixes[register])
+        return self.device_registers[register]
+
+    # reads the whole register block (for diagnostics); returns
+    # device_registers
+    def read_all_registers(self):
+        if self.has_pointer:
+            self._write_then_read(self.cmd_pointer_start, self.register_block)
+            self._write_cmd(self.cmd_pointer_position)
+        else:
+            self._read_registers()
+        return self.register_block
+
+    # reads the raw frame of the last completed read, in one transaction
+    # (for diagnostics; protocol 3 only); returns the channel values
+    def read_raw_frame(self):
+        if self.num_channels:
+            self.cmd_pointer[0] = CMD_SET_POINTER | REG_CHANNELS
+            self._write_then_read(self.cmd_pointer, self.channel_values)
+            self._write_cmd(self.cmd_pointer_position)
+        return self.channel_values
+
+    def read_sensor_type(self):
+        return self.read_register(REG_SENSOR_TYPE)
+
+    def read_module_id(self):
+        return self.read_register(REG_MODULE_ID)
+
+    def read_calibrated(self):
+        return self.read_register(REG_CALIBRATED) == 1
+
+    # 0 for sensor firmware before the status register
+    def read_protocol(self):
+        return self.read_register(REG_PROTOCOL)
+
+    # result of the last completed read (doesn't start a new one)
+    def read_position(self):
+        return self.read_register(REG_POSITION)
+
+    # STATUS_READY and STATUS_SEQUENCE bits (protocol 1 and later)
+    def read_status(self):
+        return self.read_register(REG_STATUS)
 
     def calibrate_start(self):
         self.calibrated = False
-        self._write_cmd(0x01)
+        self._write_cmd(self.cmd_calibrate)
         # make sure we don't read anything til after its noticed the command
-        time.sleep(0.001)
+        device_clock.sleep(0.001)
 
     def calibrate_check(self):
-        self.device_registers = self._read_7()
-        temp = self.device_registers[3]
+        temp = self.read_register(REG_CALIBRATED)
         if temp == 1:
             self.calibrated = True
         else:
@@ -100,29 +353,227 @@ class Device_LineSense:
     # position < 125 indicate steer left is suggested
     # position > 125  indicate steer right is suggested
     def get_position(self):
-        self._write_cmd(0x02)  # initiate read
-        time.sleep(0.001 * self.read_delay)  # give it time to finish
-        self.device_registers = self._read_7()  # read the result
-        self.position = self.device_registers[5]
+        self._write_cmd(self.cmd_read)  # initiate read
+        self._read_started()
+        device_clock.sleep(self.read_wait)  # give it time to finish
+        if self._read_registers(self.hot_registers):  # read the result
+            self._read_finished()
+        else:
+            self._read_failed()
+        # this one blocks (it isn't used in the control loop), so a stale
+        # result is polled for here
+        while self.polling:
+            device_clock.sleep(self.poll_interval)
+            self.get_quickposition()
         # print("raw position:", self.position)
         return self.position
 
     # returns signed integer 0 => +250; 125 indicates line is centered
     # position < 125 indicate steer left is suggested
     # position > 125  indicate steer right is suggested
+    # (while polling, the read already started is still running, so it
+    # isn't restarted)
     def start_quickposition_check(self):
-        self._write_cmd(0x02)  # initiate read
+        if self.polling:
+            return
+        self._write_cmd(self.cmd_read)  # initiate read
+        self._read_started()
+
+    def _read_started(self):
+        self.polling = False
         self.read_in_process = True
-        self.read_will_be_ready_at = time.monotonic() + (0.001 * self.read_delay)
+        self.read_started_at = device_clock.monotonic()
+        self.read_will_be_ready_at = self.read_started_at + self.read_wait
+        if self.count_allocs:
+            self.alloc_bytes += mem_alloc() - self.alloc_start
+            self.alloc_cycles += 1
 
     def is_quickposition_ready(self):
-        if time.monotonic() > self.read_will_be_ready_at:
+        if device_clock.monotonic() > self.read_will_be_ready_at:
             return True
         return False
 
+    # returns seconds until the started read will be ready (<= 0 if ready)
+    def time_until_quickposition_ready(self):
+        return self.read_will_be_ready_at - device_clock.monotonic()
+
+    # returns when (device_clock time) the started read samples the line,
+    # taken as the middle of the wait for it
+    def get_quickposition_time(self):
+        return self.read_started_at + (0.5 * self.read_wait)
+
     def get_quickposition(self):
-        self.device_registers = self._read_7()  # read the result
-        self.position = self.device_registers[5]
-        self.read_in_process = False
+        if self.count_allocs:
+            self.alloc_start = mem_alloc()
+        if self.polling:
+            self.num_polls += 1
+        if self._read_registers(self.hot_registers):  # read the result
+            self._read_finished()
+        else:
+            self._read_failed()
         # print("raw position:", self.position)
-        return self.position
\ No newline at end of file
+        return self.position
+
+    # checks the result just read into device_registers for freshness.
+    # a stale one, while a fresh one may still come, keeps the last
+    # position and leaves the read in process, to be read again by the
+    # next call (polling) rather than waited for here
+    def _read_finished(self):
+        self.read_in_process = False
+        if self.has_status:
+            now = device_clock.monotonic()
+            self._check_fresh()
+            if self.adaptive and not self.polling:
+                self._adapt_wait(now - self.read_started_at)
+            give_up_at = self.read_started_at + (0.001 * self.read_delay)
+            if (not self.fresh) and (now < give_up_at):
+                self.polling = True
+                self.read_in_process = True
+                self.read_will_be_ready_at = now + self.poll_interval
+                return
+            self.polling = False
+            if not self.fresh:
+                self.num_stale += 1
+        self._take_position()
+
+    # the result couldn't be read: keep the last position, flagged stale
+    def _read_failed(self):
+        self.read_in_process = False
+        self.polling = False
+        self.fresh = False
+
+    def _take_position(self):
+        if self.estimating:
+            self.line_estimator.update(self.device_registers, REG_CHANNELS)
+            self.position = self.line_estimator.position
+        else:
+            self.position = self.device_registers[REG_POSITION]
+
+    def _check_fresh(self):
+        status = self.device_registers[REG_STATUS]
+        sequence = status & STATUS_SEQUENCE
+        if (status & STATUS_READY) and (sequence != self.sequence):
+            self.sequence = sequence
+            self.fresh = True
+        else:
+            self.fresh = False
+
+    # elapsed is how long after the start of the read it was first read;
+    # only reads made at (about) read_wait say anything about it
+    def _adapt_wait(self, elapsed):
+        if self.fresh:
+            if elapsed < self.read_wait + self.wait_slack:
+                self.read_wait -= self.wait_step * (1 - self.wait_quantile)
+                if self.read_wait < self.wait_min:
+                    self.read_wait = self.wait_min
+        elif elapsed >= self.read_wait:
+            self.read_wait += self.wait_step * self.wait_quantile
+            if self.read_wait > 0.001 * self.read_delay:
+                self.read_wait = 0.001 * self.read_delay
+
+    # get_quickposition() then start_quickposition_check(), the way the
+    # control loop uses them; one transaction instead of two if combined
+    def cycle_quickposition(self):
+        if not self.combined:
+            self.get_quickposition()
+            self.start_quickposition_check()
+            return self.position
+        if self.count_allocs:
+            self.alloc_start = mem_alloc()
+        if not self._write_then_read(self.cmd_read, self.hot_registers):
+            self._read_failed()
+            self._read_started()
+            return self.position
+        # the command went out with the read, so a stale result can't be
+        # polled for here; it is only flagged (fresh False)
+        if self.has_status:
+            self._check_fresh()
+            if self.adaptive:
+                self._adapt_wait(device_clock.monotonic() - self.read_started_at)
+            if not self.fresh:
+                self.num_stale += 1
+        self._take_position()
+        self.read_in_process = False
+        self._read_started()
+        return self.position
+
+    # starts (or stops) adding up allocations per quickposition cycle;
+    # returns False where gc.mem_alloc isn't available
+    def set_alloc_counting(self, enable):
+        if mem_alloc is None:
+            return False
+        self.count_allocs = enable
+        self.alloc_bytes = 0
+        self.alloc_cycles = 0
+        return True
+
+    # mode is "Sensor" (the sensor's own position byte), "Centroid" or
+    # "Quadratic" (Line_Estimator on the raw frame, protocol 3 only);
+    # returns True if the position will come from Line_Estimator
+    def set_estimator(self, mode):
+        registers = memoryview(self.device_registers)
+        self.estimating = (self.num_channels > 1) and (mode != "Sensor")
+        if self.estimating:
+            self.line_estimator.configure(self.num_channels, mode == "Quadratic")
+            self.hot_registers = registers[
+                REG_POSITION : REG_CHANNELS + self.num_channels
+            ]
+        elif self.has_pointer:
+            self.hot_registers = registers[REG_POSITION : REG_STATUS + 1]
+        else:
+            self.hot_registers = self.register_block
+        return self.estimating
+
+    # last position with the estimator's sub-count precision (0.0 => 250.0)
+    def get_fine_position(self):
+        if self.estimating:
+            return self.line_estimator.fine_position / FINE_SCALE
+        return self.position
+
+    # 0 => 255; without the estimator only 0 (line lost) or 255
+    def get_confidence(self):
+        if self.estimating:
+            return self.line_estimator.confidence
+        if (self.position < 5) or (self.position > 245):
+            return 0
+        return 255
+
+    def is_line_lost(self):
+        if self.estimating:
+            return self.line_estimator.lost
+        return (self.position < 5) or (self.position > 245)
+
+    # line width in channels (0 without the estimator)
+    def get_line_width(self):
+        if self.estimating:
+            return self.line_estimator.width
+        return 0
+
+    # True if the last position read was a fresh result (always True for
+    # sensors without the status register)
+    def is_fresh(self):
+        return self.fresh
+
+    # True once no transaction with the sensor has worked for link_timeout
+    # (the bus manager keeps refusing or failing them)
+    def is_link_down(self):
+        return self.bus_device.get_time_since_ok() > self.link_timeout
+
+    # transactions with the sensor that failed or were refused
+    def get_num_failed(self):
+        return self.num_failed
+
+    def get_num_stale_reads(self):
+        return self.num_stale
+
+    def get_num_polls(self):
+        return self.num_polls
+
+    # seconds currently waited for each read (read_delay unless adaptive)
+    def get_read_wait(self):
+        return self.read_wait
+
+    # (bytes allocated, cycles counted) since set_alloc_counting(True);
+    # bytes should stay 0
+    def get_alloc_count(self):
+        return self.alloc_bytes, self.alloc_cycles
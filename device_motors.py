@@ -51,7 +51,8 @@
 # 
 """
 
-import time
+import device_clock
+import asyncio
 import pulseio
 import board
 import math
@@ -60,6 +61,69 @@ from adafruit_motor import motor
 
 # ------------------------------------------------------------------
 
+#
+# function curved_throttles() returns the (left, right) wheel throttles that
+# move_forward_curved() applies for a given base throttle and curve, each
+# clamped to 0 => 1.0.  it is also used by Mode_Config to precompute the
+# steering lookup table so the control loop doesn't redo this math each tick
+#
+def curved_throttles(targetThrottle, curve):
+    throt_L = targetThrottle + (targetThrottle * curve / 2)
+    if throt_L < 0:
+        throt_L = 0
+    if throt_L > 1:
+        throt_L = 1
+    throt_R = targetThrottle - (targetThrottle * curve / 2)
+    if throt_R < 0:
+        throt_R = 0
+    if throt_R > 1:
+        throt_R = 1
+    return throt_L, throt_R
+
+
+#
+# class Motor_Ramp is a non-blocking ramp generator: it holds a target
+# throttle and a slew rate (throttle per second), and each advance() moves
+# its value toward the target by however much the time since the last
+# advance allows.  it never sleeps; whoever owns it advances it (once per
+# control tick, or from a runtime job)
+#
+class Motor_Ramp:
+    def __init__(self, rate):
+        self.rate = rate
+        self.value = 0
+        self.target = 0
+        self.last_time = 0
+
+    # begins ramping from the present value to target
+    def start(self, target, now):
+        self.target = target
+        self.last_time = now
+
+    # jumps straight to value (and stops ramping)
+    def hold(self, value):
+        self.value = value
+        self.target = value
+
+    def is_done(self):
+        return self.value == self.target
+
+    # moves value toward target for the time since the last advance;
+    # returns the new value
+    def advance(self, now):
+        if self.value != self.target:
+            step = self.rate * (now - self.last_time)
+            if self.value < self.target:
+                self.value += step
+                if self.value > self.target:
+                    self.value = self.target
+            else:
+                self.value -= step
+                if self.value < self.target:
+                    self.value = self.target
+        self.last_time = now
+        return self.value
+
 
 class Device_Motors:
     def __init__(self, screen_dashboard):
@@ -97,6 +161,11 @@ class Device_Motors:
 
         self.max_delta_throt = 0.1
 
+        # tick-driven alternative to motors_accelerate(), same slew rate
+        # (max_delta_throt per 0.1 sec); see ramp_to()
+        self.ramp = Motor_Ramp(self.max_delta_throt / 0.1)
+        self.ramp_steered = False  # True if the control loop applies the ramp
+
     #
     # #############################################################################
     # for motion commands, throttle values are -1.0 (back) => 0 => 1.0 (forward)
@@ -130,30 +199,66 @@ class Device_Motors:
     # that is matched by a -0.2 which gently curves to the left
     #
     def move_forward_curved(self, targetThrottle, curve):
-        self.cur_throt_L = targetThrottle + (targetThrottle * curve / 2)
-        if self.cur_throt_L < 0:
-            self.cur_throt_L = 0
-        if self.cur_throt_L > 1:
-            self.cur_throt_L = 1
-        self.cur_throt_R = targetThrottle - (targetThrottle * curve / 2)
-        if self.cur_throt_R < 0:
-            self.cur_throt_R = 0
-        if self.cur_throt_R > 1:
-            self.cur_throt_R = 1
+        self.cur_throt_L, self.cur_throt_R = curved_throttles(targetThrottle, curve)
         self.motorL.throttle = self.cur_throt_L * self.motorCalibrateL
         self.motorR.throttle = self.cur_throt_R * self.motorCalibrateR
         self.screen_dashboard.show_L_throttle(self.cur_throt_L)
         self.screen_dashboard.show_R_throttle(self.cur_throt_R)
 
+    #
+    # function move_forward_wheels() sets each wheel directly to an already
+    # computed (and already clamped) throttle, such as the entries of the
+    # Mode_Config steering table
+    #
+    def move_forward_wheels(self, throt_L, throt_R):
+        self.cur_throt_L = throt_L
+        self.cur_throt_R = throt_R
+        self.motorL.throttle = throt_L * self.motorCalibrateL
+        self.motorR.throttle = throt_R * self.motorCalibrateR
+        self.screen_dashboard.show_L_throttle(throt_L)
+        self.screen_dashboard.show_R_throttle(throt_R)
+
+    #
+    # function ramp_to() starts ramping the base throttle of both wheels
+    # from where it is now to targetThrottle, and returns immediately.
+    # if steered, the control loop applies the ramp each tick with
+    # move_forward_wheels_ramped(); otherwise both wheels go straight and
+    # the ramp is advanced by service_ramp() (a runtime job)
+    #
+    def ramp_to(self, targetThrottle, steered=False):
+        self.ramp_steered = steered
+        self.ramp.start(targetThrottle, device_clock.monotonic())
+
+    #
+    # function move_forward_wheels_ramped() is move_forward_wheels() for
+    # steering on top of a ramping base throttle: throt_L and throt_R are
+    # for the full base throttle (the ramp's target), and are scaled by
+    # how far the ramp has got.  once the ramp is done it costs nothing
+    #
+    def move_forward_wheels_ramped(self, throt_L, throt_R):
+        ramp = self.ramp
+        if (ramp.value != ramp.target) and (ramp.target > 0):
+            scale = ramp.advance(device_clock.monotonic()) / ramp.target
+            throt_L *= scale
+            throt_R *= scale
+        self.move_forward_wheels(throt_L, throt_R)
+
+    # runtime job; advances an unsteered ramp and drives both wheels at it
+    def service_ramp(self):
+        if self.ramp_steered or self.ramp.is_done():
+            return
+        self.move_forward(self.ramp.advance(device_clock.monotonic()))
+
     #
     # function motors_accelerate() is like move forward accept that instead of
     # immediately setting throttle to the targetThrottle it honors a
     # "max acceleration rate" configuration parameter and steps gradually to
     # the targetThrottle.
     #
-    # it returns# the number of seconds that it took to get there.
+    # it is a coroutine, and yields (rather than sleeps) between steps so
+    # the runtime's jobs keep running while it accelerates
     #
-    def motors_accelerate(self, targetThrottle):
+    async def motors_accelerate(self, targetThrottle):
         if abs(abs(targetThrottle) - abs(self.cur_throt_L)) < self.max_delta_throt:
             # new throttle is close to current to can just go there
             # pass
@@ -168,7 +273,7 @@ class Device_Motors:
                 self.screen_dashboard.show_L_throttle(self.cur_throt_L)
                 self.screen_dashboard.show_R_throttle(self.cur_throt_R)
                 # print("stepping up:", self.cur_throt_L)
-                time.sleep(0.1)
+                await asyncio.sleep(0.1)
         else:
             # will have to go in steps, and the will be steps UP
             while (targetThrottle - self.cur_throt_L) > self.max_delta_throt:
@@ -179,7 +284,7 @@ class Device_Motors:
                 self.screen_dashboard.show_L_throttle(self.cur_throt_L)
                 self.screen_dashboard.show_R_throttle(self.cur_throt_R)
                 # print("stepping down:", self.cur_throt_L)
-                time.sleep(0.1)
+                await asyncio.sleep(0.1)
 
         self.cur_throt_L = targetThrottle
         self.cur_throt_R = targetThrottle
@@ -187,13 +292,15 @@ class Device_Motors:
         self.motorR.throttle = self.cur_throt_R * self.motorCalibrateR
         self.screen_dashboard.show_L_throttle(self.cur_throt_L)
         self.screen_dashboard.show_R_throttle(self.cur_throt_R)
+        self.ramp.hold(targetThrottle)
 
     #
     # function turn_in_place() spins the robot "in place" (w/o forward movement)
     # degrees is amount to turn, in degrees (-) is left, (+) is right
+    # it is a coroutine; the runtime's jobs run while it turns
     #
 
-    def turn_in_place(self, degrees):
+    async def turn_in_place(self, degrees):
         self.cur_throt_L = math.copysign(self.throttle_for_360, degrees)
         self.cur_throt_R = math.copysign(self.throttle_for_360, degrees) * (-1)
         self.motorL.throttle = self.cur_throt_L * self.motorCalibrateL_turn
@@ -204,15 +311,16 @@ class Device_Motors:
         self.screen_dashboard.show_R_throttle(self.cur_throt_R)
 
         duration = abs(degrees * self.seconds_for_360) / 360
-        time.sleep(duration)
+        await asyncio.sleep(duration)
 
         self.motors_stop()
 
     #
     # function motors_stop() causes both motors to stop turning immediately
-    # no deceleration curve is applied
+    # no deceleration curve is applied (and any ramp in progress is dropped)
     #
     def motors_stop(self):
+        self.ramp.hold(0)
         self.cur_throt_L = 0
         self.cur_throt_R = 0
         self.motorL.throttle = self.cur_throt_L * self.motorCalibrateL
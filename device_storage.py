@@ -7,6 +7,30 @@
 #
 # Author(s): Don Korte
 # Module:  device_storage.py communicates with SD card to save run data
+#   It also holds the per-tick telemetry ring buffer for the current run.
+#   The buffer is a set of preallocated array columns (one entry per
+#   control tick) sized at startup from the free heap, so recording a tick
+#   is just a handful of integer stores with no allocation.  When the run
+#   is longer than the buffer, the oldest ticks are overwritten.
+#
+#   telemetry columns (all integers):
+#     tel_time_ms   'H'  ms since start of run (wraps every 65.5 s)
+#     tel_position  'H'  raw line position 0 => 250
+#     tel_steer     'h'  steering curve x 1000
+#     tel_throt_L   'h'  left wheel throttle x 1000
+#     tel_throt_R   'h'  right wheel throttle x 1000
+#     tel_loop_us   'H'  loop processing time in uS (saturates at 65535)
+#     tel_flags     'B'  LOGFLAG_xxx bits (eg. steering hit rxn_limit)
+#     tel_residual  'b'  line predictor residual (reading - prediction)
+#
+#   Run logs are written (to SD card if one is mounted at log_dir) in a
+#   fixed binary format: a 64 byte versioned header (see LOG_HEADER_FORMAT)
+#   followed by 16 byte records (LOG_RECORD_FORMAT), all little-endian.
+#   Logs can be streamed during a run, or dumped from the telemetry buffer
+#   after the run.  When streaming, each tick only packs its record into
+#   one of two preallocated buffers; whole buffers (several 512 byte
+#   blocks) are written to the file by a low-priority runtime job, and
+#   only when there is time before the next control tick.
 #
 # github: https://github.com/dnkorte/linefollower_controller
 #
@@ -34,10 +58,410 @@
 # 
 """
 
-import time
+import device_clock
+import gc
+import os
+import struct
+from array import array
+from loop_scheduler import Slack_Budget
+
+# bytes of heap used per telemetry record (sum of the column item sizes)
+TELEMETRY_RECORD_BYTES = 14
+
+# flag bits kept per tick (telemetry and log records)
+LOGFLAG_RXN_LIMIT = 0x01  # steering was clamped to rxn_limit
+LOGFLAG_STALE_READ = 0x02  # line sensor result was stale (see Device_LineSense)
+
+# run log file format; bump LOG_VERSION whenever either format changes
+# header: magic, version, header size, record size, run number,
+#   throttle, loop_speed, rxn_rate, rxn_limit,
+#   showdisp index, overrun index, disp fps (0=Auto), sensor type,
+#   sensor read_delay (mS), steering index, predictor index,
+#   predictor lead (mS), vbat feather, vbat motor,
+#   number of records, number of records dropped,
+#   predictor alpha, predictor beta, position mode index
+# record: time (mS since start of run), position, steer x 1000,
+#   throttle L x 1000, throttle R x 1000, loop time (uS),
+#   predictor residual, flags
+# (version 1 had no steering / predictor fields, and no residual: its
+# flags were 16 bits; version 2 had no position mode)
+LOG_MAGIC = b"LFRL"
+LOG_VERSION = 3
+LOG_HEADER_FORMAT = "<4sHHHHffffBBBBBBBBffIIffB3x"
+LOG_HEADER_SIZE = 64
+LOG_RECORD_FORMAT = "<IHhhhHbB"
+LOG_RECORD_SIZE = 16
+LOG_BLOCK_SIZE = 512
+
+
+class Run_Log_Writer:
+    def __init__(self, blocks_per_buffer=4):
+        self.buffer_size = LOG_BLOCK_SIZE * blocks_per_buffer
+        self.buffers = (bytearray(self.buffer_size), bytearray(self.buffer_size))
+        self.full = bytearray(2)  # 1 if that buffer is waiting to be written
+        self.active = 0  # buffer records are currently packed into
+        self.offset = 0  # next free byte in active buffer
+        self.file = None
+        self.path = None
+        self.num_records = 0
+        self.num_dropped = 0  # records lost because both buffers were full
+        self.max_write_time = 0  # slowest buffer write seen (seconds)
+        self.last_write_time = 0  # and the latest one
+
+    # creates the log file; header (LOG_HEADER_SIZE bytes) goes at the start
+    # of the first buffer so every later write is block aligned
+    def open(self, path, header):
+        self.file = open(path, "wb")
+        self.path = path
+        self.full[0] = 0
+        self.full[1] = 0
+        self.active = 0
+        self.buffers[0][0:LOG_HEADER_SIZE] = header
+        self.offset = LOG_HEADER_SIZE
+        self.num_records = 0
+        self.num_dropped = 0
+
+    # packs one record into the active buffer; never touches the file
+    def write_record(
+        self, time_ms, position, steer, throt_L, throt_R, loop_us, flags, residual
+    ):
+        if self.full[self.active]:
+            # both buffers were full at last record; see if one is free now
+            other = 1 - self.active
+            if self.full[other]:
+                self.num_dropped += 1
+                return
+            self.active = other
+            self.offset = 0
+        elif self.offset >= self.buffer_size:
+            # it was full, but has since been written out; reuse it
+            self.offset = 0
+        struct.pack_into(
+            LOG_RECORD_FORMAT,
+            self.buffers[self.active],
+            self.offset,
+            time_ms,
+            position,
+            steer,
+            throt_L,
+            throt_R,
+            loop_us,
+            residual,
+            flags,
+        )
+        self.offset += LOG_RECORD_SIZE
+        self.num_records += 1
+        if self.offset >= self.buffer_size:
+            # hand this buffer off to be written, and switch to the other
+            # one if it has already been written out
+            self.full[self.active] = 1
+            other = 1 - self.active
+            if not self.full[other]:
+                self.active = other
+                self.offset = 0
+
+    def has_full_buffer(self):
+        return self.full[0] or self.full[1]
+
+    # writes one full buffer to the file, if there is one waiting
+    def flush_full_buffer(self):
+        # the buffer that isn't active is the older one
+        which = 1 - self.active
+        if not self.full[which]:
+            which = self.active
+            if not self.full[which]:
+                return
+        start = device_clock.monotonic()
+        self.file.write(self.buffers[which])
+        elapsed = device_clock.monotonic() - start
+        self.last_write_time = elapsed
+        if elapsed > self.max_write_time:
+            self.max_write_time = elapsed
+        self.full[which] = 0
+
+    # writes whatever is left, then rewrites the header with final counts
+    def close(self, header):
+        if self.file is None:
+            return
+        while self.has_full_buffer():
+            self.flush_full_buffer()
+        if (self.offset > 0) and (self.offset < self.buffer_size):
+            self.file.write(memoryview(self.buffers[self.active])[0 : self.offset])
+        self.file.seek(0)
+        self.file.write(header)
+        self.file.close()
+        self.file = None
 
 
 class Device_Storage:
-    def __init__(self):
-        self.curspeed_left = 0
-        self.curspeed_right = 0
+    def __init__(
+        self,
+        heap_fraction=0.25,
+        max_records=16384,
+        min_records=256,
+        log_dir="/sd",
+        sd_cs=None,
+    ):
+        self.telemetry_capacity = self._size_telemetry(
+            heap_fraction, max_records, min_records
+        )
+        n = self.telemetry_capacity
+        # zeroed columns, each copied straight from a zeroed bytearray (a
+        # bytes initializer would be read item by item on CircuitPython)
+        self.tel_time_ms = array("H", bytearray(2 * n))
+        self.tel_position = array("H", bytearray(2 * n))
+        self.tel_steer = array("h", bytearray(2 * n))
+        self.tel_throt_L = array("h", bytearray(2 * n))
+        self.tel_throt_R = array("h", bytearray(2 * n))
+        self.tel_loop_us = array("H", bytearray(2 * n))
+        self.tel_flags = bytearray(n)
+        self.tel_residual = array("b", bytearray(n))
+        self.tel_next = 0  # index the next record goes into
+        self.tel_count = 0  # number of valid records (<= capacity)
+        self.tel_total = 0  # records written this run, including overwritten
+        print("telemetry records:", n)
+
+        # run logs; note if log_dir is on the CIRCUITPY flash rather than
+        # SD card, boot.py must remount it writable
+        self.log_dir = log_dir
+        self.log_writer = Run_Log_Writer()
+        self.log_available = self._mount_log_storage(sd_cs)
+        self.next_log_number = self._find_next_log_number()
+        self.last_log_path = None
+        self.streaming = False
+        self.slack_function = None
+        # slack needed before the next control tick to risk a write; SD
+        # cards stall for tens of mS now and then
+        self.write_budget = Slack_Budget(0.005)
+
+    # number of records to allocate: heap_fraction of the currently free heap
+    # (CircuitPython only; elsewhere just max_records), within min/max
+    def _size_telemetry(self, heap_fraction, max_records, min_records):
+        gc.collect()
+        try:
+            free_bytes = gc.mem_free()
+        except AttributeError:
+            return max_records
+        records = int(free_bytes * heap_fraction) // TELEMETRY_RECORD_BYTES
+        if records > max_records:
+            records = max_records
+        if records < min_records:
+            records = min_records
+        return records
+
+    # mounts the SD card (if a chip select pin is given) at log_dir and
+    # checks that log_dir exists; returns True if logs can be written
+    def _mount_log_storage(self, sd_cs):
+        if sd_cs is not None:
+            try:
+                import board
+                import sdcardio
+                import storage
+
+                sdcard = sdcardio.SDCard(board.SPI(), sd_cs)
+                vfs = storage.VfsFat(sdcard)
+                storage.mount(vfs, self.log_dir)
+            except (ImportError, OSError) as e:
+                print("SD card not mounted:", e)
+                return False
+        try:
+            os.listdir(self.log_dir)
+        except OSError:
+            print("no log storage at", self.log_dir)
+            return False
+        return True
+
+    def _find_next_log_number(self):
+        if not self.log_available:
+            return 0
+        highest = 0
+        for name in os.listdir(self.log_dir):
+            if name.startswith("run") and name.endswith(".lfr"):
+                try:
+                    number = int(name[3:-4])
+                except ValueError:
+                    continue
+                if number > highest:
+                    highest = number
+        return highest + 1
+
+    def _next_log_path(self):
+        path = "{}/run{:04d}.lfr".format(self.log_dir, self.next_log_number)
+        self.next_log_number += 1
+        return path
+
+    def get_last_log_path(self):
+        return self.last_log_path
+
+    # builds the LOG_HEADER_SIZE byte run log header
+    def make_log_header(
+        self,
+        run_number,
+        mode_config,
+        device_linesense,
+        device_battery,
+        num_records=0,
+        num_dropped=0,
+    ):
+        fps = mode_config.get_disp_fps()
+        if fps == "Auto":
+            fps = 0
+        return struct.pack(
+            LOG_HEADER_FORMAT,
+            LOG_MAGIC,
+            LOG_VERSION,
+            LOG_HEADER_SIZE,
+            LOG_RECORD_SIZE,
+            run_number,
+            mode_config.get_throttle(),
+            mode_config.get_loop_speed(),
+            mode_config.get_rxn_rate(),
+            mode_config.get_rxn_limit(),
+            mode_config.showdisp_index,
+            mode_config.overrun_index,
+            fps,
+            device_linesense.sensor_type,
+            device_linesense.read_delay,
+            mode_config.steering_index,
+            mode_config.predictor_index,
+            mode_config.get_pred_lead(),
+            device_battery.vbat_feather,
+            device_battery.vbat_motor,
+            num_records,
+            num_dropped,
+            mode_config.get_pred_alpha(),
+            mode_config.get_pred_beta(),
+            mode_config.position_mode_index,
+        )
+
+    # opens a new run log and streams each recorded tick into it until
+    # end_run_log().  slack_function returns seconds until the next control
+    # tick; buffers are only written by service_log() when that slack is
+    # at least write_budget
+    def begin_run_log(self, header, slack_function):
+        if not self.log_available:
+            return False
+        try:
+            self.log_writer.open(self._next_log_path(), header)
+        except OSError as e:
+            print("can't open run log:", e)
+            return False
+        self.slack_function = slack_function
+        self.write_budget.reset()
+        self.streaming = True
+        return True
+
+    # runtime job; writes a full log buffer if there is time for it
+    def service_log(self):
+        if not (self.streaming and self.log_writer.has_full_buffer()):
+            return
+        if not self.write_budget.allows(self.slack_function()):
+            return
+        self.log_writer.flush_full_buffer()
+        self.write_budget.record(self.log_writer.last_write_time)
+
+    # header must be rebuilt by the caller with final counts (see
+    # get_log_counts) since it's rewritten at the start of the file
+    def end_run_log(self, header):
+        if not self.streaming:
+            return
+        self.streaming = False
+        self.slack_function = None
+        try:
+            self.log_writer.close(header)
+            self.last_log_path = self.log_writer.path
+        except OSError as e:
+            print("error closing run log:", e)
+
+    # returns (records, dropped) for the log being (or just) streamed
+    def get_log_counts(self):
+        return self.log_writer.num_records, self.log_writer.num_dropped
+
+    def is_streaming(self):
+        return self.streaming
+
+    # after-run bulk dump: writes everything in the telemetry buffer to a
+    # new run log in one go.  returns path written, or None
+    def dump_telemetry_log(self, header_function):
+        if not self.log_available:
+            return None
+        writer = self.log_writer
+        header = header_function(self.tel_count, self.tel_total - self.tel_count)
+        try:
+            writer.open(self._next_log_path(), header)
+            time_ms = 0
+            prev_time = 0
+            for n in range(self.tel_count):
+                i = self.get_record_index(n)
+                # telemetry time is 16 bits; unwrap it for the log
+                if self.tel_time_ms[i] < prev_time:
+                    time_ms += 65536
+                prev_time = self.tel_time_ms[i]
+                writer.write_record(
+                    time_ms + prev_time,
+                    self.tel_position[i],
+                    self.tel_steer[i],
+                    self.tel_throt_L[i],
+                    self.tel_throt_R[i],
+                    self.tel_loop_us[i],
+                    self.tel_flags[i],
+                    self.tel_residual[i],
+                )
+                while writer.has_full_buffer():
+                    writer.flush_full_buffer()
+            writer.close(header)
+        except OSError as e:
+            print("error writing run log:", e)
+            return None
+        self.last_log_path = writer.path
+        return writer.path
+
+    # empties the telemetry buffer; call at start of each run
+    def clear_telemetry(self):
+        self.tel_next = 0
+        self.tel_count = 0
+        self.tel_total = 0
+
+    # stores one control tick (and streams it to the run log if one is
+    # open); all arguments must be ints.  no allocation
+    def record_tick(
+        self, time_ms, position, steer, throt_L, throt_R, loop_us, flags=0, residual=0
+    ):
+        if loop_us > 65535:
+            loop_us = 65535
+        if self.streaming:
+            self.log_writer.write_record(
+                time_ms, position, steer, throt_L, throt_R, loop_us, flags, residual
+            )
+        i = self.tel_next
+        self.tel_time_ms[i] = time_ms & 0xFFFF
+        self.tel_position[i] = position
+        self.tel_steer[i] = steer
+        self.tel_throt_L[i] = throt_L
+        self.tel_throt_R[i] = throt_R
+        self.tel_loop_us[i] = loop_us
+        self.tel_flags[i] = flags
+        self.tel_residual[i] = residual
+        i += 1
+        if i >= self.telemetry_capacity:
+            i = 0
+        self.tel_next = i
+        if self.tel_count < self.telemetry_capacity:
+            self.tel_count += 1
+        self.tel_total += 1
+
+    # returns the column index of the n'th oldest record still held
+    def get_record_index(self, n):
+        i = self.tel_next - self.tel_count + n
+        if i < 0:
+            i += self.telemetry_capacity
+        return i
+
+    # longest loop processing time (uS) of the records held
+    def get_max_loop_us(self):
+        max_us = 0
+        for n in range(self.tel_count):
+            i = self.get_record_index(n)
+            if self.tel_loop_us[i] > max_us:
+                max_us = self.tel_loop_us[i]
+        return max_us
@@ -0,0 +1,78 @@
+"""
+# Controller for Line-Following Robot
+# This runs on an Adafruit Feather M4, with a MiniTFT board.
+# It drives a TB6612 to control 2 DC Motors (in blue servo case)
+# and talks over I2C to an ItsyBitsy that interfaces a Pololu
+# line following sensor
+#
+# Author(s): Don Korte
+# Module:  hal.py selects the hardware backend.  The device, mode and
+#   screen modules import board, pulseio, analogio, displayio,
+#   adafruit_featherwing, adafruit_motor etc directly; on the robot those
+#   are the real CircuitPython modules and install() does nothing.
+#   Under CPython (eg. on a Linux laptop) install() registers the headless
+#   backend from the host package (linefollower_host/hal_linux.py), which
+#   provides stand-ins for all of those modules -- fake I2C bus, PWM, ADC,
+#   seesaw buttons and a no-op (or framebuffer) display -- so code.py and
+#   every Device_/Mode_/Screen_ class run unchanged off the robot.
+#
+#   install() must be called before any of those modules are imported.
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import sys
+
+# name of installed backend ("circuitpython" or "linux"), None until install()
+backend_name = None
+
+
+# backend None picks "circuitpython" on the robot and "linux" elsewhere
+# (kwargs are passed to the linux backend, eg. framebuffer=True)
+def install(backend=None, **kwargs):
+    global backend_name
+    if backend_name is not None:
+        return backend_name
+    if backend is None:
+        if sys.implementation.name == "circuitpython":
+            backend = "circuitpython"
+        else:
+            backend = "linux"
+
+    if backend == "linux":
+        import os
+
+        host_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "host")
+        if host_dir not in sys.path:
+            sys.path.insert(0, host_dir)
+        from linefollower_host import hal_linux
+
+        hal_linux.install(**kwargs)
+    elif backend != "circuitpython":
+        raise ValueError("unknown hal backend: " + backend)
+
+    backend_name = backend
+    return backend_name
@@ -0,0 +1,51 @@
+"""
+# Controller for Line-Following Robot -- desktop (host side) tools
+#
+# Author(s): Don Korte
+# Module:  linefollower_host is the desktop package for working with the
+#   robot off the robot; it is not copied to the CIRCUITPY drive.
+#
+#   runlog   - memory-mapped NumPy reader for the binary run logs written
+#              by Device_Storage, with the Screen_Summary metrics
+#   hal_linux - headless backend for hal.py: stand-ins for the CircuitPython
+#              and Adafruit modules so the robot code runs under CPython
+#   tracksim - closed-loop kinematic track simulator that drives
+#              Mode_FollowPath.control_tick faster than real time
+#   linesense_emulator - ItsyBitsy line sensor emulation for the fake I2C
+#              bus (latency, calibration, noise, stale reads, NACK/timeout)
+#   virtual_time - asyncio event loop on a device_clock.Virtual_Clock, for
+#              running whole sessions faster than real time
+#   bench    - control loop body benchmark (per-phase cost, allocations,
+#              ticks/s regression check against a saved baseline)
+#   sweep    - parallel search of the Mode_Config option grids in tracksim,
+#              writes the best option indexes for Mode_Config.load_config
+#   batchsim - vectorized (NumPy) simulation of many robots at once, each
+#              with its own configuration and perturbations
+#   robustness - Monte Carlo check of configs over randomly perturbed
+#              robots (success probability, lap time distribution)
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
@@ -0,0 +1,554 @@
+"""
+# Controller for Line-Following Robot -- desktop (host side) tools
+#
+# Author(s): Don Korte
+# Module:  batchsim.py simulates many robots at once.  The state of N
+#   virtual robots (pose, wheel speeds, sensor reading, stats) lives in
+#   NumPy arrays and every step advances all of them by one control
+#   tick, so the per-tick Python overhead of tracksim is paid once per
+#   tick rather than once per robot.
+#
+#   Same robot model and metrics as tracksim (whose constants and tracks
+#   it uses): a tick uses the reading requested at the end of the last
+#   one, progress is that of the axle's nearest centerline point, and a
+#   run ends on completing the laps, on being offtrack for lost_time or
+#   after int(max_time / loop speed) ticks.  The steering law is taken
+#   from the robot code itself: the wheel throttle tables
+#   Mode_Config._build_steering_table() builds for each (Throttle, Rxn
+#   Rate, Rxn Limit) in the batch are stacked, and each control tick is
+#   one gather at (table, position) -- exactly what
+#   Mode_FollowPath.control_tick() looks up -- after the Device_Motors
+#   calibration constants.  As on the robot (and in tracksim) the base
+#   throttle ramps up from rest at Device_Motors' ramp rate, scaling the
+#   table's throttles.
+#
+#   Robots may each have their own loop speed; step n is every robot's
+#   nth tick, however long its loop period.  The motors' first order lag
+#   is integrated exactly over a tick where tracksim takes steps of up to
+#   2 mS, so the two agree to within tracksim's own step size error.
+#   Without noise a robot that comes to rest for good (the lowest
+#   throttles may not turn the motors at all) is finished when it stops,
+#   with the statistics of the ticks it would have sat through.
+#   Per-robot perturbations (motor gains, sensor latency, position noise,
+#   line width, speed scale for battery sag) may be scalars or arrays of
+#   length N.  State is float32, whose sin and cos NumPy vectorizes.
+#
+#   usage:  python -m linefollower_host.batchsim [--track oval]
+#     simulates every Throttle x Loop Speed x Rxn Rate x Rxn Limit
+#     combination in one batch and prints throughput and the fastest
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import argparse
+import itertools
+import sys
+import time
+
+import numpy as np
+
+from linefollower_host import tracksim
+from linefollower_host import sweep
+from linefollower_host.sweep import SWEEP_PARAMS
+
+COMPACT_FRACTION = 0.75  # drop finished robots when fewer than this are active
+FLOAT = np.float32  # robot state; NumPy's float32 math is vectorized (SIMD)
+MIN_PARALLEL = 0.2  # bar this close to parallel with the line sees nothing
+TINY = 1e-30  # a motor lag this small is zero
+
+# per-robot arrays; finished robots are dropped from all of these
+PER_ROBOT = (
+    "ids", "table_base", "loop_speed", "max_ticks", "lost_ticks", "gain",
+    "noise", "sensor_scale", "ramp_time", "read_time", "read_decay",
+    "read_lag", "rest_time", "rest_decay", "rest_lag",
+    "x", "y", "heading", "speed", "turn_rate", "target_speed", "target_turn",
+    "track_index", "bar_index", "sensed",
+    "bar_offset", "bar_parallel", "active", "offtrack_ticks", "offtrack_run",
+    "sum_sq_offset", "num_on_line", "side", "crossings",
+)
+# per-robot results, saved when a robot is done
+FINAL = (
+    "completed", "lost", "num_ticks", "travelled", "offtrack_ticks",
+    "sum_sq_offset", "num_on_line", "crossings",
+)
+
+
+class Steering_Tables:
+    """wheel throttle tables for every distinct (THR, RR, RL) in configs
+    (N x 4 option indexes in SWEEP_PARAMS order), built by Mode_Config.
+    Tables are stacked (table x position) with a (L, R) pair in each row,
+    so a robot's two throttles are one row take() at table_base + position"""
+
+    def __init__(self, robot, configs):
+        mode_config = robot.mode_config
+        motors = robot.device_motors
+        keys, table_of_robot = np.unique(
+            configs[:, [0, 2, 3]], axis=0, return_inverse=True
+        )
+        self.table_base = table_of_robot.reshape(-1) * 251
+        throttles = np.zeros((len(keys), 251, 2))
+        # keys are sorted, so mostly only RL changes from one to the next;
+        # each set_param_index() rebuilds the table, so set only what changed
+        last = (None, None, None)
+        for k, key in enumerate(keys):
+            for param, index, last_index in zip(("THR", "RR", "RL"), key, last):
+                if index != last_index:
+                    mode_config.set_param_index(param, int(index))
+            last = key
+            throttles[k, :, 0] = mode_config.steer_throt_L
+            throttles[k, :, 1] = mode_config.steer_throt_R
+        # what Device_Motors.move_forward_wheels writes to the motors
+        throttles = throttles.reshape(-1, 2)
+        throttles *= (motors.motorCalibrateL, motors.motorCalibrateR)
+        self.throttles = throttles.astype(FLOAT)
+        # and what turns the wheels, once the base throttle is up to speed
+        self.drive = _useful(throttles).astype(FLOAT)
+        self.loop_speed_options = np.array(mode_config.loop_speed_options)
+        self.throttle_options = np.array(mode_config.throttle_options)
+
+
+# motors don't turn below the minimum useful throttle
+def _useful(throttle):
+    return throttle * (np.abs(throttle) >= tracksim.MIN_USEFUL_THROTTLE)
+
+
+def _per_robot(value, n):
+    return np.broadcast_to(np.asarray(value, dtype=FLOAT), (n,)).copy()
+
+
+class Batch_Sim:
+    def __init__(
+        self,
+        configs,
+        track="oval",
+        robot=None,
+        motor_gain_L=1.0,
+        motor_gain_R=1.0 / 0.95,
+        sensor_latency=0.0,
+        noise=0.0,
+        line_width_cm=tracksim.LINE_WIDTH_CM,
+        speed_scale=1.0,
+        motor_tau=0.05,
+        sensor_offset_cm=5.0,
+        seed=None,
+    ):
+        if robot is None:
+            robot = tracksim.Sim_Robot()
+        if isinstance(track, str):
+            track = tracksim.TRACKS[track]()
+        self.track = track
+        # (x, y, tangent x, tangent y) of each point, fetched a row at a time
+        self.track_rows = np.hstack((track.points, track.tangents)).astype(FLOAT)
+        self.point_spacing = track.length / len(track)
+        self.configs = np.asarray(configs, dtype=np.int64).reshape(-1, 4)
+        n = self.n = len(self.configs)
+        self.tables = Steering_Tables(robot, self.configs)
+        self.init_table_base = self.tables.table_base
+        self.init_loop_speed = self.tables.loop_speed_options[self.configs[:, 1]]
+
+        # seconds Device_Motors.ramp_to() takes to bring each robot from
+        # rest to its base throttle
+        self.init_ramp_time = (
+            self.tables.throttle_options[self.configs[:, 0]]
+            / robot.device_motors.ramp.rate
+        ).astype(FLOAT)
+
+        cm_per_sec = robot.device_motors.cm_per_sec_at_100pct
+        scale = _per_robot(speed_scale, n) * cm_per_sec
+        self.init_gain = np.stack(
+            (_per_robot(motor_gain_L, n) * scale, _per_robot(motor_gain_R, n) * scale),
+            axis=1,
+        )
+        self.init_noise = _per_robot(noise, n)
+        self.any_noise = bool(self.init_noise.any())
+        self.init_sensor_scale = 1.0 / (
+            _per_robot(line_width_cm, n) / 2 + tracksim.SENSOR_PITCH_CM / 2
+        )
+
+        # each tick is split at the sensor read: the robot moves for the
+        # sensor latency, is sensed, then moves for the rest of the period.
+        # a reading later than the next tick would hold the robot up (it
+        # waits for it), so latency is clamped to the loop period
+        self.motor_tau = motor_tau
+        loop_speed = self.init_loop_speed.astype(FLOAT)
+        latency = np.minimum(_per_robot(sensor_latency, n), loop_speed)
+        self.any_latency = bool(latency.any())
+        self.init_read_time = latency
+        self.init_read_decay, self.init_read_lag = self._lag(latency)
+        self.init_rest_time = loop_speed - latency
+        self.init_rest_decay, self.init_rest_lag = self._lag(loop_speed - latency)
+
+        self.sensor_offset_cm = sensor_offset_cm
+        # sensors down the rows, so each row is a contiguous run of robots
+        self.sensor_y = (
+            (np.arange(tracksim.NUM_SENSORS) - (tracksim.NUM_SENSORS - 1) / 2)
+            * tracksim.SENSOR_PITCH_CM
+        ).astype(FLOAT)[:, None]
+        self.sensor_ones = np.ones(tracksim.NUM_SENSORS, dtype=FLOAT)
+        self.sensor_index = (
+            np.arange(tracksim.NUM_SENSORS) * (250 / (tracksim.NUM_SENSORS - 1))
+        ).astype(FLOAT)
+        self.random = np.random.default_rng(seed)
+        self.reset()
+
+    # first order motor lag over dt: the fraction of the difference from
+    # target speed left at the end, and the time integral of that fraction
+    def _lag(self, dt):
+        if self.motor_tau <= 0:
+            return np.zeros_like(dt), np.zeros_like(dt)
+        decay = np.exp(-dt / self.motor_tau)
+        return decay, self.motor_tau * (1.0 - decay)
+
+    def reset(self, max_time=40.0, lost_time=1.0):
+        n = self.n
+        self.ids = np.arange(n)
+        self.table_base = self.init_table_base
+        self.loop_speed = self.init_loop_speed
+        # as Track_Sim._drive(), a robot gets int(max_time / loop_speed)
+        # ticks, and is lost once offtrack_run * loop_speed >= lost_time
+        self.max_ticks = (max_time / self.loop_speed).astype(np.int64)
+        lost_ticks = np.ceil(lost_time / self.loop_speed).astype(np.int64)
+        lost_ticks -= (lost_ticks - 1) * self.loop_speed >= lost_time
+        lost_ticks += lost_ticks * self.loop_speed < lost_time
+        self.lost_ticks = lost_ticks.astype(np.int32)
+        self.gain = self.init_gain
+        self.noise = self.init_noise
+        self.sensor_scale = self.init_sensor_scale
+        self.ramp_time = self.init_ramp_time
+        self.max_ramp_time = float(self.ramp_time.max()) if n else 0.0
+        self.min_loop_speed = float(self.loop_speed.min()) if n else 0.0
+        self.read_time = self.init_read_time
+        self.read_decay = self.init_read_decay
+        self.read_lag = self.init_read_lag
+        self.rest_time = self.init_rest_time
+        self.rest_decay = self.init_rest_decay
+        self.rest_lag = self.init_rest_lag
+
+        # at rest at the start of the track, sensor bar over the first point
+        p = self.track.points[0]
+        t = self.track.tangents[0]
+        self.x = np.full(n, p[0] - self.sensor_offset_cm * t[0], dtype=FLOAT)
+        self.y = np.full(n, p[1] - self.sensor_offset_cm * t[1], dtype=FLOAT)
+        self.heading = np.full(n, np.arctan2(t[1], t[0]), dtype=FLOAT)
+        self.speed = np.zeros(n, dtype=FLOAT)  # forward, cm/s
+        self.turn_rate = np.zeros(n, dtype=FLOAT)  # radians/s, left positive
+        self.target_speed = np.zeros(n, dtype=FLOAT)
+        self.target_turn = np.zeros(n, dtype=FLOAT)
+        # nearest track points; these count on past the end of the track
+        # (lookups wrap), so the axle's is the distance travelled in points
+        self.track_index = np.zeros(n, dtype=np.intp)
+        self.bar_index = np.zeros(n, dtype=np.intp)
+        self.tick_number = 0
+
+        self.sensed = np.full(n, 125, dtype=np.int16)  # ready for next tick
+        self.bar_offset = np.zeros(n, dtype=FLOAT)
+        self.bar_parallel = np.zeros(n, dtype=bool)
+
+        self.active = np.ones(n, dtype=bool)
+        self.offtrack_ticks = np.zeros(n, dtype=np.int32)
+        self.offtrack_run = np.zeros(n, dtype=np.int32)
+        self.sum_sq_offset = np.zeros(n, dtype=FLOAT)
+        self.num_on_line = np.zeros(n, dtype=np.int32)
+        self.side = np.zeros(n, dtype=np.int8)
+        self.crossings = np.zeros(n, dtype=np.int32)
+        # final values of every robot, filled in as robots finish
+        self.final = {
+            "completed": np.zeros(n, dtype=bool),
+            "lost": np.zeros(n, dtype=bool),
+            "num_ticks": np.zeros(n, dtype=np.int64),
+        }
+        for name in FINAL[3:]:
+            self.final[name] = np.zeros(n)
+        self.sense()
+
+    # records the results of robots rows, which are done as of this tick
+    # (or, for robots at rest, after ticks more of the same)
+    def _finish(self, rows, completed, lost, ticks=0):
+        ids = self.ids[rows]
+        self.final["completed"][ids] = completed
+        self.final["lost"][ids] = lost
+        self.final["num_ticks"][ids] = self.tick_number + ticks
+        self.final["travelled"][ids] = self.track_index[rows] * self.point_spacing
+        for name in FINAL[4:]:
+            self.final[name][ids] = getattr(self, name)[rows]
+        self.active[rows] = False
+
+    # a robot that was at rest all this tick, with neither wheel driven at
+    # its next reading, stays put: without noise it reads the same again
+    # and repeats that next tick until it is lost or times out (a robot
+    # whose slowest setting cannot turn its motors sits on the start line
+    # for all of max_time).  such robots are finished now with those
+    # ticks' statistics.  at_rest: rows that were at rest as the tick
+    # began, and track_index, bar_index their nearest points then (which
+    # must have settled too; at a corner they can alternate)
+    def _finish_stopped(self, at_rest, track_index, bar_index):
+        at_rest &= self.active
+        at_rest &= self.target_speed == 0
+        at_rest &= self.target_turn == 0
+        at_rest &= self.track_index == track_index
+        at_rest &= self.bar_index == bar_index
+        rows = np.nonzero(at_rest)[0]
+        position = self.sensed[rows]
+        drive = self.tables.drive.take(self.table_base[rows] + position, axis=0)
+        stopped = ~drive.any(axis=1)
+        rows = rows[stopped]
+        if not len(rows):
+            return
+        position = position[stopped]
+        offtrack = (position < 5) | (position > 245)
+        ticks = self.max_ticks[rows] - self.tick_number
+        to_lost = self.lost_ticks[rows] - self.offtrack_run[rows]
+        lost = offtrack & (to_lost <= ticks)
+        ticks = np.where(lost, to_lost, ticks)
+        on_line = ~(offtrack | self.bar_parallel[rows])
+        self.offtrack_ticks[rows] += ticks * offtrack
+        self.sum_sq_offset[rows] += ticks * on_line * np.square(self.bar_offset[rows])
+        self.num_on_line[rows] += ticks * on_line
+        swing = (position > 135).view(np.int8) - (position < 115).view(np.int8)
+        self.crossings[rows] += swing * self.side[rows] < 0
+        self._finish(rows, False, lost, ticks)
+
+    # drops robots that are done, so later ticks only work on active ones
+    def _compact(self):
+        keep = self.active
+        for name in PER_ROBOT:
+            setattr(self, name, getattr(self, name)[keep])
+
+    # index of the track point nearest (x, y), one step along the track
+    # tangent at the previous nearest point index.  robots move a few cm
+    # in a tick, so this lands on the point tracksim's search finds
+    def _nearest(self, x, y, index):
+        row = self.track_rows.take(index, axis=0, mode="wrap")
+        along = (x - row[:, 0]) * row[:, 2]
+        along += (y - row[:, 1]) * row[:, 3]
+        along *= 1.0 / self.point_spacing
+        return index + np.rint(along).astype(np.intp)
+
+    # the reading each robot's sensor would report at its present pose,
+    # as Track_Sim.sense(); it is used at the robot's next tick
+    def sense(self):
+        c = np.cos(self.heading)
+        s = np.sin(self.heading)
+        bx = self.x + self.sensor_offset_cm * c
+        by = self.y + self.sensor_offset_cm * s
+        self.bar_index = self._nearest(bx, by, self.bar_index)
+        row = self.track_rows.take(self.bar_index, axis=0, mode="wrap")
+        tx = row[:, 2]
+        ty = row[:, 3]
+        # signed distance along the bar to where it crosses the local line
+        denom = c * tx + s * ty
+        parallel = self.bar_parallel = np.abs(denom) < MIN_PARALLEL
+        denom[parallel] = 1.0
+        offset = (bx - row[:, 0]) * ty
+        offset -= (by - row[:, 1]) * tx
+        offset /= denom
+        self.bar_offset = offset
+
+        # (sensors x robots) responses to the line
+        response = self.sensor_y - offset
+        np.abs(response, out=response)
+        response *= self.sensor_scale
+        np.subtract(1.0, response, out=response)
+        np.maximum(response, 0.0, out=response)
+        total = self.sensor_ones @ response
+        lost = parallel | (total < 0.2)
+        total[lost] = 1.0
+        position = self.sensor_index @ response
+        position /= total
+        if self.any_noise:
+            noise = self.random.standard_normal(len(position), dtype=FLOAT)
+            position += noise * self.noise
+            np.clip(position, 0, 250, out=position)
+        position = np.rint(position).astype(np.int16)
+        # off the line the firmware reports the side the line was last seen;
+        # a held reading is on the same side, so the last one will do
+        held = (self.sensed >= 125).view(np.int8) * np.int16(250)
+        self.sensed = np.where(lost, held, position)
+
+    # moves every robot for dt seconds (per robot) toward its target speed
+    # and turn rate.  with first order motor lag both approach the target
+    # as exp(-t/tau), so distance and heading change are exact (decay and
+    # lag from _lag(dt)); the robot moves along the chord of that arc
+    def _move(self, dt, decay, lag):
+        speed_error = self.speed - self.target_speed
+        turn_error = self.turn_rate - self.target_turn
+        distance = self.target_speed * dt
+        distance += speed_error * lag
+        half_turn = self.target_turn * dt
+        half_turn += turn_error * lag
+        half_turn *= 0.5
+        # chord / arc length is sin(half_turn) / half_turn; its series is
+        # good to 3e-5 up to a half turn of 0.7 radians (a 200 mS spin)
+        square = half_turn * half_turn
+        chord = square * (1.0 / 120)
+        chord -= 1.0 / 6
+        chord *= square
+        chord += 1.0
+        chord *= distance
+        self.heading += half_turn
+        self.x += chord * np.cos(self.heading)
+        self.y += chord * np.sin(self.heading)
+        self.heading += half_turn
+        speed_error *= decay
+        turn_error *= decay
+        self.speed = speed_error + self.target_speed
+        self.turn_rate = turn_error + self.target_turn
+
+    # one control tick for every robot, in the order of Track_Sim._drive():
+    # Mode_FollowPath.control_tick's table lookup with the reading from
+    # the last tick, the read for the next tick, a loop period of motion,
+    # then the tick's statistics and progress along the track.  returns
+    # the robots that were lost and that completed the goal distance
+    def step(self, goal):
+        position = self.sensed
+        index = self.table_base + position
+        if self.tick_number * self.min_loop_speed < self.max_ramp_time:
+            # base throttle still ramping up from rest (Motor_Ramp is linear)
+            scale = np.minimum(self.tick_number * self.loop_speed / self.ramp_time, 1.0)
+            scale = scale.astype(FLOAT)
+            drive = _useful(self.tables.throttles.take(index, axis=0) * scale[:, None])
+        else:
+            drive = self.tables.drive.take(index, axis=0)
+        drive *= self.gain  # wheel speeds, cm/s
+        self.target_speed = drive[:, 0] + drive[:, 1]
+        self.target_speed *= 0.5
+        self.target_turn = drive[:, 1] - drive[:, 0]
+        self.target_turn *= 1.0 / tracksim.WHEEL_SPACING_CM
+
+        if self.any_latency:
+            self._move(self.read_time, self.read_decay, self.read_lag)
+        self.sense()
+        self._move(self.rest_time, self.rest_decay, self.rest_lag)
+        self.tick_number += 1
+
+        offtrack = (position < 5) | (position > 245)
+        self.offtrack_ticks += offtrack
+        self.offtrack_run += 1
+        self.offtrack_run *= offtrack
+        on_line = ~(offtrack | self.bar_parallel)
+        self.sum_sq_offset += np.square(self.bar_offset) * on_line
+        self.num_on_line += on_line
+        # swings across the line (with hysteresis) for oscillation
+        swing = (position > 135).view(np.int8) - (position < 115).view(np.int8)
+        self.crossings += swing * self.side < 0
+        self.side = np.where(swing != 0, swing, self.side)
+
+        # progress along the track, of the axle's nearest centerline point
+        self.track_index = self._nearest(self.x, self.y, self.track_index)
+
+        lost = self.offtrack_run >= self.lost_ticks
+        return lost, ~lost & (self.track_index * self.point_spacing >= goal)
+
+    def run(self, laps=1, max_time=40.0, lost_time=1.0):
+        self.reset(max_time, lost_time)
+        goal = laps * self.track.length
+        while len(self.ids):
+            # once the ramp is over, with no noise a robot at rest can stay so.
+            # float32 rounding can hold a decaying motor lag at a denormal
+            # rather than let it reach zero, so anything that small is zero
+            at_rest = None
+            if not self.any_noise and (
+                self.tick_number * self.min_loop_speed >= self.max_ramp_time
+            ):
+                self.speed[np.abs(self.speed) < TINY] = 0
+                self.turn_rate[np.abs(self.turn_rate) < TINY] = 0
+                at_rest = self.speed == 0
+                at_rest &= self.turn_rate == 0
+                indexes = self.track_index, self.bar_index
+            lost, completed = self.step(goal)
+            timeout = self.tick_number >= self.max_ticks
+            done = self.active & (lost | completed | timeout)
+            if done.any():
+                rows = np.nonzero(done)[0]
+                self._finish(rows, completed[rows], lost[rows])
+            if at_rest is not None and at_rest.any():
+                self._finish_stopped(at_rest, *indexes)
+            if np.count_nonzero(self.active) < COMPACT_FRACTION * len(self.ids):
+                self._compact()
+
+        final = self.final
+        completed = final["completed"]
+        elapsed = final["num_ticks"] * self.init_loop_speed
+        ticks = np.maximum(final["num_ticks"], 1)
+        return {
+            "config": self.configs,
+            "completed": completed,
+            "lost": final["lost"],
+            "lap_time": np.where(completed, elapsed / laps, np.inf),
+            "distance_cm": final["travelled"],
+            "pct_offtrack": 100.0 * final["offtrack_ticks"] / ticks,
+            "rms_offset_cm": np.sqrt(
+                final["sum_sq_offset"] / np.maximum(final["num_on_line"], 1)
+            ),
+            "oscillation_hz": final["crossings"] / 2 / np.maximum(elapsed, 1e-3),
+            "sim_seconds": elapsed,
+        }
+
+
+def full_grid_configs(robot):
+    sizes = [len(sweep._options(robot.mode_config, p)) for p in SWEEP_PARAMS]
+    return np.array(list(itertools.product(*(range(n) for n in sizes))))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="simulate every config in one batch")
+    parser.add_argument("--track", default="oval", choices=sorted(tracksim.TRACKS))
+    parser.add_argument("--max-time", type=float, default=40.0)
+    parser.add_argument("--max-offtrack", type=float, default=2.0)
+    args = parser.parse_args(argv)
+
+    robot = tracksim.Sim_Robot()
+    configs = full_grid_configs(robot)
+    start = time.perf_counter()
+    sim = Batch_Sim(configs, args.track, robot=robot)
+    setup = time.perf_counter() - start
+    start = time.perf_counter()
+    result = sim.run(max_time=args.max_time)
+    wall = time.perf_counter() - start
+    print(
+        "{} configurations, {:.0f} simulated robot-seconds in {:.2f} s "
+        "({:.0f} configs/s) after {:.2f} s building steering tables".format(
+            sim.n, float(result["sim_seconds"].sum()), wall, sim.n / wall, setup
+        )
+    )
+    ok = result["completed"] & (result["pct_offtrack"] <= args.max_offtrack)
+    order = np.lexsort((result["rms_offset_cm"], result["lap_time"]))
+    order = order[ok[order]][:10]
+    print("{:>16} {:>8} {:>6} {:>6}".format("THR/LPS/RR/RL", "lap s", "off%", "rms"))
+    for i in order:
+        print(
+            "{:>16} {:8.2f} {:6.2f} {:6.2f}".format(
+                "/".join(str(v) for v in configs[i]),
+                result["lap_time"][i],
+                result["pct_offtrack"][i],
+                result["rms_offset_cm"][i],
+            )
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
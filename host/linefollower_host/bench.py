@@ -0,0 +1,426 @@
+"""
+# Controller for Line-Following Robot -- desktop (host side) tools
+#
+# Author(s): Don Korte
+# Module:  bench.py benchmarks the Mode_FollowPath control loop body
+#   (Mode_FollowPath.start_tick and run_tick, as run_mode calls them) on
+#   the hal_linux backend with the line sensor emulator, on a virtual
+#   clock that advances to each tick's deadline (so every tick is on
+#   time and every sensor read is ready, and only the CPU cost is left).
+#
+#   For every Runtime Disp setting x every loop_speed_options entry it
+#   reports:
+#     ticks/s and uS/tick  - best of several clean (unwrapped) passes
+#     per-phase uS/tick    - from an instrumented pass; each phase is the
+#                            time spent in those functions excluding
+#                            nested phases (wrapping adds some overhead,
+#                            so phases sum to a bit more than uS/tick)
+#     alloc bytes          - peak transient allocation in one tick, and
+#                            memory retained per tick (tracemalloc)
+#     calls/tick           - Python and builtin function calls per tick
+#                            (sys.setprofile)
+#
+#   Baselines are machine specific, so none is shipped: save one with
+#   --save-baseline, after which each run compares against it and fails
+#   (exit 1) if any case
+#     - dropped more than --ticks-tolerance plus its noise in ticks/s;
+#       ticks/s is compared relative to a fixed reference workload timed
+#       alongside each case (so the machine running slower or faster as
+#       a whole isn't a regression), and the noise is how far apart that
+#       case's repeated passes were, in the baseline run or this one,
+#       whichever is more
+#     - grew more than --tolerance in calls/tick, which with the seeded
+#       emulator and the virtual clock is the same on every run, so it
+#       catches small slowdowns that wall clock time can't tell from noise
+#
+#   usage:  python -m linefollower_host.bench [--ticks 2000] [--save-baseline]
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+from linefollower_host.hal_linux import REPO_DIR
+
+DEFAULT_BASELINE = os.path.join(REPO_DIR, "host", "bench_baseline.json")
+
+# phase name => (object attribute path on Sim_Robot, method names)
+PHASES = (
+    ("schedule", "mode_followpath.loop_scheduler", ("tick",)),
+    ("buttons", "mode_followpath", ("is_cancel_requested",)),
+    ("sensor", "mode_followpath", ("acquire_position",)),
+    ("steering", "mode_followpath", ("control_tick",)),
+    (
+        "dashboard",
+        "screen_dashboard",
+        ("show_line_position", "show_L_throttle", "show_R_throttle"),
+    ),
+    ("motors", "device_motors", ("move_forward_wheels_ramped",)),
+    ("telemetry", "mode_followpath", ("record_telemetry",)),
+)
+PHASE_NAMES = tuple(phase[0] for phase in PHASES)
+
+
+class Phase_Timer:
+    """wraps methods (on the instance) to accumulate exclusive time per
+    phase; time spent in a nested wrapped call is charged to that call's
+    phase only"""
+
+    def __init__(self):
+        self.totals = dict.fromkeys(PHASE_NAMES, 0.0)
+        self.stack = []
+        self.wrapped = []
+
+    def wrap(self, obj, method_name, phase):
+        method = getattr(obj, method_name)
+        timer = self
+
+        def timed(*args, **kwargs):
+            timer.stack.append(0.0)  # time used by nested phases
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = timer.stack.pop()
+                timer.totals[phase] += elapsed - nested
+                if timer.stack:
+                    timer.stack[-1] += elapsed
+
+        setattr(obj, method_name, timed)
+        self.wrapped.append((obj, method_name))
+
+    def unwrap(self):
+        for obj, method_name in self.wrapped:
+            delattr(obj, method_name)  # uncovers the class method again
+        self.wrapped = []
+
+
+def _resolve(robot, path):
+    obj = robot
+    for name in path.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+class Loop_Bench:
+    def __init__(self, robot, emulator, clock):
+        self.robot = robot
+        self.emulator = emulator
+        self.clock = clock
+        self.tick_number = 0
+
+    def start(self):
+        follow = self.robot.mode_followpath
+        follow.reset_run_stats()
+        follow.start_run_time = self.clock.monotonic()
+        self.robot.device_storage.clear_telemetry()
+        self.robot.device_linesense.start_quickposition_check()
+        follow.loop_scheduler.start(
+            self.robot.mode_config.get_loop_speed(),
+            self.robot.mode_config.get_overrun_policy(),
+        )
+
+    # runs num_ticks control ticks (Mode_FollowPath.start_tick, run_tick),
+    # advancing the clock to when run_mode would call each; returns wall
+    # clock seconds they took
+    def run(self, num_ticks):
+        follow = self.robot.mode_followpath
+        scheduler = follow.loop_scheduler
+        linesense = self.robot.device_linesense
+        clock = self.clock
+        emulator = self.emulator
+        elapsed = 0.0
+        for _ in range(num_ticks):
+            # line sweeps side to side so gauges actually change
+            self.tick_number += 1
+            emulator.true_position = 125 + 110 * math.sin(self.tick_number * 0.02)
+            remaining = scheduler.time_until_tick()
+            if remaining > 0:
+                clock.advance(remaining)
+            start = time.perf_counter()
+            start_loop_time = follow.start_tick()
+            elapsed += time.perf_counter() - start
+
+            remaining = linesense.time_until_quickposition_ready()
+            if remaining > 0:
+                clock.advance(remaining)
+            start = time.perf_counter()
+            follow.run_tick(start_loop_time)
+            elapsed += time.perf_counter() - start
+        return elapsed
+
+
+# a fixed pure Python workload (function calls, attribute and list
+# access, float math, like a tick's); its rate is how fast the machine is
+# running right now
+class _Reference:
+    def __init__(self):
+        self.values = [0.0] * 16
+        self.total = 0.0
+
+    def step(self, i):
+        self.values[i & 15] = self.values[(i + 1) & 15] * 0.5 + i
+        self.total += self.values[i & 15]
+
+
+def reference_rate(num_steps=20000, repeats=3):
+    reference = _Reference()
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(num_steps):
+            reference.step(i)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return num_steps / best
+
+
+def _make_bench():
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    import device_clock
+    import hal
+    from linefollower_host import linesense_emulator
+    from linefollower_host.tracksim import Sim_Robot
+
+    clock = device_clock.use_clock(device_clock.Virtual_Clock())
+    hal.install()
+    emulator = linesense_emulator.attach(seed=1)
+    robot = Sim_Robot()
+    return Loop_Bench(robot, emulator, clock)
+
+
+# measures one case (showdisp / loop_speed option indexes); returns a dict
+def bench_case(bench, showdisp_index, loop_speed_index, num_ticks, repeats):
+    mode_config = bench.robot.mode_config
+    mode_config.set_param_index("DSP", showdisp_index)
+    mode_config.set_param_index("LPS", loop_speed_index)
+    bench.start()
+    bench.run(200)  # warm up
+
+    best = None
+    worst = None
+    best_reference = 0.0
+    for _ in range(repeats):
+        # interleaved, so both see the machine at the same speed
+        best_reference = max(best_reference, reference_rate())
+        elapsed = bench.run(num_ticks)
+        if best is None or elapsed < best:
+            best = elapsed
+        if worst is None or elapsed > worst:
+            worst = elapsed
+
+    timer = Phase_Timer()
+    for phase, path, methods in PHASES:
+        obj = _resolve(bench.robot, path)
+        for method_name in methods:
+            timer.wrap(obj, method_name, phase)
+    try:
+        bench.run(num_ticks)
+    finally:
+        timer.unwrap()
+
+    tracemalloc.start()
+    peak = 0
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(num_ticks // 10):
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        bench.run(1)
+        tick_peak = tracemalloc.get_traced_memory()[1] - current
+        if tick_peak > peak:
+            peak = tick_peak
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    calls_per_tick = count_calls(bench, num_ticks)
+
+    us_per_tick = 1000000.0 * best / num_ticks
+    period = mode_config.get_loop_speed()
+    return {
+        "showdisp": mode_config.get_showdisp(),
+        "loop_speed": period,
+        "ticks_per_sec": num_ticks / best,
+        # ticks per reference step, comparable between runs
+        "relative_speed": num_ticks / best / best_reference,
+        # how much slower than the best the worst pass was (run noise)
+        "ticks_noise": (worst - best) / worst,
+        "us_per_tick": us_per_tick,
+        "pct_of_period": us_per_tick / (period * 10000.0),
+        "phases_us": {
+            name: 1000000.0 * total / num_ticks for name, total in timer.totals.items()
+        },
+        "alloc_peak_bytes": peak,
+        "retained_bytes_per_tick": retained / (num_ticks // 10),
+        "calls_per_tick": calls_per_tick,
+    }
+
+
+# function calls (Python and builtin) per tick, counted with
+# sys.setprofile; unlike wall clock time it doesn't depend on the machine
+# or what else it is doing
+def count_calls(bench, num_ticks):
+    count = [0]
+
+    def profile(frame, event, arg):
+        if (event == "call") or (event == "c_call"):
+            count[0] += 1
+
+    sys.setprofile(profile)
+    try:
+        bench.run(num_ticks)
+    finally:
+        sys.setprofile(None)
+    return count[0] / num_ticks
+
+
+def case_key(result):
+    return "{}/{}".format(result["showdisp"], result["loop_speed"])
+
+
+def run_suite(num_ticks=2000, repeats=5):
+    bench = _make_bench()
+    mode_config = bench.robot.mode_config
+    results = []
+    for showdisp_index in range(len(mode_config.showdisp_options)):
+        for loop_speed_index in range(len(mode_config.loop_speed_options)):
+            results.append(
+                bench_case(bench, showdisp_index, loop_speed_index, num_ticks, repeats)
+            )
+    return results
+
+
+def print_results(results):
+    print(
+        "{:>4} {:>6} {:>8} {:>7} {:>5} ".format("disp", "period", "ticks/s", "uS", "%per")
+        + " ".join("{:>6}".format(name[:6]) for name in PHASE_NAMES)
+        + " {:>6} {:>6} {:>7}".format("peakB", "keepB", "calls")
+    )
+    for r in results:
+        print(
+            "{:>4} {:6.3f} {:8.0f} {:7.1f} {:5.2f} ".format(
+                r["showdisp"],
+                r["loop_speed"],
+                r["ticks_per_sec"],
+                r["us_per_tick"],
+                r["pct_of_period"],
+            )
+            + " ".join("{:6.1f}".format(r["phases_us"][name]) for name in PHASE_NAMES)
+            + " {:6d} {:6.1f} {:7.1f}".format(
+                r["alloc_peak_bytes"], r["retained_bytes_per_tick"], r["calls_per_tick"]
+            )
+        )
+
+
+# returns list of (case, measure, baseline value, now value) that
+# regressed: ticks/s (relative to the reference workload) that dropped
+# more than ticks_tolerance plus the case's noise, or calls/tick that
+# grew more than tolerance (measures a baseline doesn't have are skipped)
+def compare_baseline(results, baseline, tolerance, ticks_tolerance):
+    regressions = []
+    for r in results:
+        key = case_key(r)
+        if key not in baseline:
+            continue
+        was = baseline[key]
+        if "relative_speed" in was:
+            noise = max(r["ticks_noise"], was["ticks_noise"])
+            floor = was["relative_speed"] * (1.0 - ticks_tolerance - noise)
+            if r["relative_speed"] < floor:
+                # reported in this machine's ticks/s at the baseline's speed
+                scale = r["ticks_per_sec"] / r["relative_speed"]
+                regressions.append(
+                    (
+                        key,
+                        "ticks/s",
+                        was["relative_speed"] * scale,
+                        r["ticks_per_sec"],
+                    )
+                )
+        if "calls_per_tick" not in was:
+            continue
+        ceiling = was["calls_per_tick"] * (1.0 + tolerance)
+        if r["calls_per_tick"] > ceiling:
+            regressions.append(
+                (key, "calls/tick", was["calls_per_tick"], r["calls_per_tick"])
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="benchmark the control loop body")
+    parser.add_argument("--ticks", type=int, default=2000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.02,
+        help="allowed calls/tick growth (0.02 = 2%%)",
+    )
+    parser.add_argument(
+        "--ticks-tolerance",
+        type=float,
+        default=0.15,
+        help="allowed ticks/s drop beyond the run noise (0.15 = 15%%)",
+    )
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.ticks, args.repeats)
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({case_key(r): r for r in results}, f, indent=1, sort_keys=True)
+        print("baseline saved to", args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print("no baseline (save one with --save-baseline)")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_baseline(
+        results, baseline, args.tolerance, args.ticks_tolerance
+    )
+    for key, measure, was, now in regressions:
+        print("REGRESSION {}: {:.1f} => {:.1f} {}".format(key, was, now, measure))
+    if regressions:
+        return 1
+    print("no regressions vs", args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,717 @@
+"""
+# Controller for Line-Following Robot -- desktop (host side) tools
+#
+# Author(s): Don Korte
+# Module:  hal_linux.py is the headless Linux backend for hal.py.  It
+#   registers stand-in modules for everything the robot code imports
+#   from CircuitPython (board, busio, bitbangio, pulseio, pwmio,
+#   analogio, digitalio, displayio, terminalio) and from the Adafruit libraries
+#   (adafruit_featherwing.minitft_featherwing, adafruit_motor.motor,
+#   adafruit_display_text.label, adafruit_display_shapes.*), so that
+#   code.py and the Device_/Mode_/Screen_ classes run unchanged under
+#   CPython.
+#
+#   Everything the fakes do is visible through the Linux_Backend object
+#   (hal_linux.backend) so tests, simulators and benchmarks can drive
+#   the inputs and look at the outputs:
+#     backend.i2c          - the shared Fake_I2C bus; attach() devices to it
+#     backend.buttons      - dict of seesaw button states (True = pressed)
+#     backend.set_voltage  - sets the voltage an AnalogIn pin reads
+#     backend.motors       - DCMotor instances, in creation order
+#     backend.display      - the MiniTFT display (no-op, or a framebuffer)
+#
+#   By default a minimal line sensor is attached at 0x32 that always
+#   reports a centered line; see linesense_emulator.py for a faithful one.
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import os
+import sys
+import types
+from collections import namedtuple
+
+# repository root (where code.py and the robot modules live)
+REPO_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+ENODEV = 19  # errno CircuitPython uses when an I2C address doesn't ACK
+
+LINESENSE_ADDRESS = 0x32
+SEESAW_ADDRESS = 0x5E
+SEESAW_READ_DELAY = 0.008  # adafruit_seesaw's wait between request and read
+
+BUTTON_FIELDS = ("up", "down", "left", "right", "a", "b", "select")
+Buttons = namedtuple("Buttons", BUTTON_FIELDS)
+
+# the backend installed by install(); None until then
+backend = None
+
+
+# ----------------------------------------------------------------------------
+# board / busio: pins and the shared I2C bus
+# ----------------------------------------------------------------------------
+
+
+class Pin:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "board." + self.name
+
+
+PIN_NAMES = (
+    "A0", "A1", "A2", "A3", "A4", "A5", "D4", "D5", "D6", "D9", "D10",
+    "D11", "D12", "D13", "SCL", "SDA", "SCK", "MOSI", "MISO", "TX", "RX",
+    "VOLTAGE_MONITOR", "NEOPIXEL",
+)
+
+
+class Fake_I2C:
+    """I2C bus with the busio.I2C interface.  Devices attached to it get
+    i2c_write(bytes) and i2c_read(nbytes) -> bytes calls and may raise
+    OSError to simulate a NACK or timeout.  A device that defines
+    i2c_write_then_read(bytes, nbytes) -> bytes gets writeto_then_readfrom
+    as that one call (one transaction, repeated start) instead.
+
+    timeout is the clock stretch limit in seconds, or None for none.
+    Only bitbangio.I2C(timeout=) sets one: board.I2C() and busio.I2C()
+    have none (busio ignores its timeout argument on the SAMD51), so a
+    device that stalls them stalls them for as long as it likes.  Devices
+    that can stall the bus get the limit through i2c_bus_timeout(seconds)
+    and stop stalling there, as bitbangio would give up."""
+
+    def __init__(self):
+        self.devices = {}
+        self.timeout = None
+        self.locked = False
+        self.num_transactions = 0
+        self.transactions_by_address = {}
+        self.num_errors = 0
+
+    def attach(self, address, device):
+        self.devices[address] = device
+        if hasattr(device, "i2c_bus_timeout"):
+            device.i2c_bus_timeout(self.timeout)
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+        for device in self.devices.values():
+            if hasattr(device, "i2c_bus_timeout"):
+                device.i2c_bus_timeout(timeout)
+
+    def detach(self, address):
+        self.devices.pop(address, None)
+
+    def try_lock(self):
+        if self.locked:
+            return False
+        self.locked = True
+        return True
+
+    def unlock(self):
+        self.locked = False
+
+    # a bus recovery deinits the bus; devices that can hang it (see
+    # linesense_emulator.py) are told through i2c_bus_reset()
+    def deinit(self):
+        self.locked = False
+        for device in self.devices.values():
+            if hasattr(device, "i2c_bus_reset"):
+                device.i2c_bus_reset()
+
+    def scan(self):
+        return sorted(self.devices)
+
+    def _device(self, address):
+        self.num_transactions += 1
+        self.transactions_by_address[address] = (
+            self.transactions_by_address.get(address, 0) + 1
+        )
+        device = self.devices.get(address)
+        if device is None:
+            self.num_errors += 1
+            raise OSError(ENODEV, "No such device")
+        return device
+
+    def writeto(self, address, buffer, *, start=0, end=None, stop=True):
+        device = self._device(address)
+        try:
+            device.i2c_write(bytes(buffer[start:end]))
+        except OSError:
+            self.num_errors += 1
+            raise
+
+    def readfrom_into(self, address, buffer, *, start=0, end=None):
+        device = self._device(address)
+        if end is None:
+            end = len(buffer)
+        try:
+            data = device.i2c_read(end - start)
+        except OSError:
+            self.num_errors += 1
+            raise
+        buffer[start:end] = data
+
+    def writeto_then_readfrom(
+        self,
+        address,
+        buffer_out,
+        buffer_in,
+        *,
+        out_start=0,
+        out_end=None,
+        in_start=0,
+        in_end=None
+    ):
+        device = self._device(address)
+        if in_end is None:
+            in_end = len(buffer_in)
+        try:
+            if hasattr(device, "i2c_write_then_read"):
+                data = device.i2c_write_then_read(
+                    bytes(buffer_out[out_start:out_end]), in_end - in_start
+                )
+            else:
+                device.i2c_write(bytes(buffer_out[out_start:out_end]))
+                data = device.i2c_read(in_end - in_start)
+        except OSError:
+            self.num_errors += 1
+            raise
+        buffer_in[in_start:in_end] = data
+
+
+class Static_LineSensor:
+    """Minimal stand-in for the ItsyBitsy line sensor: answers the 7 byte
+    register read with module id 83 and whatever position is set."""
+
+    def __init__(self, sensor_type=1, read_delay=2):
+        self.registers = bytearray([sensor_type, read_delay, 83, 0, 0, 125, 0])
+
+    def set_position(self, position):
+        self.registers[5] = position
+
+    def i2c_write(self, data):
+        if len(data) > 0 and data[0] == 0x01:
+            self.registers[3] = 1  # calibration "finishes" immediately
+
+    def i2c_read(self, nbytes):
+        return bytes(self.registers[:nbytes])
+
+
+class Fake_Seesaw:
+    """Answers the MiniTFT seesaw GPIO read with the backend button states
+    (buttons are active low, as on the real board)."""
+
+    # seesaw GPIO bit for each button on the MiniTFT featherwing
+    BUTTON_BITS = {
+        "up": 2, "down": 4, "left": 3, "right": 7, "a": 10, "b": 9, "select": 11,
+    }
+
+    def __init__(self, button_state):
+        self.button_state = button_state
+
+    def i2c_write(self, data):
+        pass
+
+    def i2c_read(self, nbytes):
+        bits = 0xFFFFFFFF
+        for name, bit in self.BUTTON_BITS.items():
+            if self.button_state.get(name):
+                bits &= ~(1 << bit)
+        return bits.to_bytes(4, "big")[:nbytes]
+
+
+# ----------------------------------------------------------------------------
+# pulseio / pwmio, analogio, digitalio, adafruit_motor
+# ----------------------------------------------------------------------------
+
+
+class PWMOut:
+    def __init__(self, pin, *, duty_cycle=0, frequency=500, variable_frequency=False):
+        self.pin = pin
+        self.duty_cycle = duty_cycle
+        self.frequency = frequency
+
+    def deinit(self):
+        pass
+
+
+class AnalogIn:
+    def __init__(self, pin):
+        self.pin = pin
+        self.reference_voltage = 3.3
+
+    @property
+    def value(self):
+        return backend.analog_values.get(self.pin.name, 0)
+
+    def deinit(self):
+        pass
+
+
+class Direction:
+    INPUT = "INPUT"
+    OUTPUT = "OUTPUT"
+
+
+class Pull:
+    UP = "UP"
+    DOWN = "DOWN"
+
+
+class DigitalInOut:
+    def __init__(self, pin):
+        self.pin = pin
+        self.direction = Direction.INPUT
+        self.pull = None
+        self.value = False
+
+    def switch_to_output(self, value=False, **kwargs):
+        self.direction = Direction.OUTPUT
+        self.value = value
+
+    def switch_to_input(self, pull=None):
+        self.direction = Direction.INPUT
+        self.pull = pull
+
+    def deinit(self):
+        pass
+
+
+class DCMotor:
+    def __init__(self, positive_pwm, negative_pwm):
+        self.positive_pwm = positive_pwm
+        self.negative_pwm = negative_pwm
+        self._throttle = None
+        self.num_writes = 0
+        backend.motors.append(self)
+
+    @property
+    def throttle(self):
+        return self._throttle
+
+    @throttle.setter
+    def throttle(self, value):
+        if value is not None and not -1.0 <= value <= 1.0:
+            raise ValueError("Throttle must be None or between -1.0 and +1.0")
+        self._throttle = value
+        self.num_writes += 1
+        duty = 0 if value is None else int(0xFFFF * abs(value))
+        if value is not None and value < 0:
+            self.positive_pwm.duty_cycle = 0
+            self.negative_pwm.duty_cycle = duty
+        else:
+            self.positive_pwm.duty_cycle = duty
+            self.negative_pwm.duty_cycle = 0
+
+
+# ----------------------------------------------------------------------------
+# displayio, terminalio, adafruit_display_text, adafruit_display_shapes
+# ----------------------------------------------------------------------------
+
+
+class _Displayed:
+    """base for things that can be put in a Group; counts property writes
+    made after construction (what dirty-tracking is meant to reduce)"""
+
+    _tracked = ()
+
+    def __setattr__(self, name, value):
+        if name in self._tracked and self.__dict__.get("_ready"):
+            backend.num_property_writes += 1
+        object.__setattr__(self, name, value)
+
+
+class Group(_Displayed):
+    _tracked = ("x", "y", "hidden")
+
+    def __init__(self, *, max_size=None, scale=1, x=0, y=0):
+        self.items = []
+        self.max_size = max_size
+        self.scale = scale
+        self.x = x
+        self.y = y
+        self.hidden = False
+        self._ready = True
+
+    def append(self, item):
+        if self.max_size is not None and len(self.items) >= self.max_size:
+            raise RuntimeError("Group full")
+        self.items.append(item)
+
+    def insert(self, index, item):
+        self.items.insert(index, item)
+
+    def remove(self, item):
+        self.items.remove(item)
+
+    def pop(self, index=-1):
+        return self.items.pop(index)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __getitem__(self, index):
+        return self.items[index]
+
+
+class Bitmap:
+    def __init__(self, width, height, value_count):
+        self.width = width
+        self.height = height
+        self.data = bytearray(width * height)
+
+    def __setitem__(self, index, value):
+        if isinstance(index, tuple):
+            index = index[1] * self.width + index[0]
+        self.data[index] = value
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            index = index[1] * self.width + index[0]
+        return self.data[index]
+
+
+class Palette:
+    def __init__(self, color_count):
+        self.colors = [0] * color_count
+
+    def __setitem__(self, index, value):
+        self.colors[index] = value
+
+    def __getitem__(self, index):
+        return self.colors[index]
+
+    def __len__(self):
+        return len(self.colors)
+
+
+class TileGrid(_Displayed):
+    _tracked = ("x", "y", "hidden")
+
+    def __init__(self, bitmap, *, pixel_shader, x=0, y=0, **kwargs):
+        self.bitmap = bitmap
+        self.pixel_shader = pixel_shader
+        self.x = x
+        self.y = y
+        self.hidden = False
+        self._ready = True
+
+
+def release_displays():
+    pass
+
+
+class _Font:
+    def get_bounding_box(self):
+        return (6, 14)
+
+
+class Label(_Displayed):
+    _tracked = ("x", "y", "color", "_text")
+
+    def __init__(self, font, *, text="", max_glyphs=None, color=0xFFFFFF,
+                 x=0, y=0, scale=1, **kwargs):
+        self.font = font
+        self.max_glyphs = max_glyphs
+        self.color = color
+        self.x = x
+        self.y = y
+        self.scale = scale
+        self._text = str(text)
+        self._ready = True
+
+    @property
+    def text(self):
+        return self._text
+
+    @text.setter
+    def text(self, value):
+        value = str(value)
+        if self.max_glyphs is not None and len(value) > self.max_glyphs:
+            raise RuntimeError("Text length exceeds max_glyphs")
+        self._text = value
+
+    @property
+    def bounding_box(self):
+        return (0, -7, 6 * len(self._text), 14)
+
+
+class Rect(_Displayed):
+    _tracked = ("x", "y", "width", "height", "fill", "outline")
+
+    def __init__(self, x, y, width, height, *, fill=None, outline=None, stroke=1):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.fill = fill
+        self.outline = outline
+        self.stroke = stroke
+        self._ready = True
+
+
+class RoundRect(Rect):
+    def __init__(self, x, y, width, height, r, *, fill=None, outline=None, stroke=1):
+        super().__init__(x, y, width, height, fill=fill, outline=outline, stroke=stroke)
+        self.r = r
+
+
+class Circle(_Displayed):
+    _tracked = ("x", "y", "fill", "outline")
+
+    def __init__(self, x0, y0, r, *, fill=None, outline=None, stroke=1):
+        self.r = r
+        self.x = x0 - r
+        self.y = y0 - r
+        self.fill = fill
+        self.outline = outline
+        self._ready = True
+
+
+class Line(_Displayed):
+    _tracked = ("x", "y", "color")
+
+    def __init__(self, x0, y0, x1, y1, color):
+        self.x = min(x0, x1)
+        self.y = min(y0, y1)
+        self.x0, self.y0, self.x1, self.y1 = x0, y0, x1, y1
+        self.color = color
+        self._ready = True
+
+
+class Triangle(_Displayed):
+    _tracked = ("x", "y", "fill", "outline")
+
+    def __init__(self, x0, y0, x1, y1, x2, y2, *, fill=None, outline=None):
+        self.x = min(x0, x1, x2)
+        self.y = min(y0, y1, y2)
+        self.fill = fill
+        self.outline = outline
+        self._ready = True
+
+
+class Fake_Display:
+    """MiniTFT display.  With framebuffer=True, show() and refresh() paint
+    the filled Rects, Circles and Lines of the shown group into
+    self.framebuffer (rows of 0xRRGGBB ints); text is not rendered."""
+
+    def __init__(self, width=160, height=80, framebuffer=False):
+        self.width = width
+        self.height = height
+        self.rotation = 0
+        self.auto_refresh = True
+        self.root_group = None
+        self.num_refreshes = 0
+        self.framebuffer = None
+        if framebuffer:
+            self.framebuffer = [[0] * width for _ in range(height)]
+
+    def show(self, group):
+        self.root_group = group
+        self._render()
+
+    def refresh(self, *, target_frames_per_second=60, minimum_frames_per_second=1):
+        self.num_refreshes += 1
+        self._render()
+        return True
+
+    def _render(self):
+        if self.framebuffer is None or self.root_group is None:
+            return
+        for row in self.framebuffer:
+            for x in range(self.width):
+                row[x] = 0
+        self._paint_group(self.root_group, 0, 0)
+
+    def _paint_group(self, group, ox, oy):
+        if group.hidden:
+            return
+        for item in group:
+            if isinstance(item, Group):
+                self._paint_group(item, ox + item.x, oy + item.y)
+            elif isinstance(item, Rect) and item.fill is not None:
+                self._fill(ox + item.x, oy + item.y, item.width, item.height, item.fill)
+            elif isinstance(item, Circle) and item.fill is not None:
+                r = item.r
+                cx, cy = ox + item.x + r, oy + item.y + r
+                for y in range(cy - r, cy + r + 1):
+                    for x in range(cx - r, cx + r + 1):
+                        if (x - cx) ** 2 + (y - cy) ** 2 <= r * r:
+                            self._plot(x, y, item.fill)
+            elif isinstance(item, Line) and item.x0 == item.x1:
+                self._fill(ox + item.x0, oy + min(item.y0, item.y1), 1,
+                           abs(item.y1 - item.y0) + 1, item.color)
+
+    def _fill(self, x0, y0, width, height, color):
+        for y in range(y0, y0 + height):
+            for x in range(x0, x0 + width):
+                self._plot(x, y, color)
+
+    def _plot(self, x, y, color):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.framebuffer[y][x] = color
+
+
+# ----------------------------------------------------------------------------
+# adafruit_featherwing.minitft_featherwing
+# ----------------------------------------------------------------------------
+
+
+class MiniTFTFeatherWing:
+    def __init__(self, address=SEESAW_ADDRESS, i2c=None, spi=None, cs=None, dc=None):
+        self._i2c = i2c if i2c is not None else backend.i2c
+        self._address = address
+        self._gpio = bytearray(4)
+        self.display = backend.display
+        self.backlight = 0
+
+    # like the real driver (adafruit_seesaw digital_read_bulk), each read
+    # of buttons writes the request, sleeps SEESAW_READ_DELAY while the
+    # seesaw fetches the pins, then reads the answer
+    @property
+    def buttons(self):
+        import device_clock
+
+        while not self._i2c.try_lock():
+            pass
+        try:
+            self._i2c.writeto(self._address, b"\x01\x04")
+        finally:
+            self._i2c.unlock()
+        device_clock.sleep(SEESAW_READ_DELAY)
+        while not self._i2c.try_lock():
+            pass
+        try:
+            self._i2c.readfrom_into(self._address, self._gpio)
+        finally:
+            self._i2c.unlock()
+        bits = int.from_bytes(self._gpio, "big")
+        return Buttons(
+            *(not bits & (1 << Fake_Seesaw.BUTTON_BITS[name]) for name in BUTTON_FIELDS)
+        )
+
+
+# ----------------------------------------------------------------------------
+# backend and module registration
+# ----------------------------------------------------------------------------
+
+
+class Linux_Backend:
+    def __init__(self, framebuffer=False):
+        self.i2c = Fake_I2C()
+        self.buttons = {name: False for name in BUTTON_FIELDS}
+        self.analog_values = {}
+        self.motors = []
+        self.num_property_writes = 0
+        self.display = Fake_Display(framebuffer=framebuffer)
+        self.linesense = Static_LineSensor()
+        self.i2c.attach(LINESENSE_ADDRESS, self.linesense)
+        self.i2c.attach(SEESAW_ADDRESS, Fake_Seesaw(self.buttons))
+        # fresh feather LiPo and motor AA pack, through the 2:1 dividers
+        self.set_voltage("VOLTAGE_MONITOR", 4.0)
+        self.set_voltage("A0", 5.8)
+
+    # sets what AnalogIn(board.<pin_name>).value reads for a battery voltage
+    # measured through the 2:1 divider (see device_battery.py)
+    def set_voltage(self, pin_name, volts):
+        value = int(volts / 2 / 3.3 * 65536)
+        self.analog_values[pin_name] = max(0, min(65535, value))
+
+    def press(self, button, pressed=True):
+        self.buttons[button] = pressed
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+# board.I2C() and busio.I2C(): the shared bus, with no clock stretch
+# limit (the SAMD51's busio ignores timeout)
+def _busio_I2C(scl=None, sda=None, *, frequency=100000, timeout=255):
+    backend.i2c.set_timeout(None)
+    return backend.i2c
+
+
+# bitbangio.I2C(): the shared bus, with the clock stretch limit (timeout,
+# uS) it was asked for, which bitbangio does enforce
+def _bitbangio_I2C(scl, sda, *, frequency=400000, timeout=255):
+    backend.i2c.set_timeout(timeout / 1000000)
+    return backend.i2c
+
+
+def install(framebuffer=False):
+    global backend
+    backend = Linux_Backend(framebuffer=framebuffer)
+
+    board = _module("board", I2C=_busio_I2C, SPI=lambda: None)
+    for name in PIN_NAMES:
+        setattr(board, name, Pin(name))
+    _module("busio", I2C=_busio_I2C)
+    _module("bitbangio", I2C=_bitbangio_I2C)
+    _module("pulseio", PWMOut=PWMOut)
+    _module("pwmio", PWMOut=PWMOut)
+    _module("analogio", AnalogIn=AnalogIn)
+    _module("digitalio", DigitalInOut=DigitalInOut, Direction=Direction, Pull=Pull)
+    _module(
+        "displayio",
+        Group=Group,
+        Bitmap=Bitmap,
+        Palette=Palette,
+        TileGrid=TileGrid,
+        release_displays=release_displays,
+    )
+    _module("terminalio", FONT=_Font())
+
+    label = _module("adafruit_display_text.label", Label=Label)
+    _module("adafruit_display_text", label=label)
+    shapes = _module("adafruit_display_shapes")
+    for submodule, cls in (
+        ("rect", Rect),
+        ("roundrect", RoundRect),
+        ("circle", Circle),
+        ("line", Line),
+        ("triangle", Triangle),
+    ):
+        setattr(
+            shapes,
+            submodule,
+            _module("adafruit_display_shapes." + submodule, **{cls.__name__: cls}),
+        )
+    minitft = _module(
+        "adafruit_featherwing.minitft_featherwing",
+        MiniTFTFeatherWing=MiniTFTFeatherWing,
+    )
+    _module("adafruit_featherwing", minitft_featherwing=minitft)
+    motor = _module("adafruit_motor.motor", DCMotor=DCMotor)
+    _module("adafruit_motor", motor=motor)
+    return backend
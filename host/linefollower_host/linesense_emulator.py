@@ -0,0 +1,707 @@
+"""
+# Controller for Line-Following Robot -- desktop (host side) tools
+#
+# Author(s): Don Korte
+# Module:  linesense_emulator.py emulates the ItsyBitsy line sensor
+#   processor as a device on the hal_linux fake I2C bus, so
+#   Device_LineSense (and its start_quickposition_check /
+#   get_quickposition pipelining) can be exercised on Linux.
+#
+#   Protocol (what the ItsyBitsy firmware does at address 0x32):
+#     write 0x01   - start calibration; byte 3 reads 0 until it finishes
+#     write 0x02   - start a read (conversion); the result shows up in
+#                    byte 5 conversion_time seconds later
+#     write 0x80 | n - (protocol 2) point reads at register n; it stays
+#                    there until the next 0x80 | n (0 after reset)
+#     read n bytes - registers from the pointer on: [0] sensor_type,
+#                    [1] read_delay (mS), [2] module id (83),
+#                    [3] calibrated flag, [4] protocol, [5] position
+#                    (0 => 250), [6] status
+#     write 0x02 then read (one transaction, repeated start) - the read
+#                    gets the registers as they were when the command
+#                    arrived, so byte 5 is the previous conversion's result
+#                    (a 0x80 | n write takes effect before the read)
+#
+#   protocol (register 4) is as set with the protocol argument:
+#     0 - no status or pointer, registers 4 and 6 read 0
+#     1 - status in register 6: bit 7 set when no conversion is in
+#         progress, bits 0-6 the number of completed conversions mod 128
+#     2 - status and the register pointer
+#     3 - those and the raw frame: register 7 the number of channels,
+#         then each channel's calibrated value (0 white => 255 black) for
+#         the line line_width channel spacings wide, from the same
+#         conversion as the position (which the firmware then works out
+#         from them, see _firmware_position)
+#
+#   Besides plain latency it can misbehave the ways the real one does:
+#     - reading before the conversion finished returns the previous
+#       (stale) position; these are counted in num_stale_reads
+#     - gaussian position noise
+#     - conversions taking anywhere from (1 - conversion_spread) to 1
+#       times conversion_time (the QTR sensors' read time depends on the
+#       surface under them; read_delay is the worst case)
+#     - NACK (OSError ENODEV) and bus timeout (the clock stretched for
+#       timeout_time, then OSError ETIMEDOUT) injected at random with the
+#       given probabilities, or deterministically with inject_fault(); on
+#       a bus with a clock stretch limit (bitbangio.I2C's timeout, see
+#       hal_linux.Fake_I2C) the stretch is cut off there instead, with
+#       bitbangio's TimeoutError; busio.I2C has no such limit
+#     - a hung bus (FAULT_STUCK, or stuck_probability): every transaction
+#       then times out until the bus is recovered (Device_I2CBus.recover
+#       deinits the bus, which Fake_I2C passes on as i2c_bus_reset())
+#
+#   usage:  python -m linefollower_host.linesense_emulator [--ticks 500]
+#             [--scenario NAME] [--seed 1] [--no-accuracy]
+#     runs the quick-position pipeline against the emulator in a few
+#     scenarios and prints stale reads, faults and cost per call; the
+#     status scenarios compare the fixed and adaptive waits (polls: extra
+#     reads for a fresh result, s.ret: stale results returned anyway,
+#     wait: read_wait at the end, in mS); the pointer scenarios show the
+#     bus time saved reading 2 bytes per tick instead of 7 (B/tick: bytes
+#     on the bus, address bytes included); max uS is the longest tick
+#     spent in the sensor calls: the bus manager (device_i2cbus.py)
+#     bit-bangs the bus with a clock stretch limit, so a stalled
+#     transaction is cut off at that bus timeout and retried only if the
+#     slack allows, and a failing bus costs a tick about a bus timeout
+#     per attempt
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import argparse
+import contextlib
+import io
+import random
+import sys
+import time
+
+from linefollower_host.hal_linux import REPO_DIR
+
+# errno values CircuitPython raises for I2C failures
+ENODEV = 19  # address not acknowledged
+ETIMEDOUT = 110  # clock stretched past the bus timeout
+
+MODULE_ID = 83
+CMD_CALIBRATE = 0x01
+CMD_READ = 0x02
+CMD_SET_POINTER = 0x80
+REG_POSITION = 5
+STATUS_READY = 0x80
+STATUS_SEQUENCE = 0x7F
+
+FAULT_NACK = "NACK"
+FAULT_TIMEOUT = "TIMEOUT"
+FAULT_STUCK = "STUCK"
+
+
+# the robot's clock service (device_clock.py), looked up at each call so a
+# clock installed later with device_clock.use_clock() is followed too
+def _device_clock():
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    import device_clock
+
+    return device_clock
+
+
+def _monotonic():
+    return _device_clock().monotonic()
+
+
+def _sleep(seconds):
+    _device_clock().sleep(seconds)
+
+
+class LineSense_Emulator:
+    def __init__(
+        self,
+        sensor_type=1,
+        read_delay=2,
+        conversion_time=None,
+        calibration_time=3.0,
+        noise=0.0,
+        nack_probability=0.0,
+        timeout_probability=0.0,
+        timeout_time=0.01,
+        stuck_probability=0.0,
+        transaction_time=0.0,
+        byte_time=0.0,
+        conversion_spread=0.0,
+        protocol=0,
+        num_channels=8,
+        line_width=2.0,
+        channel_noise=0.0,
+        position_source=None,
+        clock=None,
+        sleep=None,
+        seed=None,
+    ):
+        self.sensor_type = sensor_type
+        self.read_delay = read_delay  # mS, as advertised in register 1
+        if conversion_time is None:
+            conversion_time = 0.001 * read_delay
+        self.conversion_time = conversion_time  # actual seconds per read
+        self.calibration_time = calibration_time
+        self.noise = noise  # std deviation of position noise (0 => 250 units)
+        self.nack_probability = nack_probability
+        self.timeout_probability = timeout_probability
+        self.timeout_time = timeout_time  # seconds a timeout stalls the bus
+        self.bus_timeout = None  # the bus's clock stretch limit, if any
+        self.stuck_probability = stuck_probability
+        self.stuck = False  # bus hung til i2c_bus_reset()
+        self.transaction_time = transaction_time  # bus time per transaction
+        self.byte_time = byte_time  # and per byte (address byte included)
+        self.conversion_spread = conversion_spread
+        self.protocol = protocol
+        self.num_channels = num_channels  # raw frame (protocol 3)
+        self.line_width = line_width  # in channel spacings
+        self.channel_noise = channel_noise  # std deviation, 0 => 255 units
+        self.pointer = 0
+        # callable returning the true position (0 => 250); default centered
+        self.position_source = position_source
+        self.true_position = 125
+        # default is device_clock's (so it follows a virtual clock too)
+        self.clock = clock if clock is not None else _monotonic
+        self.sleep = sleep if sleep is not None else _sleep
+        self.random = random.Random(seed)
+
+        self.calibrated = 0
+        self.calibration_done_at = None
+        self.position = 125  # last completed conversion
+        self.pending_position = None
+        self.frame = bytes(num_channels)  # last completed conversion's
+        self.pending_frame = None
+        self.conversion_done_at = None
+        self.injected_faults = []
+
+        self.num_commands = 0
+        self.num_reads = 0
+        self.num_conversions = 0
+        self.num_stale_reads = 0
+        self.num_faults = 0
+        self.num_bytes = 0
+        self.num_bus_resets = 0
+
+    def set_position(self, position):
+        self.true_position = position
+
+    # makes the next count transactions fail with kind (FAULT_NACK,
+    # FAULT_TIMEOUT or FAULT_STUCK), regardless of the random fault probabilities
+    def inject_fault(self, kind, count=1):
+        self.injected_faults.extend([kind] * count)
+
+    # true position (may be off the ends of the sensor) plus noise
+    def _sample_line(self):
+        if self.position_source is not None:
+            position = self.position_source()
+        else:
+            position = self.true_position
+        if self.noise > 0:
+            position += self.random.gauss(0, self.noise)
+        return position
+
+    # the position byte as the firmware works it out from the channel
+    # values (as Pololu's readLine does): average of channel numbers
+    # weighted by values over 50, or the end the line was last seen past
+    # if no value is over 200
+    def _firmware_position(self, frame):
+        total = moment = 0
+        on_line = False
+        for channel, value in enumerate(frame):
+            if value > 200:
+                on_line = True
+            if value > 50:
+                total += value
+                moment += value * channel
+        if not on_line:
+            return 0 if self.position < 125 else 250
+        return int(moment * 250 / (total * (self.num_channels - 1)))
+
+    # calibrated channel values for the line at position: each channel
+    # sees a one spacing wide strip, 255 if it is all line, 0 if all floor
+    def _frame(self, position):
+        center = position * (self.num_channels - 1) / 250.0
+        left = center - self.line_width / 2
+        right = center + self.line_width / 2
+        values = []
+        for channel in range(self.num_channels):
+            covered = min(channel + 0.5, right) - max(channel - 0.5, left)
+            value = 255 * max(0.0, covered)
+            if self.channel_noise > 0:
+                value += self.random.gauss(0, self.channel_noise)
+            values.append(max(0, min(255, int(round(value)))))
+        return bytes(values)
+
+    # finishes calibration / conversion if their time has come
+    def _update(self, now):
+        if self.calibration_done_at is not None and now >= self.calibration_done_at:
+            self.calibrated = 1
+            self.calibration_done_at = None
+        if self.conversion_done_at is not None and now >= self.conversion_done_at:
+            self.position = self.pending_position
+            self.frame = self.pending_frame
+            self.conversion_done_at = None
+            self.num_conversions += 1
+
+    # decides whether this transaction (of nbytes bytes on the bus) fails;
+    # raises like busio.I2C would
+    def _transaction(self, nbytes):
+        self.num_bytes += nbytes
+        bus_time = self.transaction_time + self.byte_time * nbytes
+        if bus_time > 0:
+            self.sleep(bus_time)
+        fault = None
+        if self.stuck:
+            fault = FAULT_TIMEOUT
+        elif self.injected_faults:
+            fault = self.injected_faults.pop(0)
+        elif self.nack_probability and self.random.random() < self.nack_probability:
+            fault = FAULT_NACK
+        elif (
+            self.timeout_probability
+            and self.random.random() < self.timeout_probability
+        ):
+            fault = FAULT_TIMEOUT
+        elif self.stuck_probability and self.random.random() < self.stuck_probability:
+            fault = FAULT_STUCK
+        if fault is None:
+            return
+        self.num_faults += 1
+        if fault == FAULT_STUCK:
+            self.stuck = True
+            fault = FAULT_TIMEOUT
+        if fault == FAULT_TIMEOUT:
+            if (self.bus_timeout is not None) and (
+                self.bus_timeout < self.timeout_time
+            ):
+                # bitbangio gives up on the stretch
+                self.sleep(self.bus_timeout)
+                raise TimeoutError("Clock stretch too long")
+            self.sleep(self.timeout_time)
+            raise OSError(ETIMEDOUT, "I2C timeout")
+        raise OSError(ENODEV, "No such device")
+
+    # called by Fake_I2C for writeto
+    def i2c_write(self, data):
+        self._transaction(1 + len(data))
+        now = self.clock()
+        self._update(now)
+        self._command(data, now)
+
+    def _command(self, data, now):
+        if len(data) == 0:
+            return
+        self.num_commands += 1
+        command = data[0]
+        if (command & CMD_SET_POINTER) and self.protocol >= 2:
+            self.pointer = command & ~CMD_SET_POINTER
+        elif command == CMD_CALIBRATE:
+            self.calibrated = 0
+            self.calibration_done_at = now + self.calibration_time
+        elif command == CMD_READ:
+            # a new read restarts any conversion still in progress
+            line = self._sample_line()
+            if self.protocol >= 3:
+                self.pending_frame = self._frame(line)
+                self.pending_position = self._firmware_position(self.pending_frame)
+            else:
+                self.pending_position = max(0, min(250, int(round(line))))
+                self.pending_frame = self.frame
+            conversion_time = self.conversion_time
+            if self.conversion_spread > 0:
+                conversion_time *= 1 - self.conversion_spread * self.random.random()
+            self.conversion_done_at = now + conversion_time
+
+    # called by Fake_I2C for readfrom_into
+    def i2c_read(self, nbytes):
+        self._transaction(1 + nbytes)
+        self._update(self.clock())
+        return self._registers(nbytes)
+
+    # called by Fake_I2C for writeto_then_readfrom: the firmware acts on the
+    # command when it arrives, but a read conversion takes conversion_time,
+    # so the registers read back in the same transaction hold the previous
+    # conversion's result (stale only if that one hadn't finished either);
+    # moving the register pointer does take effect before the read
+    def i2c_write_then_read(self, data, nbytes):
+        self._transaction(2 + len(data) + nbytes)
+        now = self.clock()
+        self._update(now)
+        if len(data) and (data[0] & CMD_SET_POINTER):
+            self._command(data, now)
+            return self._registers(nbytes)
+        registers = self._registers(nbytes)
+        self._command(data, now)
+        return registers
+
+    # called by Fake_I2C when the bus is deinit'ed (as a bus recovery
+    # does); frees a hung bus
+    def i2c_bus_reset(self):
+        self.stuck = False
+        self.num_bus_resets += 1
+
+    # called by Fake_I2C with the bus's clock stretch limit (seconds, or
+    # None for busio's none); a stall ends there, with the bus timing out
+    def i2c_bus_timeout(self, timeout):
+        self.bus_timeout = timeout
+
+    # nbytes of the registers from the pointer on (0 past the last one)
+    def _registers(self, nbytes):
+        self.num_reads += 1
+        pointer = self.pointer
+        if (self.conversion_done_at is not None) and (
+            pointer <= REG_POSITION < pointer + nbytes
+        ):
+            self.num_stale_reads += 1
+        protocol = status = 0
+        if self.protocol >= 1:
+            protocol = self.protocol
+            status = self.num_conversions & STATUS_SEQUENCE
+            if self.conversion_done_at is None:
+                status |= STATUS_READY
+        registers = bytes(
+            (
+                self.sensor_type,
+                self.read_delay,
+                MODULE_ID,
+                self.calibrated,
+                protocol,
+                self.position,
+                status,
+            )
+        )
+        if self.protocol >= 3:
+            registers += bytes((self.num_channels,)) + self.frame
+        registers = registers[pointer : pointer + nbytes]
+        return registers + bytes(nbytes - len(registers))
+
+    def get_stats(self):
+        return {
+            "commands": self.num_commands,
+            "reads": self.num_reads,
+            "conversions": self.num_conversions,
+            "stale_reads": self.num_stale_reads,
+            "faults": self.num_faults,
+            "bytes": self.num_bytes,
+            "bus_resets": self.num_bus_resets,
+        }
+
+
+# puts an emulator on the hal_linux fake bus in place of the default
+# static sensor (hal.install() must have been called)
+def attach(emulator=None, address=0x32, **kwargs):
+    from linefollower_host import hal_linux
+
+    if emulator is None:
+        emulator = LineSense_Emulator(**kwargs)
+    hal_linux.backend.i2c.attach(address, emulator)
+    hal_linux.backend.linesense = emulator
+    return emulator
+
+
+# runs num_ticks start_quickposition_check / get_quickposition cycles the
+# way Mode_FollowPath does; wait_ready=False reads as soon as the loop
+# period is up even if the sensor isn't ready, combined=True does each
+# cycle as one write_then_read transaction.  returns a stats dict
+def stress_quickposition(
+    device_linesense,
+    emulator,
+    num_ticks=500,
+    loop_period=0.003,
+    wait_ready=True,
+    combined=False,
+):
+    call_time = 0.0
+    max_call_time = 0.0
+    next_tick = time.monotonic()
+
+    # slack as the runtime would report it: time left until the tick
+    # after the one running
+    def slack():
+        return next_tick + loop_period - time.monotonic()
+
+    i2c_bus = device_linesense.i2c_bus
+    i2c_bus.set_slack_function(slack)
+    i2c_bus.reset_stats()
+    num_failed = device_linesense.get_num_failed()
+    emulator.num_stale_reads = 0
+    emulator.num_reads = 0
+    emulator.num_faults = 0
+    emulator.num_bytes = 0
+    device_linesense.num_stale = 0
+    device_linesense.num_polls = 0
+    device_linesense.combined = combined
+    device_linesense.start_quickposition_check()
+    run_start = time.monotonic()
+    for _ in range(num_ticks):
+        next_tick += loop_period
+        delay = next_tick - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        if wait_ready:
+            delay = device_linesense.time_until_quickposition_ready()
+            if delay > 0:
+                time.sleep(delay)
+        start = time.monotonic()
+        device_linesense.cycle_quickposition()
+        this_call_time = time.monotonic() - start
+        call_time += this_call_time
+        if this_call_time > max_call_time:
+            max_call_time = this_call_time
+        # the runtime's i2c job, in the slack after the tick
+        i2c_bus.service()
+    stats = emulator.get_stats()
+    stats["errors"] = device_linesense.get_num_failed() - num_failed
+    stats["max_us"] = 1000000.0 * max_call_time
+    stats["recoveries"] = i2c_bus.num_recoveries
+    stats["us_per_tick"] = 1000000.0 * call_time / num_ticks
+    stats["bytes_per_tick"] = emulator.num_bytes / num_ticks
+    stats["ms_per_tick"] = 1000.0 * (time.monotonic() - run_start) / num_ticks
+    stats["stale_returned"] = device_linesense.get_num_stale_reads()
+    stats["polls"] = device_linesense.get_num_polls()
+    stats["read_wait_ms"] = 1000.0 * device_linesense.get_read_wait()
+    return stats
+
+
+# steps the line across (and off both ends of) the sensor, reading each
+# position with device_linesense's current set_estimator mode; returns
+# mean abs position error on the sensor (in position units), and the
+# fraction of readings off the sensor that are reported lost and of those
+# on it that are not
+def estimator_accuracy(device_linesense, emulator, step=0.37, margin=60.0):
+    errors = []
+    lost_ok = []
+    found_ok = []
+    position = -margin
+    while position <= 250.0 + margin:
+        emulator.set_position(position)
+        device_linesense.get_position()
+        reported = device_linesense.get_fine_position()
+        lost = device_linesense.is_line_lost()
+        # the line is off the sensor once it no longer covers an end channel
+        spacing = 250.0 / (emulator.num_channels - 1)
+        off = (position < -spacing * (emulator.line_width / 2 + 0.5)) or (
+            position > 250.0 + spacing * (emulator.line_width / 2 + 0.5)
+        )
+        if off:
+            lost_ok.append(lost)
+        elif 5 <= position <= 245:
+            found_ok.append(not lost)
+            errors.append(abs(reported - position))
+        position += step
+    return {
+        "mean_error": sum(errors) / len(errors),
+        "max_error": max(errors),
+        "lost_detected": sum(lost_ok) / len(lost_ok),
+        "found_detected": sum(found_ok) / len(found_ok),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="run the quick-position pipeline against the line sensor emulator"
+    )
+    parser.add_argument("--ticks", type=int, default=500, help="ticks per scenario")
+    parser.add_argument(
+        "--scenario",
+        default=None,
+        help="only run scenarios whose name contains this",
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--no-accuracy",
+        action="store_true",
+        help="skip the position estimator accuracy table",
+    )
+    args = parser.parse_args(argv)
+
+    if REPO_DIR not in sys.path:
+        sys.path.insert(0, REPO_DIR)
+    import hal
+
+    hal.install()
+    emulator = attach(read_delay=2, seed=args.seed)
+    from device_linesense import Device_LineSense, LATEST_PROTOCOL
+
+    # the sensor advertises read_delay 3 mS but its reads take 1-2 mS;
+    # bus time is 400 kHz I2C's 22.5 uS per byte
+    status = dict(
+        protocol=1,
+        read_delay=3,
+        conversion_time=0.002,
+        conversion_spread=0.5,
+        byte_time=0.0000225,
+    )
+    pointer = dict(status, protocol=2)
+    scenarios = (
+        ("pipelined, wait ready", dict(), dict(loop_period=0.003), dict()),
+        ("read early", dict(), dict(loop_period=0.001, wait_ready=False), dict()),
+        ("combined", dict(), dict(loop_period=0.003, combined=True), dict()),
+        (
+            "combined, read early",
+            dict(),
+            dict(loop_period=0.001, wait_ready=False, combined=True),
+            dict(),
+        ),
+        (
+            "slow sensor (3 mS)",
+            dict(conversion_time=0.003),
+            dict(loop_period=0.003),
+            dict(),
+        ),
+        ("noise 5", dict(noise=5.0), dict(loop_period=0.003), dict()),
+        ("1% NACK", dict(nack_probability=0.01), dict(loop_period=0.003), dict()),
+        (
+            "1% timeout",
+            dict(timeout_probability=0.01),
+            dict(loop_period=0.003),
+            dict(),
+        ),
+        # hangs til recovered; every transaction stalls til the bus timeout
+        (
+            "bus hangs",
+            dict(stuck_probability=0.005),
+            dict(loop_period=0.003),
+            dict(),
+        ),
+        # back to back reads, so the wait for each is what limits the rate
+        ("status, fixed wait", status, dict(loop_period=0), dict(adaptive=False)),
+        ("status, adaptive wait", status, dict(loop_period=0), dict(adaptive=True)),
+        (
+            "status, read early",
+            status,
+            dict(loop_period=0.001, wait_ready=False),
+            dict(adaptive=False),
+        ),
+        ("pointer, adaptive wait", pointer, dict(loop_period=0), dict(adaptive=True)),
+        (
+            "pointer, combined",
+            pointer,
+            dict(loop_period=0, combined=True),
+            dict(adaptive=True),
+        ),
+    )
+    print(
+        (
+            "{:<22} {:>6} {:>6} {:>6} {:>6} {:>8} {:>8} {:>5}"
+            " {:>6} {:>6} {:>6} {:>7} {:>6}"
+        ).format(
+            "scenario",
+            "reads",
+            "stale",
+            "faults",
+            "errors",
+            "uS/tick",
+            "max uS",
+            "recov",
+            "polls",
+            "s.ret",
+            "wait",
+            "mS/tick",
+            "B/tick",
+        )
+    )
+    for name, emulator_settings, run_settings, device_settings in scenarios:
+        if (args.scenario is not None) and (args.scenario not in name):
+            continue
+        emulator.read_delay = 2
+        emulator.conversion_time = 0.001 * emulator.read_delay
+        emulator.conversion_spread = 0.0
+        emulator.protocol = 0
+        emulator.pointer = 0  # as if the sensor was reset
+        emulator.byte_time = 0.0
+        emulator.noise = 0.0
+        emulator.nack_probability = 0.0
+        emulator.timeout_probability = 0.0
+        emulator.timeout_time = 0.01
+        emulator.stuck_probability = 0.0
+        emulator.stuck = False
+        # made per scenario, since it reads the sensor's protocol at startup
+        # (before any faults are switched on)
+        for setting, value in emulator_settings.items():
+            if not setting.endswith("_probability"):
+                setattr(emulator, setting, value)
+        with contextlib.redirect_stdout(io.StringIO()):
+            device_linesense = Device_LineSense(
+                None, max_protocol=LATEST_PROTOCOL, **device_settings
+            )
+        for setting, value in emulator_settings.items():
+            setattr(emulator, setting, value)
+        stats = stress_quickposition(
+            device_linesense, emulator, num_ticks=args.ticks, **run_settings
+        )
+        print(
+            (
+                "{:<22} {:>6} {:>6} {:>6} {:>6} {:>8.1f} {:>8.1f} {:>5}"
+                " {:>6} {:>6} {:>6.2f} {:>7.2f} {:>6.1f}"
+            ).format(
+                name,
+                stats["reads"],
+                stats["stale_reads"],
+                stats["faults"],
+                stats["errors"],
+                stats["us_per_tick"],
+                stats["max_us"],
+                stats["recoveries"],
+                stats["polls"],
+                stats["stale_returned"],
+                stats["read_wait_ms"],
+                stats["ms_per_tick"],
+                stats["bytes_per_tick"],
+            )
+        )
+
+    if args.no_accuracy:
+        return 0
+    print()
+    print(
+        "{:<22} {:>8} {:>8} {:>8} {:>8}".format(
+            "position (protocol 3)", "mean err", "max err", "lost ok", "found ok"
+        )
+    )
+    for channel_noise in (0.0, 8.0):
+        emulator.__init__(
+            protocol=3, channel_noise=channel_noise, read_delay=1, seed=args.seed
+        )
+        with contextlib.redirect_stdout(io.StringIO()):
+            device_linesense = Device_LineSense(None, max_protocol=LATEST_PROTOCOL)
+        for mode in ("Sensor", "Centroid", "Quadratic"):
+            device_linesense.set_estimator(mode)
+            stats = estimator_accuracy(device_linesense, emulator)
+            print(
+                "{:<22} {:>8.2f} {:>8.2f} {:>8.2f} {:>8.2f}".format(
+                    "{}, noise {:g}".format(mode, channel_noise),
+                    stats["mean_error"],
+                    stats["max_error"],
+                    stats["lost_detected"],
+                    stats["found_detected"],
+                )
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
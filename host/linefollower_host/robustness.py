@@ -0,0 +1,266 @@
+"""
+# Controller for Line-Following Robot -- desktop (host side) tools
+#
+# Author(s): Don Korte
+# Module:  robustness.py is a Monte Carlo robustness check of Mode_Config
+#   settings.  Each configuration is run many times in batchsim, each
+#   copy on a randomly perturbed robot, drawn from the ranges in
+#   Perturbations:
+#     motor mismatch - each wheel's gain off by a gaussian percentage
+#                      (around the nominal mismatch motorCalibrateR
+#                      corrects for)
+#     sensor latency - time from start_quickposition_check to the
+#                      reading being taken, uniform over a range of mS
+#     position noise - gaussian, std deviation uniform over a range
+#     battery sag    - speed scale uniform over a range (1.0 = full)
+#     line width     - tape width uniform over a range of cm
+#
+#   Every configuration is run on the same sample of perturbed robots.
+#   For every configuration it reports the success probability (the lap
+#   finished, not lost, offtrack under the limit) and the lap time
+#   distribution of the successful copies.  Configurations are ranked
+#   by their 90th percentile lap time among those reaching the required
+#   success probability, so the pick is fast on most robots in a fleet
+#   rather than only on the nominal one.
+#
+#   usage:  python -m linefollower_host.robustness [--samples 200]
+#              [--candidates 40] [--config lfconfig.json] [--output file]
+#     with --config only that configuration is checked; otherwise the
+#     fastest --candidates configurations of a nominal full-grid batch
+#     run are
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from linefollower_host import batchsim
+from linefollower_host import tracksim
+from linefollower_host.sweep import SWEEP_PARAMS
+
+LAP_PERCENTILES = (10, 50, 90)
+
+
+class Perturbations:
+    """ranges the robot-to-robot (and run-to-run) variation is drawn from"""
+
+    def __init__(
+        self,
+        motor_mismatch_pct=5.0,
+        sensor_latency_ms=(0.0, 4.0),
+        noise=(0.0, 4.0),
+        speed_scale=(0.8, 1.0),
+        line_width_cm=(1.5, 2.5),
+    ):
+        self.motor_mismatch_pct = motor_mismatch_pct  # std deviation per wheel
+        self.sensor_latency_ms = sensor_latency_ms
+        self.noise = noise  # position units (0 => 250)
+        self.speed_scale = speed_scale
+        self.line_width_cm = line_width_cm
+
+    # Batch_Sim keyword arguments for n randomly perturbed robots
+    def sample(self, n, rng, motor_gain_L=1.0, motor_gain_R=1.0 / 0.95):
+        mismatch = self.motor_mismatch_pct / 100.0
+        return {
+            "motor_gain_L": motor_gain_L * (1.0 + mismatch * rng.standard_normal(n)),
+            "motor_gain_R": motor_gain_R * (1.0 + mismatch * rng.standard_normal(n)),
+            "sensor_latency": 0.001 * rng.uniform(*self.sensor_latency_ms, n),
+            "noise": rng.uniform(*self.noise, n),
+            "speed_scale": rng.uniform(*self.speed_scale, n),
+            "line_width_cm": rng.uniform(*self.line_width_cm, n),
+        }
+
+
+# runs samples perturbed copies of every configuration (C x 4 option
+# indexes in SWEEP_PARAMS order); returns a list of per-configuration
+# summary dicts, in the order of configs
+def check_configs(
+    configs,
+    samples=200,
+    track="oval",
+    perturbations=None,
+    robot=None,
+    max_offtrack=2.0,
+    max_time=40.0,
+    seed=None,
+):
+    configs = np.asarray(configs, dtype=np.int64).reshape(-1, 4)
+    if perturbations is None:
+        perturbations = Perturbations()
+    rng = np.random.default_rng(seed)
+    # every configuration runs on the same sample of robots, so differences
+    # between configurations aren't just differences between their samples
+    robots = perturbations.sample(samples, rng)
+    sim = batchsim.Batch_Sim(
+        np.repeat(configs, samples, axis=0),
+        track,
+        robot=robot,
+        seed=rng.integers(1 << 31),
+        **{name: np.tile(value, len(configs)) for name, value in robots.items()}
+    )
+    result = sim.run(max_time=max_time)
+
+    shape = (len(configs), samples)
+    success = (result["completed"] & (result["pct_offtrack"] <= max_offtrack)).reshape(
+        shape
+    )
+    lap_time = result["lap_time"].reshape(shape)
+    lost = result["lost"].reshape(shape)
+    pct_offtrack = result["pct_offtrack"].reshape(shape)
+    summaries = []
+    for i, config in enumerate(configs):
+        laps = lap_time[i][success[i]]
+        summary = {
+            "config": dict(zip(SWEEP_PARAMS, (int(v) for v in config))),
+            "samples": samples,
+            "p_success": float(success[i].mean()),
+            "p_lost": float(lost[i].mean()),
+            "mean_pct_offtrack": float(pct_offtrack[i].mean()),
+        }
+        if len(laps):
+            summary["lap_mean"] = float(laps.mean())
+            summary["lap_std"] = float(laps.std())
+            for p, value in zip(LAP_PERCENTILES, np.percentile(laps, LAP_PERCENTILES)):
+                summary["lap_p{}".format(p)] = float(value)
+        else:
+            summary["lap_mean"] = summary["lap_std"] = float("inf")
+            for p in LAP_PERCENTILES:
+                summary["lap_p{}".format(p)] = float("inf")
+        summaries.append(summary)
+    return summaries
+
+
+# summaries sorted by 90th percentile lap time; those below min_success
+# come after all that reach it (most successful first)
+def ranked(summaries, min_success=0.95):
+    return sorted(
+        summaries,
+        key=lambda s: (
+            s["p_success"] < min_success,
+            s["lap_p90"] if s["p_success"] >= min_success else -s["p_success"],
+            s["lap_p50"],
+        ),
+    )
+
+
+# the fastest count configurations of a nominal (unperturbed) batch run
+# over the full option grid
+def nominal_candidates(robot, track, count, max_offtrack=2.0, max_time=40.0):
+    configs = batchsim.full_grid_configs(robot)
+    sim = batchsim.Batch_Sim(configs, track, robot=robot)
+    result = sim.run(max_time=max_time)
+    ok = result["completed"] & (result["pct_offtrack"] <= max_offtrack)
+    order = np.lexsort((result["rms_offset_cm"], result["lap_time"]))
+    return configs[order[ok[order]][:count]]
+
+
+def print_summaries(summaries):
+    print(
+        "{:>14} {:>6} {:>6} {:>6} {:>7} {:>7} {:>7} {:>6}".format(
+            "THR/LPS/RR/RL", "ok%", "lost%", "off%", "lap p10", "p50", "p90", "std"
+        )
+    )
+    for s in summaries:
+        print(
+            "{:>14} {:6.1f} {:6.1f} {:6.2f} {:7.2f} {:7.2f} {:7.2f} {:6.2f}".format(
+                "/".join(str(s["config"][p]) for p in SWEEP_PARAMS),
+                100.0 * s["p_success"],
+                100.0 * s["p_lost"],
+                s["mean_pct_offtrack"],
+                s["lap_p10"],
+                s["lap_p50"],
+                s["lap_p90"],
+                s["lap_std"],
+            )
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Monte Carlo robustness of configs")
+    parser.add_argument("--track", default="oval", choices=sorted(tracksim.TRACKS))
+    parser.add_argument("--samples", type=int, default=200, help="runs per config")
+    parser.add_argument("--candidates", type=int, default=40)
+    parser.add_argument("--config", help="check only this lfconfig.json")
+    parser.add_argument("--max-offtrack", type=float, default=2.0)
+    parser.add_argument("--min-success", type=float, default=0.95)
+    parser.add_argument("--mismatch-pct", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the most robust config here")
+    args = parser.parse_args(argv)
+
+    robot = tracksim.Sim_Robot()
+    start = time.perf_counter()
+    if args.config:
+        with open(args.config) as f:
+            saved = json.load(f)
+        defaults = robot.mode_config
+        configs = np.array(
+            [
+                [
+                    saved.get(p, getattr(defaults, defaults.param_index_attrs[p]))
+                    for p in SWEEP_PARAMS
+                ]
+            ]
+        )
+    else:
+        configs = nominal_candidates(
+            robot, args.track, args.candidates, args.max_offtrack
+        )
+    summaries = check_configs(
+        configs,
+        args.samples,
+        args.track,
+        Perturbations(motor_mismatch_pct=args.mismatch_pct),
+        robot=robot,
+        max_offtrack=args.max_offtrack,
+        seed=args.seed,
+    )
+    summaries = ranked(summaries, args.min_success)
+    print(
+        "{} configurations x {} perturbed runs in {:.1f} s".format(
+            len(configs), args.samples, time.perf_counter() - start
+        )
+    )
+    print_summaries(summaries)
+
+    best = summaries[0]
+    if best["p_success"] < args.min_success:
+        print("no configuration reached {:.0%} success".format(args.min_success))
+        return 1
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(best["config"], f)
+        print("most robust option indexes", best["config"], "written to", args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
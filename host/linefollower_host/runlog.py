@@ -0,0 +1,353 @@
+"""
+# Controller for Line-Following Robot -- desktop (host side) tools
+#
+# Author(s): Don Korte
+# Module:  runlog.py reads the binary run logs written by Device_Storage
+#   (see LOG_HEADER_FORMAT / LOG_RECORD_FORMAT in device_storage.py).
+#   Logs are opened with numpy.memmap and structured dtypes so the
+#   records are never copied; each run's columns are views straight
+#   onto the file.  It also computes the same metrics Screen_Summary
+#   shows on the robot, vectorized, for one run or a whole directory.
+#
+#   usage:  python -m linefollower_host.runlog <log file or directory>
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import argparse
+import os
+import sys
+
+import numpy as np
+
+LOG_MAGIC = b"LFRL"
+LOG_HEADER_SIZE = 64
+
+# header and record layouts for each log version; the newest must match
+# LOG_HEADER_FORMAT / LOG_RECORD_FORMAT in device_storage.py
+_HEADER_FIELDS = [
+    ("magic", "S4"),
+    ("version", "<u2"),
+    ("header_size", "<u2"),
+    ("record_size", "<u2"),
+    ("run_number", "<u2"),
+    ("throttle", "<f4"),
+    ("loop_speed", "<f4"),
+    ("rxn_rate", "<f4"),
+    ("rxn_limit", "<f4"),
+    ("showdisp_index", "u1"),
+    ("overrun_index", "u1"),
+    ("disp_fps", "u1"),
+    ("sensor_type", "u1"),
+    ("read_delay", "u1"),
+]
+HEADER_DTYPES = {
+    1: np.dtype(
+        _HEADER_FIELDS
+        + [
+            ("pad0", "V3"),
+            ("vbat_feather", "<f4"),
+            ("vbat_motor", "<f4"),
+            ("num_records", "<u4"),
+            ("num_dropped", "<u4"),
+            ("pad1", "V12"),
+        ]
+    ),
+    2: np.dtype(
+        _HEADER_FIELDS
+        + [
+            ("steering_index", "u1"),
+            ("predictor_index", "u1"),
+            ("pred_lead_ms", "u1"),
+            ("vbat_feather", "<f4"),
+            ("vbat_motor", "<f4"),
+            ("num_records", "<u4"),
+            ("num_dropped", "<u4"),
+            ("pred_alpha", "<f4"),
+            ("pred_beta", "<f4"),
+            ("pad1", "V4"),
+        ]
+    ),
+    3: np.dtype(
+        _HEADER_FIELDS
+        + [
+            ("steering_index", "u1"),
+            ("predictor_index", "u1"),
+            ("pred_lead_ms", "u1"),
+            ("vbat_feather", "<f4"),
+            ("vbat_motor", "<f4"),
+            ("num_records", "<u4"),
+            ("num_dropped", "<u4"),
+            ("pred_alpha", "<f4"),
+            ("pred_beta", "<f4"),
+            ("position_mode_index", "u1"),
+            ("pad1", "V3"),
+        ]
+    ),
+}
+# fields common to every version (enough to find the version)
+HEADER_DTYPE = HEADER_DTYPES[1]
+
+RECORD_DTYPES = {
+    1: np.dtype(
+        [
+            ("time_ms", "<u4"),
+            ("position", "<u2"),
+            ("steer", "<i2"),
+            ("throt_L", "<i2"),
+            ("throt_R", "<i2"),
+            ("loop_us", "<u2"),
+            ("flags", "<u2"),
+        ]
+    ),
+    2: np.dtype(
+        [
+            ("time_ms", "<u4"),
+            ("position", "<u2"),
+            ("steer", "<i2"),
+            ("throt_L", "<i2"),
+            ("throt_R", "<i2"),
+            ("loop_us", "<u2"),
+            ("residual", "i1"),
+            ("flags", "u1"),
+        ]
+    ),
+}
+RECORD_DTYPES[3] = RECORD_DTYPES[2]  # only the header changed
+
+LOGFLAG_RXN_LIMIT = 0x01
+LOGFLAG_STALE_READ = 0x02
+
+# metric names, in the order summarize_runs() returns them
+METRIC_NAMES = (
+    "run_number",
+    "num_loops",
+    "duration_s",
+    "pct_green",
+    "pct_left",
+    "pct_right",
+    "pct_offtrack",
+    "pct_rxn_limit",
+    "proc_ms",
+    "max_proc_ms",
+)
+METRICS_DTYPE = np.dtype(
+    [("path", "U256")] + [(name, "<f8") for name in METRIC_NAMES]
+)
+
+
+class RunLogError(Exception):
+    pass
+
+
+class RunLog:
+    """One run log, memory-mapped.  Column properties are views on the file
+    (or cheap scaled copies of them), so opening a log costs nothing until
+    a column is used."""
+
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+        if len(header) != 1 or header["magic"][0] != LOG_MAGIC:
+            raise RunLogError("{} is not a run log".format(path))
+        self.version = int(header[0]["version"])
+        if self.version not in RECORD_DTYPES:
+            raise RunLogError(
+                "{}: unsupported log version {}".format(path, self.version)
+            )
+        self.header = np.fromfile(path, dtype=HEADER_DTYPES[self.version], count=1)[0]
+        record_dtype = RECORD_DTYPES[self.version]
+        header_size = int(self.header["header_size"])
+        if int(self.header["record_size"]) != record_dtype.itemsize:
+            raise RunLogError("{}: record size mismatch".format(path))
+
+        # header count is only final once the log was closed; the file size
+        # tells us how many complete records are really there
+        num_records = (os.path.getsize(path) - header_size) // record_dtype.itemsize
+        if num_records > 0:
+            self.records = np.memmap(
+                path,
+                dtype=record_dtype,
+                mode="r",
+                offset=header_size,
+                shape=(num_records,),
+            )
+        else:
+            self.records = np.zeros(0, dtype=record_dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    # run parameters from the header, as a plain dict
+    @property
+    def config(self):
+        return {
+            name: self.header[name].item()
+            for name in self.header.dtype.names
+            if not name.startswith("pad") and name != "magic"
+        }
+
+    @property
+    def time(self):
+        """seconds since start of run"""
+        return self.records["time_ms"] / 1000.0
+
+    @property
+    def position(self):
+        """raw line position 0 => 250 (125 = centered)"""
+        return self.records["position"]
+
+    @property
+    def steering(self):
+        """steering curve (-rxn_limit => +rxn_limit)"""
+        return self.records["steer"] / 1000.0
+
+    @property
+    def throttle_left(self):
+        return self.records["throt_L"] / 1000.0
+
+    @property
+    def throttle_right(self):
+        return self.records["throt_R"] / 1000.0
+
+    @property
+    def loop_duration(self):
+        """loop processing time in seconds"""
+        return self.records["loop_us"] / 1000000.0
+
+    @property
+    def residual(self):
+        """line predictor residual, reading - prediction (0 when the
+        predictor was off, and in version 1 logs)"""
+        if "residual" not in self.records.dtype.names:
+            return np.zeros(len(self.records), dtype=np.int8)
+        return self.records["residual"]
+
+    @property
+    def rxn_limited(self):
+        return (self.records["flags"] & LOGFLAG_RXN_LIMIT) != 0
+
+    @property
+    def stale_read(self):
+        """ticks that steered from a stale line sensor result"""
+        return (self.records["flags"] & LOGFLAG_STALE_READ) != 0
+
+    def metrics(self):
+        """the Screen_Summary numbers for this run, as a dict"""
+        return dict(zip(METRIC_NAMES, _run_metrics(self)))
+
+
+# computes METRIC_NAMES values for one run with the same thresholds as
+# Mode_FollowPath.control_tick
+def _run_metrics(run):
+    n = len(run)
+    if n == 0:
+        return (float(run.header["run_number"]),) + (0.0,) * (len(METRIC_NAMES) - 1)
+    position = run.records["position"].astype(np.int16)
+    loop_us = run.records["loop_us"]
+    time_ms = run.records["time_ms"]
+    scale = 100.0 / n
+    return (
+        float(run.header["run_number"]),
+        float(n),
+        (int(time_ms[-1]) - int(time_ms[0])) / 1000.0
+        + float(run.header["loop_speed"]),
+        float(np.count_nonzero(np.abs(position - 125) < 30) * scale),
+        float(np.count_nonzero(position < 95) * scale),
+        float(np.count_nonzero(position > 155) * scale),
+        float(
+            np.count_nonzero((position < 5) | (position > 245)) * scale
+        ),
+        float(
+            np.count_nonzero(run.records["flags"] & LOGFLAG_RXN_LIMIT) * scale
+        ),
+        float(loop_us.mean()) / 1000.0,
+        float(loop_us.max()) / 1000.0,
+    )
+
+
+def open_run(path):
+    return RunLog(path)
+
+
+def find_runs(directory, suffix=".lfr"):
+    """sorted paths of all run logs in a directory"""
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.endswith(suffix)
+    )
+
+
+def summarize_runs(paths):
+    """metrics for many runs as one structured array (one row per run);
+    logs that can't be read are reported and skipped"""
+    rows = []
+    for path in paths:
+        try:
+            run = RunLog(path)
+        except (RunLogError, OSError, ValueError) as e:
+            print("skipping:", e, file=sys.stderr)
+            continue
+        rows.append((path,) + _run_metrics(run))
+    return np.array(rows, dtype=METRICS_DTYPE)
+
+
+def summarize_directory(directory):
+    return summarize_runs(find_runs(directory))
+
+
+def print_summary(table):
+    print(
+        "{:>5} {:>6} {:>7} {:>5} {:>5} {:>5} {:>5} {:>6} {:>6} {:>6}".format(
+            "run", "loops", "dur s", "G%", "L%", "R%", "OF%", "RxnL%", "proc", "max"
+        )
+    )
+    for row in table:
+        print(
+            "{:5.0f} {:6.0f} {:7.2f} {:5.0f} {:5.0f} {:5.0f} {:5.0f} {:6.0f} "
+            "{:6.1f} {:6.1f}".format(*(row[name] for name in METRIC_NAMES))
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="summarize run logs written by Device_Storage"
+    )
+    parser.add_argument("target", help="a run log file, or a directory of them")
+    args = parser.parse_args(argv)
+
+    target = args.target
+    if os.path.isdir(target):
+        table = summarize_directory(target)
+    else:
+        table = summarize_runs([target])
+    print_summary(table)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""
+# Controller for Line-Following Robot -- desktop (host side) tools
+#
+# Author(s): Don Korte
+# Module:  sweep.py searches the Mode_Config option grids (Throttle x
+#   Loop Speed x Rxn Rate x Rxn Limit, about 7000 combinations) with the
+#   tracksim closed-loop simulator, spread over a process pool using
+#   every core.  Each worker builds its own simulated robot once and
+#   then evaluates configurations handed to it.
+#
+#   Configurations are ranked by lap time, among those that finished
+#   and stayed within the offtrack-percentage limit.  The best one's
+#   option indexes are written as json in the format
+#   Mode_Config.load_config() reads: copy the file to the CIRCUITPY
+#   drive as /lfconfig.json and the robot starts with it.
+#
+#   search modes:
+#     full   - every combination
+#     refine - every other option of each parameter first, then every
+#              untried neighbour (+/- 1 index) of the best few; usually
+#              finds the same winner at a small fraction of the cost
+#
+#   usage:  python -m linefollower_host.sweep [--search refine]
+#              [--track oval] [--max-offtrack 2] [--output lfconfig.json]
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from linefollower_host import tracksim
+
+# parameters swept, as Mode_Config menu codes
+SWEEP_PARAMS = ("THR", "LPS", "RR", "RL")
+
+# per-process state, set up by _init_worker
+_worker = {}
+
+
+def _init_worker(track, laps, max_time):
+    _worker["robot"] = tracksim.Sim_Robot()
+    _worker["track"] = tracksim.TRACKS[track]()
+    _worker["laps"] = laps
+    _worker["max_time"] = max_time
+
+
+# simulates one configuration (tuple of option indexes in SWEEP_PARAMS
+# order); runs in a worker process
+def _evaluate(indexes):
+    config = dict(zip(SWEEP_PARAMS, indexes))
+    result = tracksim.simulate(
+        config,
+        _worker["track"],
+        _worker["laps"],
+        robot=_worker["robot"],
+        max_time=_worker["max_time"],
+    )
+    result["config"] = config
+    return indexes, result
+
+
+# a Mode_Config (on the hal linux backend) to read the option lists from
+def _mode_config():
+    if tracksim.REPO_DIR not in sys.path:
+        sys.path.insert(0, tracksim.REPO_DIR)
+    import hal
+
+    hal.install()
+    from mode_config import Mode_Config
+
+    return Mode_Config(None, None)
+
+
+def _options(mode_config, param):
+    attr = mode_config.param_index_attrs[param]
+    return getattr(mode_config, attr.replace("_index", "_options"))
+
+
+# number of options for each swept parameter
+def grid_sizes():
+    mode_config = _mode_config()
+    return tuple(len(_options(mode_config, param)) for param in SWEEP_PARAMS)
+
+
+def full_grid(sizes):
+    return list(itertools.product(*(range(n) for n in sizes)))
+
+
+def coarse_grid(sizes):
+    return list(itertools.product(*(range(0, n, 2) for n in sizes)))
+
+
+# untried configurations within one index of any of the given ones
+def neighbours(configs, sizes, tried):
+    found = []
+    for config in configs:
+        ranges = [
+            range(max(0, i - 1), min(n, i + 2)) for i, n in zip(config, sizes)
+        ]
+        for candidate in itertools.product(*ranges):
+            if candidate not in tried:
+                tried.add(candidate)
+                found.append(candidate)
+    return found
+
+
+class Sweep:
+    def __init__(self, track="oval", laps=1, max_time=40.0, processes=None):
+        self.track = track
+        self.laps = laps
+        self.max_time = max_time
+        self.processes = processes or os.cpu_count() or 1
+        self.results = {}  # indexes tuple => simulate() result dict
+
+    # evaluates the given configurations in parallel (skipping any already
+    # done), reporting progress every few seconds
+    def evaluate(self, configs, pool):
+        todo = [c for c in configs if c not in self.results]
+        chunksize = max(1, len(todo) // (self.processes * 8))
+        last_report = time.monotonic()
+        for n, (indexes, result) in enumerate(
+            pool.imap_unordered(_evaluate, todo, chunksize=chunksize), 1
+        ):
+            self.results[indexes] = result
+            if time.monotonic() - last_report > 5:
+                last_report = time.monotonic()
+                print("  {}/{} configurations".format(n, len(todo)), file=sys.stderr)
+
+    # returns results sorted fastest first; only those that finished with
+    # pct_offtrack <= max_offtrack are included
+    def ranked(self, max_offtrack):
+        feasible = [
+            r
+            for r in self.results.values()
+            if r["completed"] and r["pct_offtrack"] <= max_offtrack
+        ]
+        return sorted(
+            feasible,
+            key=lambda r: (r["lap_time"], r["pct_offtrack"], r["rms_offset_cm"]),
+        )
+
+    def run(self, search="refine", max_offtrack=2.0, refine_top=10):
+        sizes = grid_sizes()
+        with multiprocessing.Pool(
+            self.processes,
+            initializer=_init_worker,
+            initargs=(self.track, self.laps, self.max_time),
+        ) as pool:
+            if search == "full":
+                self.evaluate(full_grid(sizes), pool)
+            else:
+                self.evaluate(coarse_grid(sizes), pool)
+                tried = set(self.results)
+                while True:
+                    best = self.ranked(max_offtrack)[:refine_top]
+                    todo = neighbours(
+                        [tuple(r["config"][p] for p in SWEEP_PARAMS) for r in best],
+                        sizes,
+                        tried,
+                    )
+                    if not todo:
+                        break
+                    self.evaluate(todo, pool)
+        return self.ranked(max_offtrack)
+
+
+def print_ranking(ranked, mode_config_values, count=10):
+    print(
+        "{:>4} {:>5} {:>6} {:>5} {:>5} {:>8} {:>6} {:>6} {:>6}".format(
+            "rank", "THR", "LPS", "RR", "RL", "lap s", "off%", "rms cm", "osc Hz"
+        )
+    )
+    for rank, r in enumerate(ranked[:count], 1):
+        values = mode_config_values(r["config"])
+        print(
+            "{:4d} {:5.2f} {:6.3f} {:5.2f} {:5.2f} {:8.2f} {:6.2f} {:6.2f} {:6.2f}".format(
+                rank,
+                values["THR"],
+                values["LPS"],
+                values["RR"],
+                values["RL"],
+                r["lap_time"],
+                r["pct_offtrack"],
+                r["rms_offset_cm"],
+                r["oscillation_hz"],
+            )
+        )
+
+
+# returns a function that maps a config of indexes to option values
+def _value_lookup():
+    mode_config = _mode_config()
+
+    def lookup(config):
+        return {
+            param: _options(mode_config, param)[index]
+            for param, index in config.items()
+        }
+
+    return lookup
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="sweep Mode_Config options in simulation")
+    parser.add_argument("--search", default="refine", choices=("refine", "full"))
+    parser.add_argument("--track", default="oval", choices=sorted(tracksim.TRACKS))
+    parser.add_argument("--laps", type=int, default=1)
+    parser.add_argument("--max-time", type=float, default=40.0)
+    parser.add_argument(
+        "--max-offtrack", type=float, default=2.0, help="max pct of ticks offtrack"
+    )
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--output", default="lfconfig.json")
+    args = parser.parse_args(argv)
+
+    start = time.monotonic()
+    sweep = Sweep(args.track, args.laps, args.max_time, args.processes)
+    ranked = sweep.run(args.search, args.max_offtrack)
+    print(
+        "{} configurations simulated in {:.1f} s on {} processes".format(
+            len(sweep.results), time.monotonic() - start, sweep.processes
+        )
+    )
+    if not ranked:
+        print("no configuration finished within the offtrack limit")
+        return 1
+    print_ranking(ranked, _value_lookup())
+
+    best = ranked[0]["config"]
+    with open(args.output, "w") as f:
+        json.dump(best, f)
+    print("best option indexes", best, "written to", args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,484 @@
+"""
+# Controller for Line-Following Robot -- desktop (host side) tools
+#
+# Author(s): Don Korte
+# Module:  tracksim.py is a closed-loop kinematic simulator for
+#   Mode_FollowPath.  The robot code runs unchanged on the hal.py Linux
+#   backend; each simulated tick the line position (0 => 250) seen by a
+#   virtual sensor bar is handed to Mode_FollowPath.control_tick(), and
+#   the wheel throttles it leaves on the (fake) DC motors move a
+#   differential-drive robot over the track.  Nothing sleeps, so a lap
+#   runs much faster than real time.
+#
+#   Robot model (same conventions as Device_Motors):
+#     - wheel speed = throttle * cm_per_sec_at_100pct, where throttle is
+#       the value actually written to the motor (ie. after the per-motor
+#       calibration constants), times a per-motor gain (the real motors
+#       differ; the defaults are what motorCalibrateL/R correct for)
+#     - throttles below MIN_USEFUL_THROTTLE (0.2) don't turn the wheel
+#     - wheels 2 in either side of center (see note in device_motors.py),
+#       first-order motor lag
+#     - Pololu 8 sensor bar ahead of the axle; the reading used each tick
+#       is the one requested at the end of the previous tick, as in
+#       Mode_FollowPath.acquire_position().  Off the line it holds 0 or
+#       250 on the side the line was last seen, like the sensor firmware
+#     - the run starts at rest with Device_Motors.ramp_to(), as
+#       Mode_FollowPath.start_run() does, so the base throttle ramps up
+#       over the first ticks; the ramp runs on a virtual clock advanced
+#       one loop period per tick
+#
+#   usage:  python -m linefollower_host.tracksim [--track oval] [--THR 2] ...
+#     (--THR, --LPS, --RR, --RL are Mode_Config option indexes)
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import argparse
+import contextlib
+import io
+import math
+import sys
+
+import numpy as np
+
+from linefollower_host.hal_linux import REPO_DIR
+
+MIN_USEFUL_THROTTLE = 0.2  # motors have no torque below this (device_motors.py)
+WHEEL_SPACING_CM = 2 * 2.54 * 2  # wheels on 2 in radius from axis of rotation
+SENSOR_PITCH_CM = 0.9525  # Pololu QTR-8 sensor spacing
+NUM_SENSORS = 8
+LINE_WIDTH_CM = 1.9  # electrical tape
+TRACK_STEP_CM = 0.5  # spacing of points along the track centerline
+
+CONFIG_PARAMS = (
+    "THR", "LPS", "RR", "RL", "STR", "KP", "KI", "KD", "PRD", "PA", "PB", "PL"
+)
+
+
+# ----------------------------------------------------------------------------
+# tracks
+# ----------------------------------------------------------------------------
+
+
+class Track:
+    """Closed track built from segments: ("S", length_cm) for a straight,
+    ("A", radius_cm, degrees) for an arc (positive degrees turn left).
+    The centerline is sampled every TRACK_STEP_CM."""
+
+    def __init__(self, name, segments):
+        self.name = name
+        self.segments = segments
+        x, y, heading = 0.0, 0.0, 0.0
+        points = [(x, y)]
+        for segment in segments:
+            if segment[0] == "S":
+                n = max(1, int(round(segment[1] / TRACK_STEP_CM)))
+                step = segment[1] / n
+                for i in range(n):
+                    x += step * math.cos(heading)
+                    y += step * math.sin(heading)
+                    points.append((x, y))
+            else:
+                radius, degrees = segment[1], segment[2]
+                turn = math.radians(degrees)
+                n = max(1, int(round(abs(turn) * radius / TRACK_STEP_CM)))
+                dtheta = turn / n
+                chord = 2 * radius * math.sin(abs(dtheta) / 2)
+                for i in range(n):
+                    heading += dtheta / 2
+                    x += chord * math.cos(heading)
+                    y += chord * math.sin(heading)
+                    heading += dtheta / 2
+                    points.append((x, y))
+        if math.hypot(x, y) > 1.0:
+            raise ValueError("track {} does not close".format(name))
+        self.points = np.array(points[:-1])
+        deltas = np.roll(self.points, -1, axis=0) - self.points
+        seg_lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+        self.tangents = deltas / seg_lengths[:, None]
+        self.distance = np.concatenate(([0.0], np.cumsum(seg_lengths)[:-1]))
+        self.length = float(seg_lengths.sum())
+
+    def __len__(self):
+        return len(self.points)
+
+    # index of the centerline point nearest (x, y), searching only a window
+    # around hint (the robot never moves far in one step)
+    def nearest(self, x, y, hint, window=40):
+        n = len(self.points)
+        idx = np.arange(hint - window, hint + window + 1) % n
+        d2 = (self.points[idx, 0] - x) ** 2 + (self.points[idx, 1] - y) ** 2
+        return int(idx[np.argmin(d2)])
+
+
+def oval_track(straight=100, radius=30):
+    return Track(
+        "oval",
+        [("S", straight), ("A", radius, 180), ("S", straight), ("A", radius, 180)],
+    )
+
+
+def rounded_square_track(side=80, radius=15):
+    return Track("square", [("S", side), ("A", radius, 90)] * 4)
+
+
+# oval with an S-bend chicane in place of one straight
+def chicane_track(radius=30, end_radius=30):
+    chicane = [("A", radius, 45), ("A", radius, -90), ("A", radius, 45)]
+    straight = 4 * radius * math.sin(math.radians(45))
+    return Track(
+        "chicane",
+        chicane
+        + [("A", end_radius, 180), ("S", straight), ("A", end_radius, 180)],
+    )
+
+
+TRACKS = {
+    "oval": oval_track,
+    "square": rounded_square_track,
+    "chicane": chicane_track,
+}
+
+
+# ----------------------------------------------------------------------------
+# robot (the unmodified controller code on the hal.py linux backend)
+# ----------------------------------------------------------------------------
+
+
+class Sim_Robot:
+    """the Robot_Session code.py runs, on the fake hardware"""
+
+    def __init__(self, quiet=True):
+        if REPO_DIR not in sys.path:
+            sys.path.insert(0, REPO_DIR)
+        import hal
+
+        hal.install()
+        from linefollower_host import hal_linux
+        from robot_session import Robot_Session
+
+        self.backend = hal_linux.backend
+        out = io.StringIO() if quiet else sys.stdout
+        with contextlib.redirect_stdout(out):
+            self.session = Robot_Session(load_config=False)
+        self.i2c_bus = self.session.i2c_bus
+        self.minitft = self.session.minitft
+        self.device_buttons = self.session.device_buttons
+        self.mode_config = self.session.mode_config
+        self.screen_dashboard = self.session.screen_dashboard
+        self.device_motors = self.session.device_motors
+        self.device_linesense = self.session.device_linesense
+        self.device_storage = self.session.device_storage
+        self.device_battery = self.session.device_battery
+        self.mode_followpath = self.session.mode_followpath
+
+    # config is a dict of Mode_Config option indexes by parameter code,
+    # eg. {"THR": 2, "RR": 8}
+    def configure(self, config):
+        for param, index in config.items():
+            self.mode_config.set_param_index(param, index)
+
+    # throttles currently on the motors (after calibration constants)
+    def motor_throttles(self):
+        return (
+            self.device_motors.motorL.throttle or 0.0,
+            self.device_motors.motorR.throttle or 0.0,
+        )
+
+
+# ----------------------------------------------------------------------------
+# simulator
+# ----------------------------------------------------------------------------
+
+
+class Track_Sim:
+    def __init__(
+        self,
+        robot,
+        track,
+        motor_gain_L=1.0,
+        motor_gain_R=1.0 / 0.95,
+        motor_tau=0.05,
+        sensor_offset_cm=5.0,
+        wheel_spacing_cm=WHEEL_SPACING_CM,
+        line_width_cm=LINE_WIDTH_CM,
+        max_step=0.002,
+    ):
+        self.robot = robot
+        self.track = track
+        self.motor_gain_L = motor_gain_L
+        self.motor_gain_R = motor_gain_R
+        self.motor_tau = motor_tau
+        self.sensor_offset_cm = sensor_offset_cm
+        self.wheel_spacing_cm = wheel_spacing_cm
+        self.line_width_cm = line_width_cm
+        self.max_step = max_step
+        self.cm_per_sec = robot.device_motors.cm_per_sec_at_100pct
+        # lateral position of each sensor, robot left = positive; sensor 0
+        # is on the right (small readings mean the line is to the right)
+        self.sensor_y = (np.arange(NUM_SENSORS) - (NUM_SENSORS - 1) / 2) * SENSOR_PITCH_CM
+        self.sensor_halfwidth = line_width_cm / 2 + SENSOR_PITCH_CM / 2
+
+    # places the robot at the start of the track, offset_cm to the left of
+    # the line and heading_deg off the track direction, at rest
+    def reset(self, offset_cm=0.0, heading_deg=0.0):
+        p = self.track.points[0]
+        t = self.track.tangents[0]
+        heading = math.atan2(t[1], t[0])
+        self.x = p[0] - offset_cm * math.sin(heading) - self.sensor_offset_cm * t[0]
+        self.y = p[1] + offset_cm * math.cos(heading) - self.sensor_offset_cm * t[1]
+        self.heading = heading + math.radians(heading_deg)
+        self.speed_L = 0.0
+        self.speed_R = 0.0
+        self.track_index = 0
+        self.bar_index = 0
+        self.travelled = 0.0
+        self.last_position = 125
+        self.bar_offset = 0.0
+
+    # signed distance (cm, left positive) along the sensor bar from its
+    # center to where the line crosses it, or None if the bar is parallel
+    def _line_offset(self):
+        c, s = math.cos(self.heading), math.sin(self.heading)
+        bx = self.x + self.sensor_offset_cm * c
+        by = self.y + self.sensor_offset_cm * s
+        i = self.track.nearest(bx, by, self.bar_index)
+        self.bar_index = i
+        px, py = self.track.points[i]
+        tx, ty = self.track.tangents[i]
+        # bar axis is (-s, c); solve for where it meets the local line
+        denom = -s * (-ty) + c * tx
+        if abs(denom) < 0.2:
+            return None
+        return ((px - bx) * (-ty) + (py - by) * tx) / denom
+
+    # the 0 => 250 reading the sensor would report for the current pose
+    def sense(self):
+        offset = self._line_offset()
+        if offset is None:
+            self.bar_offset = float("inf")
+            return 0 if self.last_position < 125 else 250
+        self.bar_offset = offset
+        response = 1.0 - np.abs(self.sensor_y - offset) / self.sensor_halfwidth
+        response = np.clip(response, 0.0, 1.0)
+        total = response.sum()
+        if total < 0.2:
+            # line not under the bar; firmware reports the side last seen
+            return 0 if self.last_position < 125 else 250
+        index = float((response * np.arange(NUM_SENSORS)).sum() / total)
+        position = int(round(index * 250 / (NUM_SENSORS - 1)))
+        self.last_position = position
+        return position
+
+    def _wheel_speed(self, throttle, gain):
+        if abs(throttle) < MIN_USEFUL_THROTTLE:
+            return 0.0
+        return throttle * gain * self.cm_per_sec
+
+    # moves the robot for dt seconds with the given motor throttles
+    def step(self, throt_L, throt_R, dt):
+        target_L = self._wheel_speed(throt_L, self.motor_gain_L)
+        target_R = self._wheel_speed(throt_R, self.motor_gain_R)
+        n = max(1, int(math.ceil(dt / self.max_step)))
+        h = dt / n
+        alpha = 1.0 - math.exp(-h / self.motor_tau) if self.motor_tau > 0 else 1.0
+        for _ in range(n):
+            self.speed_L += (target_L - self.speed_L) * alpha
+            self.speed_R += (target_R - self.speed_R) * alpha
+            v = (self.speed_L + self.speed_R) / 2
+            w = (self.speed_R - self.speed_L) / self.wheel_spacing_cm
+            self.heading += w * h / 2
+            self.x += v * h * math.cos(self.heading)
+            self.y += v * h * math.sin(self.heading)
+            self.heading += w * h / 2
+
+        # progress along the track (of the axle's nearest centerline point)
+        i = self.track.nearest(self.x, self.y, self.track_index)
+        delta = i - self.track_index
+        n = len(self.track)
+        if delta > n // 2:
+            delta -= n
+        elif delta < -n // 2:
+            delta += n
+        self.travelled += delta * self.track.length / n
+        self.track_index = i
+
+    # drives Mode_FollowPath.control_tick() around the track until laps are
+    # done, the robot is lost (offtrack for lost_time seconds) or max_time.
+    # returns the run metrics as a dict
+    def run(self, laps=1, max_time=60.0, lost_time=1.0, offset_cm=0.0, heading_deg=0.0):
+        follow = self.robot.mode_followpath
+        loop_speed = self.robot.mode_config.get_loop_speed()
+        follow.reset_run_stats()
+        self.reset(offset_cm, heading_deg)
+
+        import device_clock
+
+        # the motor ramp reads device_clock; give it simulated time
+        own_clock = device_clock.clock_name == "real"
+        if own_clock:
+            device_clock.use_clock(device_clock.Virtual_Clock())
+        motors = self.robot.device_motors
+        motors.motors_stop()
+        motors.ramp_to(self.robot.mode_config.throttle, steered=True)
+        try:
+            return self._drive(laps, max_time, lost_time, loop_speed)
+        finally:
+            if own_clock:
+                device_clock.use_clock(None)
+
+    def _drive(self, laps, max_time, lost_time, loop_speed):
+        import device_clock
+
+        follow = self.robot.mode_followpath
+
+        goal = laps * self.track.length
+        num_ticks = int(max_time / loop_speed)
+        sensed = self.sense()
+        offtrack_ticks = 0
+        offtrack_run = 0
+        offsets = []
+        crossings = 0
+        side = 0
+        completed = False
+        lost = False
+        tick = 0
+        for tick in range(1, num_ticks + 1):
+            position = sensed
+            follow.control_tick(position)
+            # read for next tick is requested at the end of this one, so
+            # it sees the robot where it is now, a full period before use
+            sensed = self.sense()
+            throt_L, throt_R = self.robot.motor_throttles()
+            self.step(throt_L, throt_R, loop_speed)
+            device_clock.sleep(loop_speed)
+
+            if (position < 5) or (position > 245):
+                offtrack_ticks += 1
+                offtrack_run += 1
+                if offtrack_run * loop_speed >= lost_time:
+                    lost = True
+                    break
+            else:
+                offtrack_run = 0
+                offsets.append(self.bar_offset)
+            # count swings across the line (with hysteresis) for oscillation
+            error = position - 125
+            if error > 10 and side <= 0:
+                crossings += side < 0
+                side = 1
+            elif error < -10 and side >= 0:
+                crossings += side > 0
+                side = -1
+
+            if self.travelled >= goal:
+                completed = True
+                break
+
+        elapsed = tick * loop_speed
+        offsets = np.array(offsets) if offsets else np.zeros(1)
+        return {
+            "track": self.track.name,
+            "completed": completed,
+            "lost": lost,
+            "lap_time": elapsed / laps if completed else float("inf"),
+            "elapsed": elapsed,
+            "distance_cm": self.travelled,
+            "time_offtrack": offtrack_ticks * loop_speed,
+            "pct_offtrack": 100.0 * offtrack_ticks / tick,
+            "rms_offset_cm": float(np.sqrt(np.mean(offsets ** 2))),
+            "oscillation_hz": crossings / 2 / elapsed,
+            "pct_green": 100.0 * follow.get_num_green() / follow.get_num_loops(),
+            "pct_rxn_limit": 100.0 * follow.get_num_rxn_limit() / follow.get_num_loops(),
+            "num_ticks": tick,
+        }
+
+
+# runs one simulated lap set for a config (dict of option indexes)
+def simulate(config=None, track="oval", laps=1, robot=None, **sim_kwargs):
+    if robot is None:
+        robot = Sim_Robot()
+    if config:
+        robot.configure(config)
+    if isinstance(track, str):
+        track = TRACKS[track]()
+    run_kwargs = {}
+    for name in ("max_time", "lost_time", "offset_cm", "heading_deg"):
+        if name in sim_kwargs:
+            run_kwargs[name] = sim_kwargs.pop(name)
+    return Track_Sim(robot, track, **sim_kwargs).run(laps=laps, **run_kwargs)
+
+
+def print_result(result):
+    for name, value in result.items():
+        if isinstance(value, float):
+            print("{:>15}: {:.3f}".format(name, value))
+        else:
+            print("{:>15}: {}".format(name, value))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="simulate Mode_FollowPath on a track")
+    parser.add_argument("--track", default="oval", choices=sorted(TRACKS))
+    parser.add_argument("--laps", type=int, default=1)
+    parser.add_argument("--offset", type=float, default=0.0, help="start offset, cm")
+    for param in CONFIG_PARAMS:
+        parser.add_argument("--" + param, type=int, help="Mode_Config option index")
+    args = parser.parse_args(argv)
+
+    config = {}
+    for param in CONFIG_PARAMS:
+        if getattr(args, param) is not None:
+            config[param] = getattr(args, param)
+    robot = Sim_Robot()
+    result = simulate(config, args.track, args.laps, robot=robot, offset_cm=args.offset)
+    mode_config = robot.mode_config
+    print(
+        "THR {} LPS {} RR {} RL {} steering {} (Kp {} Ki {} Kd {})".format(
+            mode_config.get_throttle(),
+            mode_config.get_loop_speed(),
+            mode_config.get_rxn_rate(),
+            mode_config.get_rxn_limit(),
+            mode_config.get_steering(),
+            mode_config.get_kp(),
+            mode_config.get_ki(),
+            mode_config.get_kd(),
+        )
+    )
+    print(
+        "predictor {} (alpha {} beta {} lead {} mS)".format(
+            mode_config.get_predictor(),
+            mode_config.get_pred_alpha(),
+            mode_config.get_pred_beta(),
+            mode_config.get_pred_lead(),
+        )
+    )
+    print_result(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+# Controller for Line-Following Robot -- desktop (host side) tools
+#
+# Author(s): Don Korte
+# Module:  virtual_time.py runs the robot's asyncio code on a
+#   device_clock.Virtual_Clock.  Virtual_Time_Loop is an asyncio event
+#   loop whose time() is the virtual clock; whenever it would block
+#   waiting for the next timer it just advances the clock to it.  With
+#   blocking waits (device_clock.sleep) also virtual, a whole session
+#   -- countdowns, calibration sweeps, acceleration ramps, fixed-rate
+#   control ticks and background jobs -- runs as fast as the CPU allows
+#   with exactly the deadlines it would have on the robot.
+#
+#   usage:  python -m linefollower_host.virtual_time [--follow-time 20]
+#     simulates power up, a calibrate run and a follow-path run (ended
+#     with the A button), then prints virtual vs wall clock time
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import selectors
+import sys
+import time
+
+from linefollower_host.hal_linux import REPO_DIR
+
+if REPO_DIR not in sys.path:
+    sys.path.insert(0, REPO_DIR)
+import device_clock  # noqa: E402
+
+
+class _Virtual_Selector(selectors.SelectSelector):
+    """selector that never blocks: a wait for timeout seconds advances the
+    virtual clock instead.  (only the loop's own wakeup pipe is ever
+    registered, so there is never real I/O to wait for)"""
+
+    def __init__(self, clock):
+        super().__init__()
+        self.clock = clock
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if ready:
+            return ready
+        if timeout is None:
+            raise RuntimeError("virtual time loop would wait forever")
+        self.clock.advance(timeout)
+        return []
+
+
+class Virtual_Time_Loop(asyncio.SelectorEventLoop):
+    def __init__(self, clock):
+        self.clock = clock
+        super().__init__(_Virtual_Selector(clock))
+
+    def time(self):
+        return self.clock.monotonic()
+
+
+# runs coroutine main to completion on a virtual clock (a new one starting
+# at 0 if none is given), with device_clock switched to it meanwhile
+def run(main, clock=None):
+    if clock is None:
+        clock = device_clock.Virtual_Clock()
+    device_clock.use_clock(clock)
+    loop = Virtual_Time_Loop(clock)
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(main)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+        device_clock.use_clock(None)
+
+
+# presses and releases a MiniTFT button (on the hal_linux backend) long
+# enough for Device_Buttons to debounce it
+async def click(backend, button, hold=0.3):
+    backend.press(button)
+    await asyncio.sleep(hold)
+    backend.press(button, False)
+    await asyncio.sleep(hold)
+
+
+# a calibrate run, then a follow-path run ended with A after follow_time
+# seconds, on the Robot_Session code.py runs (every handler and background
+# job); returns follow-path statistics
+async def simulate_session(follow_time=20.0):
+    import hal
+    from linefollower_host import linesense_emulator
+    from linefollower_host.tracksim import Sim_Robot
+
+    hal.install()
+    emulator = linesense_emulator.attach(calibration_time=3.0)
+    robot = Sim_Robot()
+    backend = robot.backend
+    session = robot.session
+    runtime = session.runtime
+    runtime.start()
+
+    start = device_clock.monotonic()
+    await session.mode_calibrate.run_mode()
+    calibrate_time = device_clock.monotonic() - start
+
+    async def stop_following():
+        # 5 second countdown, then let it drive
+        await asyncio.sleep(5.0 + follow_time)
+        await click(backend, "a")
+
+    stopper = asyncio.ensure_future(stop_following())
+    with contextlib.redirect_stdout(io.StringIO()):
+        await robot.mode_followpath.run_mode(runtime)
+    await stopper
+    # the stop ramp is finished by the runtime's motors job
+    while not robot.device_motors.ramp.is_done():
+        await asyncio.sleep(0.05)
+    runtime.background_task.cancel()
+    follow = robot.mode_followpath
+    return {
+        "calibrate_time": calibrate_time,
+        "calibrated": robot.device_linesense.calibrated,
+        "follow_loops": follow.get_num_loops(),
+        "follow_run_time": follow.get_total_run_time(),
+        "motor_throttles": robot.motor_throttles(),
+        "ticks_missed": follow.get_num_missed(),
+        "sensor_stale_reads": emulator.num_stale_reads,
+        "i2c_errors": sum(
+            device.num_errors for device in robot.i2c_bus.devices
+        ),
+        "i2c_refused": sum(
+            device.num_refused for device in robot.i2c_bus.devices
+        ),
+        "virtual_time": device_clock.monotonic(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="simulate a session in virtual time")
+    parser.add_argument("--follow-time", type=float, default=20.0)
+    args = parser.parse_args(argv)
+
+    wall_start = time.perf_counter()
+    result = run(simulate_session(args.follow_time))
+    wall_time = time.perf_counter() - wall_start
+    for name, value in result.items():
+        print("{:>16}: {}".format(name, value))
+    print("{:>16}: {:.3f}".format("wall_time", wall_time))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
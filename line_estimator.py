@@ -0,0 +1,152 @@
+"""
+# Controller for Line-Following Robot
+# This runs on an Adafruit Feather M4, with a MiniTFT board.
+# It drives a TB6612 to control 2 DC Motors (in blue servo case)
+# and talks over I2C to an ItsyBitsy that interfaces a Pololu
+# line following sensor
+#
+# Author(s): Don Korte
+# Module:  line_estimator.py works out the line position from the raw
+#   frame of calibrated channel values (0 white => 255 black, one per
+#   sensor channel) that protocol 3 line sensors send along with their
+#   own position byte (see Device_LineSense).  It keeps what the
+#   sensor's single 0 => 250 byte throws away:
+#     fine_position - position in 1/16ths (0 => 4000), for steering
+#                     finer than the sensor's 1/125 steps
+#     confidence    - contrast between the darkest and lightest
+#                     channels (0 => 255); below lost_confidence the line
+#                     is lost, wherever the position byte says it is
+#     width         - number of channels at least half way from the
+#                     lightest to the darkest reading (line width)
+#
+#   two ways of interpolating between channels:
+#     centroid  - average of channel numbers weighted by how far each
+#                 value is above a floor an eighth of the way from the
+#                 lightest to the darkest (what the sensor firmware does,
+#                 less the background and its noise)
+#     quadratic - vertex of the parabola through the darkest channel and
+#                 its two neighbours (centroid when the darkest is at an
+#                 end of the array)
+#   when the line is lost the position goes to the end it was last seen
+#   past (0 or 250), as the sensor firmware's does
+#
+#   update() runs every control tick so it uses integer math on the
+#   frame buffer in place: no lists, tuples or other objects are built
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+FINE_SCALE = 16  # fine_position units per position unit
+FINE_MAX = 250 * FINE_SCALE
+
+
+class Line_Estimator:
+    def __init__(self, num_channels=8, quadratic=False, lost_confidence=64):
+        self.num_channels = num_channels
+        self.quadratic = quadratic
+        self.lost_confidence = lost_confidence
+        self.reset()
+
+    def configure(self, num_channels, quadratic, lost_confidence=64):
+        self.num_channels = num_channels
+        self.quadratic = quadratic
+        self.lost_confidence = lost_confidence
+        self.reset()
+
+    def reset(self):
+        # outputs of the last update()
+        self.fine_position = FINE_MAX // 2
+        self.position = 125  # int 0 => 250, like the sensor's position byte
+        self.confidence = 0
+        self.width = 0
+        self.lost = False
+
+    # frame holds the channel values from index start on
+    def update(self, frame, start):
+        end = start + self.num_channels
+        darkest = 0
+        lightest = 255
+        peak_at = start
+        for i in range(start, end):
+            value = frame[i]
+            if value > darkest:
+                darkest = value
+                peak_at = i
+            if value < lightest:
+                lightest = value
+        confidence = darkest - lightest
+        self.confidence = confidence
+
+        if confidence < self.lost_confidence:
+            self.lost = True
+            self.width = 0
+            if self.fine_position < FINE_MAX // 2:
+                self.fine_position = 0
+                self.position = 0
+            else:
+                self.fine_position = FINE_MAX
+                self.position = 250
+            return
+        self.lost = False
+
+        # channel position in 1/256ths of a channel (0 at the first one)
+        half = darkest + lightest  # compared with 2 * value
+        floor = lightest + (confidence >> 3)
+        width = 0
+        total = 0
+        moment = 0
+        for i in range(start, end):
+            value = frame[i]
+            if value + value >= half:
+                width += 1
+            if value > floor:
+                total += value - floor
+                moment += (value - floor) * (i - start)
+        self.width = width
+        if self.quadratic and (start < peak_at < end - 1):
+            left = frame[peak_at - 1]
+            right = frame[peak_at + 1]
+            # vertex offset (left - right) / (2 * curvature), in 1/256ths;
+            # curvature < 0 since the peak channel is the darkest
+            curvature = left - darkest - darkest + right
+            offset = 0
+            if curvature < 0:
+                offset = (128 * (right - left)) // -curvature
+                if offset > 128:
+                    offset = 128
+                elif offset < -128:
+                    offset = -128
+            channel = (peak_at - start) * 256 + offset
+        else:
+            channel = (moment * 256 + total // 2) // total
+
+        fine = (channel * FINE_MAX) // ((self.num_channels - 1) * 256)
+        if fine < 0:
+            fine = 0
+        elif fine > FINE_MAX:
+            fine = FINE_MAX
+        self.fine_position = fine
+        self.position = (fine + FINE_SCALE // 2) // FINE_SCALE
@@ -0,0 +1,116 @@
+"""
+# Controller for Line-Following Robot
+# This runs on an Adafruit Feather M4, with a MiniTFT board.
+# It drives a TB6612 to control 2 DC Motors (in blue servo case)
+# and talks over I2C to an ItsyBitsy that interfaces a Pololu
+# line following sensor
+#
+# Author(s): Don Korte
+# Module:  line_predictor.py makes up for the age of the pipelined line
+#   sensor reading.  The read Mode_FollowPath steers from was started at
+#   the end of the previous tick, so by the time the motor command goes
+#   out the reading is a loop period (plus some of read_delay) old.
+#
+#   Line_Predictor is an alpha-beta filter on the readings, each
+#   timestamped with when it was taken:
+#     predicted  = position + velocity * dt      (from the previous one)
+#     residual   = reading - predicted
+#     position   = predicted + alpha * residual
+#     velocity  += beta * residual / dt
+#   and the steering uses position + velocity * age, extrapolated to
+#   the moment the command is sent (plus an optional lead for motor
+#   response).  velocity is the smoothed rate the line moves across the
+#   sensor, in position units per second.
+#
+#   readings at the sensor's ends (< 5 or > 245) mean the line is lost
+#   or about to be, where position says nothing about motion; they are
+#   passed through unchanged and the filter restarts from the next
+#   reading on the line.
+#
+#   update() runs every control tick so it only does arithmetic on
+#   attributes: no lists, tuples or other objects are built per call
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+
+class Line_Predictor:
+    def __init__(self, alpha=0.5, beta=0.1, lead=0):
+        self.alpha = alpha
+        self.beta = beta
+        self.lead = lead  # seconds added to the prediction horizon
+        self.reset()
+
+    def configure(self, alpha, beta, lead):
+        self.alpha = alpha
+        self.beta = beta
+        self.lead = lead
+        self.reset()
+
+    # forgets the track history; call at start of each run
+    def reset(self):
+        self.position = 125.0  # filtered position at the last reading
+        self.velocity = 0.0  # position units per second
+        self.tracking = False  # False until a reading on the line
+        # outputs of the last update()
+        self.predicted = 125  # int 0 => 250, for steering
+        self.residual = 0  # int -128 => 127, for logging
+
+    # takes a reading made dt seconds after the previous one and age
+    # seconds before now; returns the position predicted for now + lead
+    def update(self, reading, dt, age):
+        if (reading < 5) or (reading > 245):
+            self.tracking = False
+            self.velocity = 0.0
+            self.position = reading
+            self.predicted = reading
+            self.residual = 0
+            return reading
+
+        if (not self.tracking) or (dt <= 0):
+            self.tracking = True
+            self.position = reading
+            self.velocity = 0.0
+            residual = 0
+        else:
+            predicted = self.position + self.velocity * dt
+            residual = reading - predicted
+            self.position = predicted + self.alpha * residual
+            self.velocity += self.beta * residual / dt
+
+        if residual > 127:
+            residual = 127
+        elif residual < -128:
+            residual = -128
+        self.residual = int(residual)
+
+        position = self.position + self.velocity * (age + self.lead)
+        if position < 0:
+            position = 0
+        elif position > 250:
+            position = 250
+        self.predicted = int(position + 0.5)
+        return self.predicted
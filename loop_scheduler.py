@@ -0,0 +1,184 @@
+"""
+# Controller for Line-Following Robot
+# This runs on an Adafruit Feather M4, with a MiniTFT board.
+# It drives a TB6612 to control 2 DC Motors (in blue servo case)
+# and talks over I2C to an ItsyBitsy that interfaces a Pololu
+# line following sensor
+#
+# Author(s): Don Korte
+# Module:  loop_scheduler.py fires control loop ticks on a fixed-rate
+#   absolute schedule (next_deadline += period) so the loop period does
+#   not drift by however much each sleep overshoots.  It also keeps a
+#   compact histogram of how late each tick fired, and counts deadlines
+#   that were missed because the previous tick ran too long.
+#
+#   overrun policies:
+#     "Skip"    - if processing runs past one or more deadlines, those
+#                 ticks are dropped and the schedule resumes on the next
+#                 future deadline
+#     "Catchup" - late ticks are fired back-to-back until the schedule is
+#                 caught up (but never more than max_catchup ticks behind)
+#
+#   Slack_Budget paces the occasional jobs (display frames, log writes)
+#   that run in the slack between ticks.
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import device_clock
+from array import array
+
+
+class Loop_Scheduler:
+    def __init__(self, num_bins=40, bin_width=0.00025, max_catchup=3):
+        # lateness histogram; each bin is bin_width seconds wide and the
+        # last bin collects everything beyond the range (default 0-10 mS)
+        self.num_bins = num_bins
+        self.bin_width = bin_width
+        self.histogram = array("H", [0] * num_bins)
+        self.max_catchup = max_catchup
+
+        self.period = 0.02
+        self.policy = "Skip"
+        self.next_deadline = 0
+        self.num_ticks = 0  # number of ticks fired this run
+        self.num_missed = 0  # number of deadlines missed this run
+        self.max_lateness = 0  # worst lateness seen this run (seconds)
+        self.last_tick_time = None  # when the previous tick started
+        self.tick_interval = self.period  # seconds between last two ticks
+
+    # call once at start of run; the first tick is due immediately
+    def start(self, period, policy="Skip"):
+        self.period = period
+        self.policy = policy
+        for i in range(self.num_bins):
+            self.histogram[i] = 0
+        self.num_ticks = 0
+        self.num_missed = 0
+        self.max_lateness = 0
+        self.last_tick_time = None
+        self.tick_interval = period
+        self.next_deadline = device_clock.monotonic()
+
+    # returns seconds remaining until next tick is due (negative if overdue)
+    def time_until_tick(self):
+        return self.next_deadline - device_clock.monotonic()
+
+    # call this at the moment the tick actually starts running; records how
+    # late it is and advances the schedule according to the overrun policy.
+    # returns lateness of this tick in seconds
+    def tick(self):
+        now = device_clock.monotonic()
+        lateness = now - self.next_deadline
+        if lateness < 0:
+            lateness = 0
+
+        bin_num = int(lateness / self.bin_width)
+        if bin_num >= self.num_bins:
+            bin_num = self.num_bins - 1
+        if self.histogram[bin_num] < 65535:
+            self.histogram[bin_num] += 1
+        if lateness > self.max_lateness:
+            self.max_lateness = lateness
+        self.num_ticks += 1
+        if self.last_tick_time is not None:
+            self.tick_interval = now - self.last_tick_time
+        self.last_tick_time = now
+
+        self.next_deadline += self.period
+        if now > self.next_deadline:
+            # we are already past the following deadline, so it is missed
+            behind = int((now - self.next_deadline) / self.period) + 1
+            if (self.policy == "Catchup") and (behind <= self.max_catchup):
+                # leave the schedule alone; following ticks fire immediately
+                self.num_missed += 1
+            else:
+                # drop the missed ticks and resume on next future deadline
+                self.num_missed += behind
+                self.next_deadline += behind * self.period
+        return lateness
+
+    # returns lateness (seconds) at or below which pct (0-100) of the
+    # ticks fired; resolution is one histogram bin (upper edge of bin)
+    def get_lateness_percentile(self, pct):
+        if self.num_ticks == 0:
+            return 0
+        total = 0
+        for i in range(self.num_bins):
+            total += self.histogram[i]
+        needed = total * pct / 100
+        count = 0
+        for i in range(self.num_bins):
+            count += self.histogram[i]
+            if count >= needed:
+                return (i + 1) * self.bin_width
+        return self.num_bins * self.bin_width
+
+    def get_num_ticks(self):
+        return self.num_ticks
+
+    def get_num_missed(self):
+        return self.num_missed
+
+    def get_max_lateness(self):
+        return self.max_lateness
+
+    # measured seconds between the start of the last tick and the one
+    # before it (the nominal period until two ticks have fired)
+    def get_tick_interval(self):
+        return self.tick_interval
+
+
+# the slack an occasional job needs before the next control tick to risk
+# running.  the budget jumps up to a slow run of the job at once, then
+# decays (by decay of the difference) toward the run times since, and
+# toward minimum while the job is being put off, so one slow run doesn't
+# keep every later one from fitting
+class Slack_Budget:
+    def __init__(self, minimum, decay=0.1):
+        self.minimum = minimum
+        self.decay = decay
+        self.budget = minimum
+
+    def reset(self):
+        self.budget = self.minimum
+
+    # True if slack (seconds until the next tick) leaves room for the job;
+    # otherwise the job is put off and the budget relaxes a step
+    def allows(self, slack):
+        if slack < self.budget:
+            self.budget -= (self.budget - self.minimum) * self.decay
+            return False
+        return True
+
+    # call with how long the job took each time it runs
+    def record(self, duration):
+        if duration > self.budget:
+            self.budget = duration
+        else:
+            self.budget += (duration - self.budget) * self.decay
+            if self.budget < self.minimum:
+                self.budget = self.minimum
@@ -38,14 +38,25 @@
 from adafruit_display_text import label
 import terminalio
 import displayio
-import time
+import asyncio
+import math
+import json
+from array import array
 
 import mycolors
+from device_motors import curved_throttles
+
+# option indexes saved by the host sweep tool (linefollower_host/sweep.py)
+CONFIG_FILE = "/lfconfig.json"
+
+# line sensor reports positions 0 => 250, so steering table has 251 entries
+NUM_LINE_POSITIONS = 251
 
 
 class Mode_Config:
-    def __init__(self, tft_device):
+    def __init__(self, tft_device, device_buttons):
         self.this_tft = tft_device
+        self.device_buttons = device_buttons
         self.cur_selected_list_item = 0
         self.first_item_to_show = 0
         self.cur_selected_list_item = 0
@@ -55,8 +66,40 @@ class Mode_Config:
             ["Rxn Rate", "RR"],
             ["Rxn Limit", "RL"],
             ["Runtime Disp", "DSP"],
+            ["Overrun", "OVR"],
+            ["Disp FPS", "FPS"],
+            ["Run Log", "LOG"],
+            ["Steering", "STR"],
+            ["PID Kp", "KP"],
+            ["PID Ki", "KI"],
+            ["PID Kd", "KD"],
+            ["Predictor", "PRD"],
+            ["Pred Alpha", "PA"],
+            ["Pred Beta", "PB"],
+            ["Pred Lead", "PL"],
+            ["Position", "POS"],
         ]
         self.num_menu_items = len(self.menu_items)
+        # option index attribute for each parameter code
+        self.param_index_attrs = {
+            "THR": "throttle_index",
+            "LPS": "loop_speed_index",
+            "RR": "rxn_rate_index",
+            "RL": "rxn_limit_index",
+            "DSP": "showdisp_index",
+            "OVR": "overrun_index",
+            "FPS": "disp_fps_index",
+            "LOG": "runlog_index",
+            "STR": "steering_index",
+            "KP": "kp_index",
+            "KI": "ki_index",
+            "KD": "kd_index",
+            "PRD": "predictor_index",
+            "PA": "pred_alpha_index",
+            "PB": "pred_beta_index",
+            "PL": "pred_lead_index",
+            "POS": "position_mode_index",
+        }
 
         # menu options for configuration paramters
         # note that runtime display options use about 4 mS per loop if enabled
@@ -74,6 +117,32 @@ class Mode_Config:
         self.rxn_limit_index = 7
         self.showdisp_options = [ "No", "Yes" ] 
         self.showdisp_index = 0
+        self.overrun_options = [ "Skip", "Catchup" ]
+        self.overrun_index = 0
+        self.disp_fps_options = [ "Auto", 5, 10, 15, 20 ]
+        self.disp_fps_index = 3
+        self.runlog_options = [ "Off", "Stream" ]
+        self.runlog_index = 0
+        self.steering_options = [ "Table", "PID" ]
+        self.steering_index = 0
+        self.kp_options = [ 
+            0.5, 0.8, 1.0, 1.2, 1.4, 1.6, 2.0, 2.5, 3.0, 4.0 ]
+        self.kp_index = 4
+        self.ki_options = [ 0, 0.25, 0.5, 1.0, 2.0, 4.0 ]
+        self.ki_index = 0
+        self.kd_options = [ 0, 0.01, 0.02, 0.03, 0.05, 0.08, 0.12 ]
+        self.kd_index = 2
+        self.predictor_options = [ "Off", "On" ]
+        self.predictor_index = 0
+        self.pred_alpha_options = [ 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 1.0 ]
+        self.pred_alpha_index = 5
+        self.pred_beta_options = [ 
+            0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.7, 1.0 ]
+        self.pred_beta_index = 8
+        self.pred_lead_options = [ 0, 5, 10, 20, 30, 50 ]
+        self.pred_lead_index = 2
+        self.position_mode_options = [ "Sensor", "Centroid", "Quadratic" ]
+        self.position_mode_index = 0
         # fmt:on
 
         # actual configuration parameters
@@ -85,6 +154,47 @@ class Mode_Config:
         self.rxn_limit = self.rxn_limit_options[self.rxn_limit_index]
         # turning it off saves about 8 mS per loop
         self.show_runtime_display = self.showdisp_options[self.showdisp_index]
+        # what the loop scheduler does with ticks that miss their deadline
+        self.overrun_policy = self.overrun_options[self.overrun_index]
+        # runtime display frame rate; "Auto" leaves displayio auto_refresh on,
+        # a number turns it off and refreshes at that rate in loop slack time
+        self.disp_fps = self.disp_fps_options[self.disp_fps_index]
+        # "Stream" writes a run log to SD during the run (else B on the
+        # summary screen can still save one after the run)
+        self.runlog = self.runlog_options[self.runlog_index]
+        # "Table" steers from the lookup table below (proportional only,
+        # rxn_rate is the gain); "PID" uses Steer_PID with kp, ki, kd
+        self.steering = self.steering_options[self.steering_index]
+        # PID gains: curve per unit error (-1 => +1 across the sensor),
+        # per unit error-second, and per unit error/second
+        self.kp = self.kp_options[self.kp_index]
+        self.ki = self.ki_options[self.ki_index]
+        self.kd = self.kd_options[self.kd_index]
+        # "On" steers from the line position extrapolated (by Line_Predictor)
+        # to when the motor command is sent, rather than the raw reading
+        self.predictor = self.predictor_options[self.predictor_index]
+        # alpha-beta filter gains, and extra prediction time (mS) to allow
+        # for the motors' response
+        self.pred_alpha = self.pred_alpha_options[self.pred_alpha_index]
+        self.pred_beta = self.pred_beta_options[self.pred_beta_index]
+        self.pred_lead = self.pred_lead_options[self.pred_lead_index]
+        # "Sensor" steers from the line sensor's position byte; "Centroid"
+        # and "Quadratic" from Line_Estimator on its raw channel values
+        # (sensor protocol 3 only, else it stays with the position byte)
+        self.position_mode = self.position_mode_options[self.position_mode_index]
+
+        # steering lookup table, indexed by raw line position.  rebuilt
+        # whenever throttle, rxn_rate or rxn_limit change so the control
+        # loop only has to do an index lookup each tick
+        self.steer_curve = array("f", [0] * NUM_LINE_POSITIONS)
+        self.steer_limited = bytearray(NUM_LINE_POSITIONS)
+        self.steer_throt_L = array("f", [0] * NUM_LINE_POSITIONS)
+        self.steer_throt_R = array("f", [0] * NUM_LINE_POSITIONS)
+        # same values scaled by 1000 as ints, for telemetry logging
+        self.steer_curve_milli = array("h", [0] * NUM_LINE_POSITIONS)
+        self.steer_throt_L_milli = array("h", [0] * NUM_LINE_POSITIONS)
+        self.steer_throt_R_milli = array("h", [0] * NUM_LINE_POSITIONS)
+        self._build_steering_table()
 
         self.this_group = displayio.Group(max_size=10)
 
@@ -148,78 +258,53 @@ class Mode_Config:
 
     # this function initiates mode, runs it till done, then returns text
     # string indicating next mode
-    def run_mode(self):
+    async def run_mode(self):
         self.show_this_screen()
         self.textbox_1.text = "UP / DOWN select param"
         self.textbox_2.text = "LEFT / RIGHT chg param"
         self.textbox_6.text = "Click A to exit"
 
+        self.device_buttons.clear_events()
         while True:
-            # note possibilities are buttons.up buttons.down buttons.left
-            # buttons.right buttons.select buttons.a buttons.b
-            buttons = self.this_tft.buttons
+            # note possibilities are up down left right select a b
+            # (events are queued by the button service; no I2C here)
+            button = self.device_buttons.get_press(
+                repeat_buttons=("up", "down", "left", "right")
+            )
             mustScrollDisplay = False
             mustUpdateValues = False
 
-            if buttons.up:
+            if button == "up":
                 # print("Button UP!")
-                still_pressed = True
-                while still_pressed:
-                    buttons = self.this_tft.buttons
-                    still_pressed = buttons.up
-                    time.sleep(0.05)
-                # print("released")
                 self.cur_selected_list_item -= 1
                 if self.cur_selected_list_item < 0:
                     self.cur_selected_list_item = self.num_menu_items - 1
 
-            elif buttons.down:
+            elif button == "down":
                 # print("Button Down!")
-                still_pressed = True
-                while still_pressed:
-                    buttons = self.this_tft.buttons
-                    still_pressed = buttons.down
-                    time.sleep(0.05)
-                # print("released")
                 self.cur_selected_list_item += 1
                 if self.cur_selected_list_item >= self.num_menu_items:
                     self.cur_selected_list_item = 0
 
-            elif buttons.left:
-                # print("Button Down!")
-                still_pressed = True
-                while still_pressed:
-                    buttons = self.this_tft.buttons
-                    still_pressed = buttons.down
-                    time.sleep(0.05)
-                # print("released")
+            elif button == "left":
+                # print("Button Left!")
                 temp = self._scroll_param(
                     self.menu_items[self.cur_selected_list_item][1], -1
                 )
                 # print(temp)
                 mustUpdateValues = True
 
-            elif buttons.right:
-                # print("Button Down!")
-                still_pressed = True
-                while still_pressed:
-                    buttons = self.this_tft.buttons
-                    still_pressed = buttons.down
-                    time.sleep(0.05)
-                # print("released")
+            elif button == "right":
+                # print("Button Right!")
                 temp = self._scroll_param(
                     self.menu_items[self.cur_selected_list_item][1], +1
                 )
                 # print(temp)
                 mustUpdateValues = True
 
-            elif buttons.a:
+            elif button == "a":
                 # print("Button A!")
-                still_pressed = True
-                while still_pressed:
-                    buttons = self.this_tft.buttons
-                    still_pressed = buttons.a
-                    time.sleep(0.05)
+                self.device_buttons.clear_events()
                 return
 
             else:
@@ -285,7 +370,7 @@ class Mode_Config:
                 self.textbox_5.color = mycolors.WHITE
                 self.textbox_5v.color = mycolors.GREEN
 
-            time.sleep(0.1)
+            await asyncio.sleep(0.1)
 
     def _scroll_param(self, param, updown):
         if param == "THR":
@@ -298,6 +383,30 @@ class Mode_Config:
             temp = self._scroll_rxn_limit(updown)
         elif param == "DSP":
             temp = self._scroll_showdisp(updown)
+        elif param == "OVR":
+            temp = self._scroll_overrun(updown)
+        elif param == "FPS":
+            temp = self._scroll_disp_fps(updown)
+        elif param == "LOG":
+            temp = self._scroll_runlog(updown)
+        elif param == "STR":
+            temp = self._scroll_steering(updown)
+        elif param == "KP":
+            temp = self._scroll_kp(updown)
+        elif param == "KI":
+            temp = self._scroll_ki(updown)
+        elif param == "KD":
+            temp = self._scroll_kd(updown)
+        elif param == "PRD":
+            temp = self._scroll_predictor(updown)
+        elif param == "PA":
+            temp = self._scroll_pred_alpha(updown)
+        elif param == "PB":
+            temp = self._scroll_pred_beta(updown)
+        elif param == "PL":
+            temp = self._scroll_pred_lead(updown)
+        elif param == "POS":
+            temp = self._scroll_position_mode(updown)
         else:
             temp = 0
         return temp
@@ -313,10 +422,84 @@ class Mode_Config:
             temp = self.get_rxn_limit()
         elif param == "DSP":
             temp = self.get_showdisp()
+        elif param == "OVR":
+            temp = self.get_overrun_policy()
+        elif param == "FPS":
+            temp = self.get_disp_fps()
+        elif param == "LOG":
+            temp = self.get_runlog()
+        elif param == "STR":
+            temp = self.get_steering()
+        elif param == "KP":
+            temp = self.get_kp()
+        elif param == "KI":
+            temp = self.get_ki()
+        elif param == "KD":
+            temp = self.get_kd()
+        elif param == "PRD":
+            temp = self.get_predictor()
+        elif param == "PA":
+            temp = self.get_pred_alpha()
+        elif param == "PB":
+            temp = self.get_pred_beta()
+        elif param == "PL":
+            temp = self.get_pred_lead()
+        elif param == "POS":
+            temp = self.get_position_mode()
         else:
             temp = 0
         return temp
 
+    # selects option number index of a parameter (by its menu code, eg. "THR")
+    # as if it had been scrolled to; used by host tools to apply a config
+    def set_param_index(self, param, index):
+        attr = self.param_index_attrs[param]
+        setattr(self, attr, index - 1)
+        return self._scroll_param(param, 1)
+
+    # applies option indexes from a json file ({"THR": 3, "RR": 8, ...}) such
+    # as the one the host sweep tool writes; a missing file is ignored.
+    # returns the number of parameters that were set
+    def load_config(self, path=CONFIG_FILE):
+        try:
+            with open(path) as f:
+                indexes = json.load(f)
+        except (OSError, ValueError):
+            return 0
+        num_set = 0
+        for param, index in indexes.items():
+            attr = self.param_index_attrs.get(param)
+            if attr is None:
+                print("config: unknown parameter", param)
+                continue
+            options = getattr(self, attr.replace("_index", "_options"))
+            if not (0 <= index < len(options)):
+                print("config: bad index for", param, index)
+                continue
+            self.set_param_index(param, index)
+            num_set += 1
+        return num_set
+
+    # fills the steering lookup table for the current throttle, rxn_rate and
+    # rxn_limit. curve is -1 * (position - 125) / (125 / rxn_rate), clamped
+    # to +/- rxn_limit (steer_limited flags the clamped entries), and the
+    # wheel throttles are what move_forward_curved() would apply for it
+    def _build_steering_table(self):
+        for position in range(NUM_LINE_POSITIONS):
+            curve = -1 * (position - 125) / (125 / self.rxn_rate)
+            if abs(curve) > self.rxn_limit:
+                curve = math.copysign(self.rxn_limit, curve)
+                self.steer_limited[position] = 1
+            else:
+                self.steer_limited[position] = 0
+            self.steer_curve[position] = curve
+            throt_L, throt_R = curved_throttles(self.throttle, curve)
+            self.steer_throt_L[position] = throt_L
+            self.steer_throt_R[position] = throt_R
+            self.steer_curve_milli[position] = int(round(curve * 1000))
+            self.steer_throt_L_milli[position] = int(round(throt_L * 1000))
+            self.steer_throt_R_milli[position] = int(round(throt_R * 1000))
+
     def get_throttle(self):
         return self.throttle
 
@@ -331,6 +514,7 @@ class Mode_Config:
             if self.throttle_index > (len(self.throttle_options) - 1):
                 self.throttle_index = 0
         self.throttle = self.throttle_options[self.throttle_index]
+        self._build_steering_table()
         return self.throttle
 
     def get_loop_speed(self):
@@ -363,6 +547,7 @@ class Mode_Config:
             if self.rxn_rate_index > (len(self.rxn_rate_options) - 1):
                 self.rxn_rate_index = 0
         self.rxn_rate = self.rxn_rate_options[self.rxn_rate_index]
+        self._build_steering_table()
         return self.rxn_rate
 
     def get_rxn_limit(self):
@@ -379,6 +564,7 @@ class Mode_Config:
             if self.rxn_limit_index > (len(self.rxn_limit_options) - 1):
                 self.rxn_limit_index = 0
         self.rxn_limit = self.rxn_limit_options[self.rxn_limit_index]
+        self._build_steering_table()
         return self.rxn_limit
 
     def get_showdisp(self):
@@ -395,3 +581,183 @@ class Mode_Config:
                 self.showdisp_index = 0
         self.show_runtime_display = self.showdisp_options[self.showdisp_index]
         return self.show_runtime_display
+
+    def get_overrun_policy(self):
+        return self.overrun_policy
+
+    def _scroll_overrun(self, updown):
+        if updown < 0:
+            self.overrun_index -= 1
+            if self.overrun_index < 0:
+                self.overrun_index = len(self.overrun_options) - 1
+        else:
+            self.overrun_index += 1
+            if self.overrun_index > (len(self.overrun_options) - 1):
+                self.overrun_index = 0
+        self.overrun_policy = self.overrun_options[self.overrun_index]
+        return self.overrun_policy
+
+    def get_disp_fps(self):
+        return self.disp_fps
+
+    def _scroll_disp_fps(self, updown):
+        if updown < 0:
+            self.disp_fps_index -= 1
+            if self.disp_fps_index < 0:
+                self.disp_fps_index = len(self.disp_fps_options) - 1
+        else:
+            self.disp_fps_index += 1
+            if self.disp_fps_index > (len(self.disp_fps_options) - 1):
+                self.disp_fps_index = 0
+        self.disp_fps = self.disp_fps_options[self.disp_fps_index]
+        return self.disp_fps
+
+    def get_runlog(self):
+        return self.runlog
+
+    def _scroll_runlog(self, updown):
+        if updown < 0:
+            self.runlog_index -= 1
+            if self.runlog_index < 0:
+                self.runlog_index = len(self.runlog_options) - 1
+        else:
+            self.runlog_index += 1
+            if self.runlog_index > (len(self.runlog_options) - 1):
+                self.runlog_index = 0
+        self.runlog = self.runlog_options[self.runlog_index]
+        return self.runlog
+
+    def get_steering(self):
+        return self.steering
+
+    def _scroll_steering(self, updown):
+        if updown < 0:
+            self.steering_index -= 1
+            if self.steering_index < 0:
+                self.steering_index = len(self.steering_options) - 1
+        else:
+            self.steering_index += 1
+            if self.steering_index > (len(self.steering_options) - 1):
+                self.steering_index = 0
+        self.steering = self.steering_options[self.steering_index]
+        return self.steering
+
+    def get_kp(self):
+        return self.kp
+
+    def _scroll_kp(self, updown):
+        if updown < 0:
+            self.kp_index -= 1
+            if self.kp_index < 0:
+                self.kp_index = len(self.kp_options) - 1
+        else:
+            self.kp_index += 1
+            if self.kp_index > (len(self.kp_options) - 1):
+                self.kp_index = 0
+        self.kp = self.kp_options[self.kp_index]
+        return self.kp
+
+    def get_ki(self):
+        return self.ki
+
+    def _scroll_ki(self, updown):
+        if updown < 0:
+            self.ki_index -= 1
+            if self.ki_index < 0:
+                self.ki_index = len(self.ki_options) - 1
+        else:
+            self.ki_index += 1
+            if self.ki_index > (len(self.ki_options) - 1):
+                self.ki_index = 0
+        self.ki = self.ki_options[self.ki_index]
+        return self.ki
+
+    def get_kd(self):
+        return self.kd
+
+    def _scroll_kd(self, updown):
+        if updown < 0:
+            self.kd_index -= 1
+            if self.kd_index < 0:
+                self.kd_index = len(self.kd_options) - 1
+        else:
+            self.kd_index += 1
+            if self.kd_index > (len(self.kd_options) - 1):
+                self.kd_index = 0
+        self.kd = self.kd_options[self.kd_index]
+        return self.kd
+
+    def get_predictor(self):
+        return self.predictor
+
+    def _scroll_predictor(self, updown):
+        if updown < 0:
+            self.predictor_index -= 1
+            if self.predictor_index < 0:
+                self.predictor_index = len(self.predictor_options) - 1
+        else:
+            self.predictor_index += 1
+            if self.predictor_index > (len(self.predictor_options) - 1):
+                self.predictor_index = 0
+        self.predictor = self.predictor_options[self.predictor_index]
+        return self.predictor
+
+    def get_pred_alpha(self):
+        return self.pred_alpha
+
+    def _scroll_pred_alpha(self, updown):
+        if updown < 0:
+            self.pred_alpha_index -= 1
+            if self.pred_alpha_index < 0:
+                self.pred_alpha_index = len(self.pred_alpha_options) - 1
+        else:
+            self.pred_alpha_index += 1
+            if self.pred_alpha_index > (len(self.pred_alpha_options) - 1):
+                self.pred_alpha_index = 0
+        self.pred_alpha = self.pred_alpha_options[self.pred_alpha_index]
+        return self.pred_alpha
+
+    def get_pred_beta(self):
+        return self.pred_beta
+
+    def _scroll_pred_beta(self, updown):
+        if updown < 0:
+            self.pred_beta_index -= 1
+            if self.pred_beta_index < 0:
+                self.pred_beta_index = len(self.pred_beta_options) - 1
+        else:
+            self.pred_beta_index += 1
+            if self.pred_beta_index > (len(self.pred_beta_options) - 1):
+                self.pred_beta_index = 0
+        self.pred_beta = self.pred_beta_options[self.pred_beta_index]
+        return self.pred_beta
+
+    def get_pred_lead(self):
+        return self.pred_lead
+
+    def _scroll_pred_lead(self, updown):
+        if updown < 0:
+            self.pred_lead_index -= 1
+            if self.pred_lead_index < 0:
+                self.pred_lead_index = len(self.pred_lead_options) - 1
+        else:
+            self.pred_lead_index += 1
+            if self.pred_lead_index > (len(self.pred_lead_options) - 1):
+                self.pred_lead_index = 0
+        self.pred_lead = self.pred_lead_options[self.pred_lead_index]
+        return self.pred_lead
+
+    def get_position_mode(self):
+        return self.position_mode
+
+    def _scroll_position_mode(self, updown):
+        if updown < 0:
+            self.position_mode_index -= 1
+            if self.position_mode_index < 0:
+                self.position_mode_index = len(self.position_mode_options) - 1
+        else:
+            self.position_mode_index += 1
+            if self.position_mode_index > (len(self.position_mode_options) - 1):
+                self.position_mode_index = 0
+        self.position_mode = self.position_mode_options[self.position_mode_index]
+        return self.position_mode
@@ -35,15 +35,21 @@
 # 
 """
 
-import time
+import asyncio
 import mycolors
 
 
 class Mode_DriveShapes:
     def __init__(
-        self, screen_dashboard, device_motors, device_linesense, device_storage
+        self,
+        screen_dashboard,
+        device_motors,
+        device_linesense,
+        device_storage,
+        device_buttons,
     ):
         self.screen_dashboard = screen_dashboard
+        self.device_buttons = device_buttons
         self.device_motors = device_motors
         self.device_linesense = device_linesense
         self.device_storage = device_storage
@@ -53,9 +59,9 @@ class Mode_DriveShapes:
 
     # this function initiates mode, runs it till done, then returns text
     # string indicating next mode
-    def run_straight(self):
+    async def run_straight(self):
         self.screen_dashboard.show_this_screen()
-        status = self.prepare_to_start()
+        status = await self.prepare_to_start()
         if status == "CANCEL":
             return "MAINMENU"
         self.screen_dashboard.set_text1("Driving Straight 100 cm")
@@ -64,16 +70,16 @@ class Mode_DriveShapes:
         self.screen_dashboard.set_text4("")
         self.screen_dashboard.set_text5("")
 
-        self.device_motors.motors_accelerate(0.6)
+        await self.device_motors.motors_accelerate(0.6)
         self.device_motors.move_forward(0.6)
-        time.sleep(100 / 30)
-        self.device_motors.motors_accelerate(0)
+        await asyncio.sleep(100 / 30)
+        await self.device_motors.motors_accelerate(0)
         self.device_motors.motors_stop()
         return "MAINMENU"
 
-    def run_curveleft(self):
+    async def run_curveleft(self):
         self.screen_dashboard.show_this_screen()
-        status = self.prepare_to_start()
+        status = await self.prepare_to_start()
         if status == "CANCEL":
             return "MAINMENU"
         self.screen_dashboard.set_text1("Curving Left")
@@ -82,16 +88,16 @@ class Mode_DriveShapes:
         self.screen_dashboard.set_text4("")
         self.screen_dashboard.set_text5("")
 
-        self.device_motors.motors_accelerate(0.5)
+        await self.device_motors.motors_accelerate(0.5)
         self.device_motors.move_forward_curved(0.5, -0.2)
-        time.sleep(2)
-        self.device_motors.motors_accelerate(0)
+        await asyncio.sleep(2)
+        await self.device_motors.motors_accelerate(0)
         self.device_motors.motors_stop()
         return "MAINMENU"
 
-    def run_curveright(self):
+    async def run_curveright(self):
         self.screen_dashboard.show_this_screen()
-        status = self.prepare_to_start()
+        status = await self.prepare_to_start()
         if status == "CANCEL":
             return "MAINMENU"
         self.screen_dashboard.set_text1("Curving Right")
@@ -100,28 +106,20 @@ class Mode_DriveShapes:
         self.screen_dashboard.set_text4("")
         self.screen_dashboard.set_text5("")
 
-        self.device_motors.motors_accelerate(0.5)
+        await self.device_motors.motors_accelerate(0.5)
         self.device_motors.move_forward_curved(0.5, 0.1)
-        time.sleep(2)
-        self.device_motors.motors_accelerate(0)
+        await asyncio.sleep(2)
+        await self.device_motors.motors_accelerate(0)
         self.device_motors.motors_stop()
         return "MAINMENU"
 
-    def follow_path(self):
+    async def follow_path(self):
         # fake_location = 0
         # fake_increment = 5
 
         while True:
-            buttons = self.screen_dashboard.this_tft.buttons
-
-            if buttons.a:
+            if self.device_buttons.was_pressed("a"):
                 # print("Button A cycle")
-                still_pressed = True
-                while still_pressed:
-                    buttons = self.screen_dashboard.this_tft.buttons
-                    still_pressed = buttons.a
-                    time.sleep(0.05)
-                # print("released")
                 return
 
             self.lineposition = self.device_linesense.get_position() - 125
@@ -132,11 +130,11 @@ class Mode_DriveShapes:
             self.screen_dashboard.show_left_throttle(fake_throttle)
             self.screen_dashboard.show_right_throttle(fake_throttle)
 
-            time.sleep(0.3)
+            await asyncio.sleep(0.3)
 
-    def prepare_to_start(self):
-        self.screen_dashboard.show_left_throttle(0)
-        self.screen_dashboard.show_right_throttle(0)
+    async def prepare_to_start(self):
+        self.screen_dashboard.show_L_throttle(0)
+        self.screen_dashboard.show_R_throttle(0)
         # self.screen_dashboard.hide_line_position()
 
         self.screen_dashboard.set_text1("Place robot on track")
@@ -144,6 +142,7 @@ class Mode_DriveShapes:
         self.screen_dashboard.set_text4("Run # 1", mycolors.WHITE, "L")
         self.screen_dashboard.set_text5("Starting Soon", mycolors.WHITE, "L")
 
+        self.device_buttons.clear_events()
         time_til_start = 5
         while time_til_start > 0:
             self.screen_dashboard.set_text3(
@@ -152,16 +151,9 @@ class Mode_DriveShapes:
             time_til_start -= 1
             # now wait 1 second, but check for "A" button cancel every 0.1 sec
             for i in range(10):
-                buttons = self.screen_dashboard.this_tft.buttons
-                if buttons.a:
-                    still_pressed = True
-                    while still_pressed:
-                        buttons = self.screen_dashboard.this_tft.buttons
-                        still_pressed = buttons.a
-                        time.sleep(0.05)
-                    # print("released")
+                if self.device_buttons.was_pressed("a"):
                     return "CANCEL"
-                time.sleep(0.1)
+                await asyncio.sleep(0.1)
 
         self.screen_dashboard.set_text4("")  # clear out run number
         self.screen_dashboard.set_text5("")  # clear out "starting soon"
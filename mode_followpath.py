@@ -34,9 +34,13 @@
 # SOFTWARE.
 # 
 """
-import time
-import math
+import device_clock
+import asyncio
 import mycolors
+from loop_scheduler import Loop_Scheduler
+from steer_pid import Steer_PID
+from line_predictor import Line_Predictor
+from device_storage import LOGFLAG_STALE_READ
 
 
 class Mode_FollowPath:
@@ -47,12 +51,20 @@ class Mode_FollowPath:
         device_linesense,
         device_storage,
         mode_config,
+        device_buttons,
+        device_battery,
+        print_stats=False,
     ):
         self.screen_dashboard = screen_dashboard
+        self.device_buttons = device_buttons
+        self.device_battery = device_battery
         self.device_motors = device_motors
         self.device_linesense = device_linesense
         self.device_storage = device_storage
         self.mode_config = mode_config
+        # print display, sensor and I2C counters after each run (bench
+        # diagnostics; the summary screen has what a run needs)
+        self.print_stats = print_stats
         self.lineposition = 0  # initially say its in middle (-125 to +125)
         self.throttle_left = 0  # -100 full back, +100=full fwd, 0=stopped
         self.throttle_right = 0  # -100 full back, +100=full fwd, 0=stopped
@@ -71,20 +83,112 @@ class Mode_FollowPath:
             0  # total seconds in all loops (processing time not including loopdelay)
         )
         self.total_run_time = 0  # total clock duration of run in seconds
+        self.start_run_time = 0
+        self.steer_index = 125  # steering table entry used by last tick
+        self.steer_pid = Steer_PID()  # used instead of table if Steering=PID
+        self.use_pid = False
+        # extrapolates readings to when the motors get them, if Predictor=On
+        self.line_predictor = Line_Predictor()
+        self.use_predictor = False
+        # position from the sensor's raw frame (Line_Estimator) if Position
+        # isn't "Sensor" and the sensor supports it
+        self.use_estimator = False
+        self.sample_time = 0  # when the last reading was taken
+        self.sample_interval = 0  # seconds between the last two readings
+        self.read_flags = 0  # LOGFLAG_STALE_READ if the reading was stale
+        self.log_path = None  # run log streamed during last run (if any)
+
+        # fires control ticks on a fixed-rate schedule and tracks jitter
+        self.loop_scheduler = Loop_Scheduler()
 
     # this function initiates mode, runs it till done, then returns text string indicating next mode
-    def run_mode(self):
+    # it runs as the foreground coroutine under the runtime (see runtime.py);
+    # while driving, the loop scheduler is registered with the runtime so
+    # background jobs only use the slack between control ticks
+    async def run_mode(self, runtime):
         self.screen_dashboard.show_this_screen()
         self.run_number += 1
-        status = self.prepare_to_start()
+        status = await self.prepare_to_start()
         if status == "CANCEL":
             return "MAINMENU"
+
+        self.start_run()
+        runtime.set_control(self.loop_scheduler)
+        fps = self.mode_config.get_disp_fps()
+        if (self.mode_config.get_showdisp() == "Yes") and (fps != "Auto"):
+            # display is refreshed by the runtime's display job, only in
+            # the slack after each tick's motor command
+            self.screen_dashboard.begin_paced_refresh(fps, runtime.slack)
+        self.log_path = None
+        if self.mode_config.get_runlog() == "Stream":
+            # records are packed each tick; the runtime's log job writes them
+            self.device_storage.begin_run_log(
+                self.make_log_header(0, 0), runtime.slack
+            )
+        try:
+            while True:
+                # sleep until this tick's deadline (fixed-rate, so no drift),
+                # letting lower priority tasks use the time meanwhile
+                remaining = self.loop_scheduler.time_until_tick()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                start_loop_time = self.start_tick()
+                if start_loop_time is None:
+                    break
+
+                # yield (rather than spin) if the sensor conversion that was
+                # started at the end of last tick isn't finished yet
+                remaining = self.device_linesense.time_until_quickposition_ready()
+                if remaining > 0:
+                    await asyncio.sleep(remaining)
+                if not self.run_tick(start_loop_time):
+                    break
+        finally:
+            runtime.set_control(None)
+            self.screen_dashboard.end_paced_refresh()
+
+        self.finish_run()
+        if self.device_storage.is_streaming():
+            num_records, num_dropped = self.device_storage.get_log_counts()
+            self.device_storage.end_run_log(
+                self.make_log_header(num_records, num_dropped)
+            )
+            self.log_path = self.device_storage.get_last_log_path()
+        return "MAINMENU"
+
+    # resets run statistics, brings motors up to speed and primes the sensor
+    # and loop scheduler; call just before the first control tick
+    def start_run(self):
         self.screen_dashboard.set_text1("", mycolors.RED, "C")
         self.screen_dashboard.set_text2("Click A to quit")
         self.screen_dashboard.set_text3("", mycolors.PINK, "C")
         self.screen_dashboard.set_text4("")
         self.screen_dashboard.set_text5("")
+        self.reset_run_stats()
+
+        if self.mode_config.get_showdisp() == "No":
+            self.screen_dashboard.hide_line_position()
+            self.screen_dashboard.set_text4("Runtime Display OFF")
+            self.screen_dashboard.set_text5("to reduce process time")
+        self.screen_dashboard.reset_render_stats()
+        self.device_storage.clear_telemetry()
+        self.device_linesense.i2c_bus.reset_stats()
+
+        self.start_run_time = device_clock.monotonic()
 
+        # the base throttle ramps up over the first ticks (with steering
+        # applied on top of it from the first tick) rather than blocking
+        self.device_motors.ramp_to(self.mode_config.throttle, steered=True)
+        self.device_linesense.start_quickposition_check()  # initiate first linesens
+        self.loop_scheduler.start(
+            self.mode_config.loop_speed, self.mode_config.get_overrun_policy()
+        )
+
+    # zeroes the statistics kept for the summary screen and readies the
+    # steering for a new run; start_run() calls this, and so does the host
+    # track simulator before driving control_tick
+    def reset_run_stats(self):
+        self.reset_steering()
         self.num_green = 0  # number of cycles in green range
         self.num_left = 0  # number of cycles left of center (left of "green" range)
         self.num_right = 0  # number of cycles right of center (right of "green" range)
@@ -98,76 +202,230 @@ class Mode_FollowPath:
         )
         self.total_run_time = 0  # total clock duration of run in seconds
 
-        if self.mode_config.get_showdisp() == "No":
-            self.screen_dashboard.hide_line_position()
-            self.screen_dashboard.set_text4("Runtime Display OFF")
-            self.screen_dashboard.set_text5("to reduce process time")
+    # picks table or PID steering (and predictor on or off) per
+    # mode_config, and clears their history
+    def reset_steering(self):
+        self.use_pid = self.mode_config.get_steering() == "PID"
+        self.use_predictor = self.mode_config.get_predictor() == "On"
+        # False (sensor's own position) unless the sensor sends raw frames
+        self.use_estimator = self.device_linesense.set_estimator(
+            self.mode_config.get_position_mode()
+        )
+        self.steer_index = 125
+        self.line_predictor.configure(
+            self.mode_config.get_pred_alpha(),
+            self.mode_config.get_pred_beta(),
+            0.001 * self.mode_config.get_pred_lead(),
+        )
+        self.sample_time = 0
+        self.steer_pid.configure(
+            self.mode_config.get_throttle(),
+            self.mode_config.get_kp(),
+            self.mode_config.get_ki(),
+            self.mode_config.get_kd(),
+            self.mode_config.get_rxn_limit(),
+        )
 
-        start_run_time = time.monotonic()
+    # starts the motors ramping down (the runtime's motors job finishes
+    # the ramp; this doesn't wait for it) and records total run time
+    def finish_run(self):
+        self.device_motors.ramp_to(0)
+        end_run_time = device_clock.monotonic()
+        # calculate work length of this run loop in fractional seconds
+        self.total_run_time = end_run_time - self.start_run_time
+        if self.print_stats:
+            self._print_run_stats()
 
-        self.device_motors.motors_accelerate(self.mode_config.throttle)
-        self.device_linesense.start_quickposition_check()  # initiate first linesens
-        while True:
-            start_loop_time = time.monotonic()
-            buttons = self.screen_dashboard.this_tft.buttons
-
-            if buttons.a:
-                # print("Button A cycle")
-                still_pressed = True
-                while still_pressed:
-                    buttons = self.screen_dashboard.this_tft.buttons
-                    still_pressed = buttons.a
-                    time.sleep(0.05)
-                # print("released")
-
-                self.device_motors.motors_accelerate(0)
-                end_run_time = time.monotonic()
-                # calculate work length of this run loop in fractional seconds
-                self.total_run_time = end_run_time - start_run_time
-                return "MAINMENU"
-
-            # slow, normal way...
-            # self.lineposition = self.device_linesense.get_position()
-
-            while not self.device_linesense.is_quickposition_ready():
-                pass
-            self.lineposition = self.device_linesense.get_quickposition()
-            # initiate next read (for next loop)
-            self.device_linesense.start_quickposition_check()
-            self.screen_dashboard.show_line_position(self.lineposition)
-
-            curve = -1 * (self.lineposition - 125) / (125 / self.mode_config.rxn_rate)
-            if abs(curve) > self.mode_config.rxn_limit:
-                curve = math.copysign(self.mode_config.rxn_limit, curve)
+    def _print_run_stats(self):
+        if self.mode_config.get_showdisp() == "Yes":
+            print(
+                "dashboard updates:",
+                self.screen_dashboard.get_num_gauge_updates(),
+                "skipped (unchanged):",
+                self.screen_dashboard.get_num_skipped_updates(),
+            )
+            print(
+                "display frames:",
+                self.screen_dashboard.get_num_frames(),
+                "deferred:",
+                self.screen_dashboard.get_num_frames_deferred(),
+            )
+        print(
+            "sensor stale reads:",
+            self.device_linesense.get_num_stale_reads(),
+            "polls:",
+            self.device_linesense.get_num_polls(),
+            "wait mS:",
+            self.device_linesense.get_read_wait() * 1000,
+        )
+        self.device_linesense.i2c_bus.print_stats()
+
+    # returns True if user clicked A to end the run; this only looks at the
+    # button service's event queue so it costs no I2C traffic in the tick
+    def is_cancel_requested(self):
+        return self.device_buttons.was_pressed("a")
+
+    # a control tick is start_tick() once it is due, then (once the sensor
+    # is ready) run_tick(); run_mode waits for both, and the host bench
+    # calls the same two.  start_tick returns the tick's start time, or
+    # None if A was clicked to end the run
+    def start_tick(self):
+        self.loop_scheduler.tick()
+        start_loop_time = device_clock.monotonic()
+        if self.is_cancel_requested():
+            return None
+        return start_loop_time
+
+    # the work of one tick once the sensor is ready: steer for the new
+    # position, then account and log the tick's processing time; returns
+    # False if the run has to end
+    def run_tick(self, start_loop_time):
+        lineposition = self.acquire_position()
+        fine_position = None
+        if self.use_estimator:
+            fine_position = self.device_linesense.get_fine_position()
+        self.control_tick(
+            lineposition,
+            self.loop_scheduler.get_tick_interval(),
+            self.sample_interval,
+            device_clock.monotonic() - self.sample_time,
+            fine_position,
+        )
+
+        end_loop_time = device_clock.monotonic()
+        this_loop_duration = end_loop_time - start_loop_time
+        self.total_proc_time += this_loop_duration  # in fractional seconds
+        self.record_telemetry(start_loop_time, this_loop_duration)
+
+        # a failed sensor read only costs a stale position, but if the
+        # sensor stays unreachable stop rather than steer blind
+        if self.device_linesense.is_link_down():
+            self.screen_dashboard.set_text1("Sensor lost", mycolors.RED, "C")
+            print("line sensor link down; run ended")
+            return False
+        return True
+
+    # reads the position that was requested last tick, and starts the read
+    # for the next tick (sensor must be ready; see is_quickposition_ready)
+    def acquire_position(self):
+        # slow, normal way...
+        # self.lineposition = self.device_linesense.get_position()
+
+        sample_time = self.device_linesense.get_quickposition_time()
+        # reads the result and initiates next read (for next loop)
+        lineposition = self.device_linesense.cycle_quickposition()
+        if self.device_linesense.is_fresh():
+            self.read_flags = 0
+        else:
+            self.read_flags = LOGFLAG_STALE_READ
+        self.sample_interval = sample_time - self.sample_time
+        self.sample_time = sample_time
+        return lineposition
+
+    # stores this tick in the telemetry buffer (see Device_Storage); the
+    # steering values are read back from the table entry control_tick used
+    # (or from the PID controller's last outputs)
+    def record_telemetry(self, start_loop_time, loop_duration):
+        if self.use_pid:
+            pid = self.steer_pid
+            self.device_storage.record_tick(
+                int((start_loop_time - self.start_run_time) * 1000),
+                self.lineposition,
+                pid.curve_milli,
+                pid.throt_L_milli,
+                pid.throt_R_milli,
+                int(loop_duration * 1000000),
+                # limited is the same bit as LOGFLAG_RXN_LIMIT
+                pid.limited | self.read_flags,
+                self.line_predictor.residual,
+            )
+            return
+        i = self.steer_index
+        self.device_storage.record_tick(
+            int((start_loop_time - self.start_run_time) * 1000),
+            self.lineposition,
+            self.mode_config.steer_curve_milli[i],
+            self.mode_config.steer_throt_L_milli[i],
+            self.mode_config.steer_throt_R_milli[i],
+            int(loop_duration * 1000000),
+            # steer_limited is the same bit as LOGFLAG_RXN_LIMIT
+            self.mode_config.steer_limited[i] | self.read_flags,
+            self.line_predictor.residual,
+        )
+
+    # builds run log header for this run (see Device_Storage.make_log_header)
+    def make_log_header(self, num_records, num_dropped):
+        return self.device_storage.make_log_header(
+            self.run_number,
+            self.mode_config,
+            self.device_linesense,
+            self.device_battery,
+            num_records,
+            num_dropped,
+        )
+
+    # one control step: steers the motors for the given line position
+    # (0 => 250) and updates the run statistics.  dt is seconds since the
+    # previous tick, sample_dt seconds since the previous reading was
+    # taken and age how old this one is (PID and predictor only; each
+    # defaults to the nominal loop speed, a reading one period old).
+    # fine_position, if given, is steered from instead of lineposition
+    def control_tick(
+        self, lineposition, dt=None, sample_dt=None, age=None, fine_position=None
+    ):
+        self.lineposition = lineposition
+        self.screen_dashboard.show_line_position(lineposition)
+
+        if dt is None:
+            dt = self.mode_config.loop_speed
+        position = lineposition
+        if fine_position is not None:
+            position = fine_position
+        if position > 250:
+            position = 250
+        if self.use_predictor:
+            if sample_dt is None:
+                sample_dt = dt
+            if age is None:
+                age = dt
+            position = self.line_predictor.update(position, sample_dt, age)
+        if self.use_pid:
+            pid = self.steer_pid
+            pid.update(position, dt)
+            if pid.limited:
+                self.num_rxn_limit += 1
+            self.device_motors.move_forward_wheels_ramped(pid.throt_L, pid.throt_R)
+        else:
+            # steering and wheel throttles come from the precomputed table
+            # in mode_config (see Mode_Config._build_steering_table)
+            position = int(position + 0.5)
+            self.steer_index = position
+            if self.mode_config.steer_limited[position]:
                 self.num_rxn_limit += 1
 
-            self.device_motors.move_forward_curved(self.mode_config.throttle, curve)
+            self.device_motors.move_forward_wheels_ramped(
+                self.mode_config.steer_throt_L[position],
+                self.mode_config.steer_throt_R[position],
+            )
 
-            # note that little numbers mean i'm LEFT of line (line is to my right)
-            # big numbers mean i'm RIGHT of line (line is to my left)
-            # numbers < 5 or > 245 are basically OFF the line
-            if abs(self.lineposition - 125) < 30:
-                self.num_green += 1
-            if (self.lineposition < 5) or (self.lineposition > 245):
+        # note that little numbers mean i'm LEFT of line (line is to my right)
+        # big numbers mean i'm RIGHT of line (line is to my left)
+        # numbers < 5 or > 245 are basically OFF the line
+        if abs(lineposition - 125) < 30:
+            self.num_green += 1
+        if self.use_estimator:
+            # the estimator knows from the contrast, not the position
+            if self.device_linesense.is_line_lost():
                 self.num_offtrack += 1
-            if self.lineposition < 95:
-                self.num_left += 1
-            if self.lineposition > 155:
-                self.num_right += 1
-            self.num_loops += 1
-
-            end_loop_time = time.monotonic()
-            this_loop_duration = end_loop_time - start_loop_time
-            self.total_proc_time += this_loop_duration  # in fractional seconds
-
-            desired_sleep_time = self.mode_config.loop_speed - this_loop_duration
-            if desired_sleep_time < 0.001:
-                # if processing longer than desired loop set a very tiny
-                # sleep time just to let processor breathe...
-                desired_sleep_time = 0.001
-            time.sleep(desired_sleep_time)
-
-    def prepare_to_start(self):
+        elif (lineposition < 5) or (lineposition > 245):
+            self.num_offtrack += 1
+        if lineposition < 95:
+            self.num_left += 1
+        if lineposition > 155:
+            self.num_right += 1
+        self.num_loops += 1
+
+    async def prepare_to_start(self):
         self.screen_dashboard.show_L_throttle(0)
         self.screen_dashboard.show_R_throttle(0)
         # self.screen_dashboard.hide_line_position()
@@ -178,6 +436,7 @@ class Mode_FollowPath:
         self.screen_dashboard.set_text4(temp, mycolors.WHITE, "L")
         self.screen_dashboard.set_text5("Starting Soon", mycolors.WHITE, "L")
 
+        self.device_buttons.clear_events()
         time_til_start = 5
         while time_til_start > 0:
             self.screen_dashboard.set_text3(
@@ -186,16 +445,9 @@ class Mode_FollowPath:
             time_til_start -= 1
             # now wait 1 second, but check for "A" button cancel every 0.1 sec
             for i in range(10):
-                buttons = self.screen_dashboard.this_tft.buttons
-                if buttons.a:
-                    still_pressed = True
-                    while still_pressed:
-                        buttons = self.screen_dashboard.this_tft.buttons
-                        still_pressed = buttons.a
-                        time.sleep(0.05)
-                    # print("released")
+                if self.device_buttons.was_pressed("a"):
                     return "CANCEL"
-                time.sleep(0.1)
+                await asyncio.sleep(0.1)
 
         self.screen_dashboard.set_text4("")  # clear out run number
         self.screen_dashboard.set_text5("")  # clear out "starting soon"
@@ -204,6 +456,9 @@ class Mode_FollowPath:
     def get_run_number(self):
         return self.run_number
 
+    def get_log_path(self):
+        return self.log_path
+
     def get_num_green(self):
         return self.num_green
 
@@ -227,3 +482,10 @@ class Mode_FollowPath:
 
     def get_total_run_time(self):
         return self.total_run_time
+
+    # tick lateness (seconds) at the given percentile, from scheduler histogram
+    def get_jitter(self, pct):
+        return self.loop_scheduler.get_lateness_percentile(pct)
+
+    def get_num_missed(self):
+        return self.loop_scheduler.get_num_missed()
@@ -0,0 +1,167 @@
+"""
+# Controller for Line-Following Robot
+# This runs on an Adafruit Feather M4, with a MiniTFT board.
+# It drives a TB6612 to control 2 DC Motors (in blue servo case)
+# and talks over I2C to an ItsyBitsy that interfaces a Pololu
+# line following sensor
+#
+# Author(s): Don Korte
+# Module:  robot_session.py creates every device, mode and screen handler
+#   and wires them together, along with the cooperative runtime and its
+#   background jobs.  code.py runs its master loop on a Robot_Session;
+#   the host tools (tracksim, virtual_time) build the same one on the
+#   fake hardware, so what they simulate is what the robot runs.
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+from adafruit_featherwing import minitft_featherwing
+
+from screen_menu import Screen_Menu
+from screen_dashboard import Screen_Dashboard
+from screen_summary import Screen_Summary
+from mode_config import Mode_Config
+from mode_followpath import Mode_FollowPath
+from mode_driveshapes import Mode_DriveShapes
+from mode_calibrate import Mode_Calibrate
+from device_motors import Device_Motors
+from device_linesense import Device_LineSense
+from device_storage import Device_Storage
+from device_battery import Device_Battery
+from device_buttons import Device_Buttons
+from device_i2cbus import Device_I2CBus, PRIORITY_BACKGROUND
+from runtime import Runtime
+
+SEESAW_ADDRESS = 0x5E  # MiniTFT FeatherWing buttons and backlight
+
+MAINMENU_ITEMS = [
+    ["Calibrate Sensors", "CAL"],
+    ["Follow Path", "PATH"],
+    ["Setup Parameters", "SETUP"],
+    ["Display Linesensor", "DISPSENS"],
+]
+
+
+class Robot_Session:
+    # load_config restores the saved Mode_Config options (the host tools
+    # leave it off so a saved config doesn't change their results);
+    # print_stats is passed on to Mode_FollowPath
+    def __init__(self, load_config=True, print_stats=False):
+        # create instance for TFT board
+        # (note it is possible that the TFT board itself doesn't have any
+        # pullups for the I2C pins used for SeeSaw -- if you use it without
+        # including pullups, the display shows letters but this driver
+        # initialization never completes...)
+        # the seesaw shares the I2C bus with the line sensor; both go
+        # through the bus manager, the seesaw at background priority
+        self.i2c_bus = Device_I2CBus()
+        self.i2c_bus.add_device("seesaw", SEESAW_ADDRESS, PRIORITY_BACKGROUND)
+        self.minitft = minitft_featherwing.MiniTFTFeatherWing(
+            i2c=self.i2c_bus.get_proxy()
+        )
+
+        # create / initialize device handlers
+        self.device_buttons = Device_Buttons(self.minitft, i2c_bus=self.i2c_bus)
+        self.mode_config = Mode_Config(self.minitft, self.device_buttons)
+        if load_config:
+            self.mode_config.load_config()
+        self.screen_dashboard = Screen_Dashboard(self.minitft, self.mode_config)
+        self.device_motors = Device_Motors(self.screen_dashboard)
+        self.device_linesense = Device_LineSense(
+            self.screen_dashboard, i2c_bus=self.i2c_bus
+        )
+        self.device_storage = Device_Storage()
+        self.device_battery = Device_Battery()
+
+        # create instances of mode handlers
+        self.screen_menu = Screen_Menu(
+            self.minitft,
+            MAINMENU_ITEMS,
+            self.device_linesense,
+            self.device_battery,
+            self.device_buttons,
+        )
+        self.mode_followpath = Mode_FollowPath(
+            self.screen_dashboard,
+            self.device_motors,
+            self.device_linesense,
+            self.device_storage,
+            self.mode_config,
+            self.device_buttons,
+            self.device_battery,
+            print_stats=print_stats,
+        )
+        self.mode_driveshapes = Mode_DriveShapes(
+            self.screen_dashboard,
+            self.device_motors,
+            self.device_linesense,
+            self.device_storage,
+            self.device_buttons,
+        )
+        self.mode_calibrate = Mode_Calibrate(
+            self.screen_dashboard,
+            self.device_motors,
+            self.device_linesense,
+            self.device_storage,
+            self.device_buttons,
+        )
+        self.screen_summary = Screen_Summary(
+            self.minitft,
+            self.mode_followpath,
+            self.mode_config,
+            self.device_storage,
+            self.device_battery,
+            self.device_buttons,
+        )
+
+        # create cooperative runtime and its background jobs; these run in
+        # the idle time of whichever mode is active (see runtime.py)
+        runtime = self.runtime = Runtime()
+        self.i2c_bus.set_slack_function(runtime.slack)
+        runtime.add_job(
+            "i2c", self.i2c_bus.service, period=0.01, priority=0, budget=0.001
+        )
+        runtime.add_job(
+            "buttons",
+            self.device_buttons.sample,
+            self.device_buttons.sample_period,
+            priority=1,
+            budget=self.device_buttons.sample_budget,
+        )
+        runtime.add_job(
+            "motors", self.device_motors.service_ramp, period=0.02, priority=1
+        )
+        runtime.add_job(
+            "display",
+            self.screen_dashboard.refresh_frame,
+            period=0.01,
+            priority=2,
+            budget=0,
+        )
+        runtime.add_job(
+            "runlog", self.device_storage.service_log, period=0.02, priority=3, budget=0
+        )
+        runtime.add_job("battery", self.device_battery.update, period=2.0, priority=5)
@@ -0,0 +1,148 @@
+"""
+# Controller for Line-Following Robot
+# This runs on an Adafruit Feather M4, with a MiniTFT board.
+# It drives a TB6612 to control 2 DC Motors (in blue servo case)
+# and talks over I2C to an ItsyBitsy that interfaces a Pololu
+# line following sensor
+#
+# Author(s): Don Korte
+# Module:  runtime.py is the cooperative (asyncio) runtime that code.py
+#   runs everything under.  The current mode (menu, config, followpath,
+#   etc) runs as the foreground coroutine; when followpath is driving,
+#   its control loop registers its Loop_Scheduler here so everything
+#   else knows when the next control tick is due.
+#
+#   Lower-priority work (battery watch, and later display refresh and
+#   telemetry flush) is registered as "jobs", each with its own rate,
+#   priority and time budget.  A single background task runs the most
+#   important due job whose budget fits in the time left before the next
+#   control tick, so background work fills the idle time between ticks
+#   and never delays one.
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+import device_clock
+import asyncio
+
+# slack reported when no control loop is running (ie. effectively unlimited)
+NO_CONTROL_SLACK = 1.0
+
+
+class Runtime_Job:
+    def __init__(self, name, function, period, priority, budget):
+        self.name = name
+        self.function = function  # called with no args; must not block
+        self.period = period  # seconds between runs
+        self.priority = priority  # 0 is most important
+        self.budget = budget  # seconds of slack needed before it may run
+        self.next_due = 0
+        self.num_runs = 0
+        self.num_deferred = 0  # times it was due but didn't fit in slack
+        self.deferred = False
+
+
+class Runtime:
+    def __init__(self):
+        self.jobs = []
+        self.loop_scheduler = None  # set while a control loop is running
+        self.background_task = None
+
+    # registers a background job; jobs with lower priority numbers win when
+    # more than one is due in the same idle slot
+    def add_job(self, name, function, period, priority=5, budget=0.002):
+        job = Runtime_Job(name, function, period, priority, budget)
+        self.jobs.append(job)
+        self.jobs.sort(key=lambda j: j.priority)
+        return job
+
+    def get_job(self, name):
+        for job in self.jobs:
+            if job.name == name:
+                return job
+        return None
+
+    # the control loop registers its scheduler while it runs (None when done)
+    def set_control(self, loop_scheduler):
+        self.loop_scheduler = loop_scheduler
+
+    def is_control_active(self):
+        return self.loop_scheduler is not None
+
+    # seconds until the next control tick is due (negative if overdue)
+    def slack(self):
+        if self.loop_scheduler is None:
+            return NO_CONTROL_SLACK
+        return self.loop_scheduler.time_until_tick()
+
+    def start(self):
+        now = device_clock.monotonic()
+        for job in self.jobs:
+            job.next_due = now + job.period
+        self.background_task = asyncio.create_task(self._run_background())
+
+    async def _run_background(self):
+        while True:
+            now = device_clock.monotonic()
+            slack = self.slack()
+            next_due = now + NO_CONTROL_SLACK
+            any_deferred = False
+            ran_job = False
+            for job in self.jobs:
+                if job.next_due > now:
+                    if job.next_due < next_due:
+                        next_due = job.next_due
+                    continue
+                if job.budget > slack:
+                    if not job.deferred:
+                        job.deferred = True
+                        job.num_deferred += 1
+                    any_deferred = True
+                    continue
+                job.deferred = False
+                job.next_due += job.period
+                if job.next_due < now:
+                    # fell behind (eg. long blocking mode); don't burst
+                    job.next_due = now + job.period
+                job.function()
+                job.num_runs += 1
+                ran_job = True
+                break
+
+            if ran_job:
+                # give the control loop a chance before the next job
+                await asyncio.sleep(0)
+                continue
+
+            if any_deferred:
+                # something is due but doesn't fit before the next control
+                # tick; wait for that tick to run, then look again
+                wait = slack
+            else:
+                wait = next_due - now
+            if wait < 0:
+                wait = 0
+            await asyncio.sleep(wait)
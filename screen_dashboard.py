@@ -41,7 +41,8 @@
 from adafruit_display_text import label
 import terminalio
 import displayio
-import time
+import device_clock
+from loop_scheduler import Slack_Budget
 from adafruit_display_shapes.line import Line
 from adafruit_display_shapes.circle import Circle
 from adafruit_display_shapes.rect import Rect
@@ -129,6 +130,32 @@ class Screen_Dashboard:
             fill=mycolors.DARK_GRAY, outline=mycolors.DARK_GRAY)
         self.this_group.append(self.right_throtval_box)
 
+        # what is currently rendered on each gauge, so show_xxx() calls only
+        # touch displayio properties (and invalidate areas) that changed
+        self.rendered_L_height = self.screen_height
+        self.rendered_L_fill = mycolors.DARK_GRAY
+        self.rendered_R_height = self.screen_height
+        self.rendered_R_fill = mycolors.DARK_GRAY
+        self.rendered_marker_x = self.lineposition_marker.x
+        self.rendered_marker_fill = mycolors.PASTEL_GREEN
+
+        gage_box_width = self.screen_width - (2*(THROT_BOX_WIDTH + GUTTER))
+        half_width = (gage_box_width - BALL_RADIUS) / 2
+        self.pixels_per_count = half_width / 125
+
+        self.num_gauge_updates = 0
+        self.num_skipped_updates = 0
+
+        # frame pacing (see begin_paced_refresh); frame_budget is the slack
+        # needed before the next control tick to risk a refresh
+        self.paced_refresh = False
+        self.frame_period = 0.1
+        self.next_frame_time = 0
+        self.frame_budget = Slack_Budget(0.004)
+        self.slack_function = None
+        self.num_frames = 0
+        self.num_frames_deferred = 0
+
 
     def show_this_screen(self):
         self.this_tft.display.show(self.this_group)
@@ -139,17 +166,26 @@ class Screen_Dashboard:
     #                   red if negative (backwards)
     def show_L_throttle(self, throtval=0):
         if (self.mode_config.get_showdisp() == "Yes"):
-            self.left_throtval_box.y = 0
-            self.left_throtval_box.height = self.screen_height
-            self.left_throtval_box.fill = mycolors.DARK_GRAY
-
+            self.num_gauge_updates += 1
             throt_pixels_tall = abs(int(throtval * self.screen_height))
-            self.left_throtval_box.y = self.screen_height - throt_pixels_tall
-            self.left_throtval_box.height = throt_pixels_tall
             if (throtval >= 0):
-                self.left_throtval_box.fill = mycolors.GREEN
+                fill = mycolors.GREEN
             else:
-                self.left_throtval_box.fill = mycolors.RED
+                fill = mycolors.RED
+
+            # only touch the displayio properties that actually changed
+            changed = False
+            if (throt_pixels_tall != self.rendered_L_height):
+                self.left_throtval_box.y = self.screen_height - throt_pixels_tall
+                self.left_throtval_box.height = throt_pixels_tall
+                self.rendered_L_height = throt_pixels_tall
+                changed = True
+            if (fill != self.rendered_L_fill):
+                self.left_throtval_box.fill = fill
+                self.rendered_L_fill = fill
+                changed = True
+            if (not changed):
+                self.num_skipped_updates += 1
 
     # displays rectangle in right throttle gage representing throttle value
     # at entry throtval is -1 through +1
@@ -157,17 +193,26 @@ class Screen_Dashboard:
     #   red if negative (backwards)
     def show_R_throttle(self, throtval=0):
         if (self.mode_config.get_showdisp() == "Yes"):
-            self.right_throtval_box.y = 0
-            self.right_throtval_box.height = self.screen_height
-            self.right_throtval_box.fill = mycolors.DARK_GRAY
-
+            self.num_gauge_updates += 1
             throt_pixels_tall = abs(int(throtval * self.screen_height))
-            self.right_throtval_box.y = self.screen_height - throt_pixels_tall
-            self.right_throtval_box.height = throt_pixels_tall
             if (throtval >= 0):
-                self.right_throtval_box.fill = mycolors.GREEN
+                fill = mycolors.GREEN
             else:
-                self.right_throtval_box.fill = mycolors.RED
+                fill = mycolors.RED
+
+            # only touch the displayio properties that actually changed
+            changed = False
+            if (throt_pixels_tall != self.rendered_R_height):
+                self.right_throtval_box.y = self.screen_height - throt_pixels_tall
+                self.right_throtval_box.height = throt_pixels_tall
+                self.rendered_R_height = throt_pixels_tall
+                changed = True
+            if (fill != self.rendered_R_fill):
+                self.right_throtval_box.fill = fill
+                self.rendered_R_fill = fill
+                changed = True
+            if (not changed):
+                self.num_skipped_updates += 1
 
     # displays bal representing line position
     # at entry line_position is 0-250 with 125=center
@@ -177,12 +222,9 @@ class Screen_Dashboard:
     # 
     def show_line_position(self, line_position=125):
         if (self.mode_config.get_showdisp() == "Yes"):
-            gage_box_width = self.screen_width - (2*(THROT_BOX_WIDTH + GUTTER))
-            half_width = (gage_box_width - BALL_RADIUS) / 2
-            pixels_per_count = half_width / 125     
-
-            self.lineposition_marker.x = (int(self.screen_width/2) 
-                + int(pixels_per_count * (line_position - 125)) - BALL_RADIUS)
+            self.num_gauge_updates += 1
+            marker_x = (int(self.screen_width/2) 
+                + int(self.pixels_per_count * (line_position - 125)) - BALL_RADIUS)
             
             if (abs(line_position - 125) < 30):
                 current_color = mycolors.GREEN
@@ -191,13 +233,90 @@ class Screen_Dashboard:
             else:
                 current_color = mycolors.BLUE
 
-            self.lineposition_marker.fill = current_color
+            # only touch the displayio properties that actually changed
+            changed = False
+            if (marker_x != self.rendered_marker_x):
+                self.lineposition_marker.x = marker_x
+                self.rendered_marker_x = marker_x
+                changed = True
+            if (current_color != self.rendered_marker_fill):
+                self.lineposition_marker.fill = current_color
+                self.rendered_marker_fill = current_color
+                changed = True
+            if (not changed):
+                self.num_skipped_updates += 1
 
 
     # this function hides the line position marker by turning it the same 
     # color as its background
     def hide_line_position(self):
         self.lineposition_marker.fill = mycolors.WHITE
+        self.rendered_marker_fill = mycolors.WHITE
+
+    # turns off displayio auto_refresh and instead refreshes at fps frames
+    # per second from refresh_frame(). slack_function returns seconds until
+    # the next control tick; a frame is only drawn if that is at least
+    # frame_budget, so a refresh never delays a control tick
+    def begin_paced_refresh(self, fps, slack_function):
+        self.paced_refresh = True
+        self.frame_period = 1 / fps
+        self.slack_function = slack_function
+        self.next_frame_time = device_clock.monotonic()
+        self.num_frames = 0
+        self.num_frames_deferred = 0
+        self.frame_budget.reset()
+        self.this_tft.display.auto_refresh = False
+
+    def end_paced_refresh(self):
+        if self.paced_refresh:
+            self.paced_refresh = False
+            self.slack_function = None
+            self.this_tft.display.auto_refresh = True
+
+    # draws one frame if one is due and there is time for it; meant to be
+    # run often as a low-priority runtime job
+    def refresh_frame(self):
+        if not self.paced_refresh:
+            return
+        now = device_clock.monotonic()
+        if now < self.next_frame_time:
+            return
+        if not self.frame_budget.allows(self.slack_function()):
+            self.num_frames_deferred += 1
+            return
+
+        # note frames are far enough apart that refresh() never waits
+        # for its own target frame rate
+        self.this_tft.display.refresh(
+            target_frames_per_second=60, minimum_frames_per_second=0)
+        end = device_clock.monotonic()
+        self.num_frames += 1
+        self.frame_budget.record(end - now)
+
+        self.next_frame_time += self.frame_period
+        if self.next_frame_time < end:
+            # fell behind; don't try to catch up with back-to-back frames
+            self.next_frame_time = end + self.frame_period
+
+    def get_num_frames(self):
+        return self.num_frames
+
+    def get_num_frames_deferred(self):
+        return self.num_frames_deferred
+
+    # clears the counters of gauge updates that were (or weren't) rendered
+    def reset_render_stats(self):
+        self.num_gauge_updates = 0
+        self.num_skipped_updates = 0
+
+    # number of gauge update calls made (while runtime display is on)
+    def get_num_gauge_updates(self):
+        return self.num_gauge_updates
+
+    # number of those calls that changed no pixels, so touched no displayio
+    # properties at all
+    def get_num_skipped_updates(self):
+        return self.num_skipped_updates
 
 
     def set_text1(self, text, color=mycolors.YELLOW, justify="C"):
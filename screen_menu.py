@@ -37,15 +37,16 @@
 from adafruit_display_text import label
 import terminalio
 import displayio
-import time
+import asyncio
 
 import mycolors
 
 class Screen_Menu:
     def __init__(self, tft_device, menu_items, device_linesense, 
-        device_battery):
+        device_battery, device_buttons):
 
         self.this_tft = tft_device
+        self.device_buttons = device_buttons
         self.menu_items = menu_items
         self.num_of_menu_items = len(menu_items)
         self.first_to_show = 0
@@ -98,7 +99,7 @@ class Screen_Menu:
 
     # this function initiates mode, runs it till done, then returns 
     # text string indicating next mode
-    def run_menu(self):
+    async def run_menu(self):
         self.show_this_screen()
         self.textbox_1.text = "UP / DOWN to scroll";
         self.textbox_2.text = "Click A to select"
@@ -117,44 +118,28 @@ class Screen_Menu:
         else:
             self.textbox_bat.color = mycolors.GREEN
 
+        self.device_buttons.clear_events()
         while True:
-            # note possibilities are buttons.up buttons.down buttons.left 
-            # buttons.right buttons.select buttons.a buttons.b
-            buttons = self.this_tft.buttons
+            # note possibilities are up down left right select a b
+            # (events are queued by the button service; no I2C here)
+            button = self.device_buttons.get_press(repeat_buttons=("up", "down"))
 
             mustScrollDisplay = False
-            if buttons.up:
+            if button == "up":
                 # print("Button UP!")
-                still_pressed = True
-                while  still_pressed:
-                    buttons = self.this_tft.buttons
-                    still_pressed = buttons.up
-                    time.sleep(0.05)
-                # print("released")
                 self.cur_selected_list_item -= 1
                 if (self.cur_selected_list_item < 0):
                     self.cur_selected_list_item = self.num_of_menu_items - 1
 
-            elif buttons.down:
+            elif button == "down":
                 # print("Button Down!")
-                still_pressed = True
-                while  still_pressed:
-                    buttons = self.this_tft.buttons
-                    still_pressed = buttons.down
-                    time.sleep(0.05)
-                # print("released")
                 self.cur_selected_list_item += 1
                 if (self.cur_selected_list_item >= self.num_of_menu_items):
                     self.cur_selected_list_item = 0
 
-            elif buttons.a:
+            elif button == "a":
                 # print("Button A!")
-                still_pressed = True
-                while  still_pressed:
-                    buttons = self.this_tft.buttons
-                    still_pressed = buttons.a
-                    time.sleep(0.05)
-                # print("released")
+                self.device_buttons.clear_events()
                 return self.menu_items[self.cur_selected_list_item][1]
 
             else:
@@ -205,4 +190,4 @@ class Screen_Menu:
             if ((self.first_to_show + 3) == self.cur_selected_list_item):
                 self.textbox_6.color = mycolors.WHITE
 
-            time.sleep(0.1)
\ No newline at end of file
+            await asyncio.sleep(0.1)
\ No newline at end of file
@@ -37,15 +37,16 @@
 from adafruit_display_text import label
 import terminalio
 import displayio
-import time
+import asyncio
 
 import mycolors
 
 class Screen_Summary:
     def __init__(self, tft_device, mode_followpath, mode_config, 
-        device_storage, device_battery):
+        device_storage, device_battery, device_buttons):
 
         self.this_tft = tft_device
+        self.device_buttons = device_buttons
         self.mode_followpath = mode_followpath
         self.mode_config = mode_config
         self.device_storage = device_storage
@@ -99,12 +100,16 @@ class Screen_Summary:
             color=mycolors.YELLOW, x=2, y=60)
         self.this_group.append(self.textbox_11)
 
+        self.textbox_12 = label.Label(terminalio.FONT, text= "", max_glyphs=36, 
+            color=mycolors.WHITE, x=90, y=60)
+        self.this_group.append(self.textbox_12)
+
 
     def show_this_screen(self):
         self.this_tft.display.show(self.this_group)
 
     # this function initiates mode, runs it till done, then returns text string indicating next mode
-    def run_mode(self):
+    async def run_mode(self):
         self.show_this_screen()
         self.textbox_1.text = ("Run #: " 
             + str(self.mode_followpath.get_run_number()))
@@ -129,15 +134,19 @@ class Screen_Summary:
         
         proc_time_per_loop_s = (self.mode_followpath.get_total_proc_time() 
             / self.mode_followpath.get_num_loops())
-        mytext = "Proc: {:.1f} mS".format(round(proc_time_per_loop_s*1000, 0))
+        # average / worst loop processing time (worst is from telemetry)
+        max_loop_ms = self.device_storage.get_max_loop_us() / 1000
+        mytext = "Proc {:.0f}/{:.0f}mS".format(proc_time_per_loop_s*1000, 
+            max_loop_ms)
         self.textbox_5.text = mytext
 
         self.textbox_6.text = "Vbat F {:.2f}".format(self.device_battery.get_vbat_feather())
         
-        free_time_per_loop_s = (self.mode_config.get_loop_speed() 
-            - proc_time_per_loop_s)
-        mytext = "Free: {:.1f} mS".format(round(free_time_per_loop_s*1000, 0))
-        if (free_time_per_loop_s < 0):
+        # tick lateness p50 / p99 from the loop scheduler histogram
+        jitter_p50 = self.mode_followpath.get_jitter(50)
+        jitter_p99 = self.mode_followpath.get_jitter(99)
+        mytext = "Jit {:.1f}/{:.1f}".format(jitter_p50*1000, jitter_p99*1000)
+        if (jitter_p99 >= self.mode_config.get_loop_speed()):
             self.textbox_7.color = mycolors.RED
         else:
             self.textbox_7.color = mycolors.WHITE
@@ -154,20 +163,39 @@ class Screen_Summary:
         self.textbox_10.text = mytext
 
 
-        self.textbox_11.text = "A / exit     B / save"
+        num_missed = self.mode_followpath.get_num_missed()
+        self.textbox_12.text = "Miss: {0:d}".format(num_missed)
+        if (num_missed > 0):
+            self.textbox_12.color = mycolors.RED
+        else:
+            self.textbox_12.color = mycolors.WHITE
 
-        while True:
-            buttons = self.this_tft.buttons
+        saved_path = self.mode_followpath.get_log_path()
+        if (saved_path is not None):
+            self._show_saved(saved_path)
+        else:
+            self.textbox_11.text = "A/exit B/save"
 
-            if buttons.a:
+        self.device_buttons.clear_events()
+        while True:
+            button = self.device_buttons.get_press()
+            if button == "a":
                 # print("Button A cycle")
-                still_pressed = True
-                while  still_pressed:
-                    buttons =       self.this_tft.buttons
-                    still_pressed = buttons.a
-                    time.sleep(0.05)
-                # print("released")
                 return 
-
-            time.sleep(0.1)
-
+            elif (button == "b") and (saved_path is None):
+                self.textbox_11.text = "saving..."
+                saved_path = self.device_storage.dump_telemetry_log(
+                    self.mode_followpath.make_log_header)
+                if (saved_path is None):
+                    self.textbox_11.text = "A/exit NO SAVE"
+                else:
+                    self._show_saved(saved_path)
+
+            await asyncio.sleep(0.1)
+
+    # shows name of run log file (without directory or extension)
+    def _show_saved(self, path):
+        name = path[path.rfind("/")+1:]
+        if name.endswith(".lfr"):
+            name = name[:-4]
+        self.textbox_11.text = "A/exit " + name
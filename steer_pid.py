@@ -0,0 +1,150 @@
+"""
+# Controller for Line-Following Robot
+# This runs on an Adafruit Feather M4, with a MiniTFT board.
+# It drives a TB6612 to control 2 DC Motors (in blue servo case)
+# and talks over I2C to an ItsyBitsy that interfaces a Pololu
+# line following sensor
+#
+# Author(s): Don Korte
+# Module:  steer_pid.py is the PID steering controller Mode_FollowPath
+#   uses when the Steering option is "PID" (else it looks the wheel
+#   throttles up in the Mode_Config steering table, which is the
+#   proportional-only case).
+#
+#   error is the line position scaled to -1 => +1, signed like the
+#   table's curve (line to my right is +), so Kp means the same as
+#   rxn_rate:
+#     curve = Kp * error + integral + Kd * d(error)/dt
+#   clamped to +/- rxn_limit, then converted to wheel throttles the way
+#   curved_throttles() does.
+#
+#   - d(error)/dt uses the measured time between ticks (from the loop
+#     scheduler), and is low-pass filtered (time constant
+#     d_filter_time) since the sensor's 1/125 steps make raw
+#     differences very spiky
+#   - anti-windup: the integral stops growing while the output is
+#     clamped at rxn_limit in the direction the error pushes, and is
+#     itself never more than rxn_limit, so it can't hold the robot at
+#     the limit after the line comes back
+#
+#   update() is called every control tick so it only does arithmetic on
+#   attributes: no lists, tuples or other objects are built per call
+#
+# github: https://github.com/dnkorte/linefollower_controller
+#
+# MIT License
+#
+# Copyright (c) 2020 Don Korte
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+"""
+
+
+class Steer_PID:
+    def __init__(self, d_filter_time=0.03):
+        self.d_filter_time = d_filter_time  # seconds
+        self.throttle = 0
+        self.kp = 1.0
+        self.ki = 0
+        self.kd = 0
+        self.limit = 1.0
+        self.reset()
+
+    # sets base throttle, gains and output clamp (rxn_limit); also resets
+    def configure(self, throttle, kp, ki, kd, limit):
+        self.throttle = throttle
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.limit = limit
+        self.reset()
+
+    # clears integral and derivative history; call at start of each run
+    def reset(self):
+        self.integral = 0.0  # integral term (already times ki)
+        self.derivative = 0.0  # filtered d(error)/dt, per second
+        self.prev_error = 0.0
+        self.have_prev = False
+
+        # outputs of the last update()
+        self.curve = 0.0
+        self.limited = 0  # 1 if curve was clamped to +/- limit
+        self.throt_L = self.throttle
+        self.throt_R = self.throttle
+        # same values scaled by 1000 as ints, for telemetry logging
+        self.curve_milli = 0
+        self.throt_L_milli = int(round(self.throttle * 1000))
+        self.throt_R_milli = self.throt_L_milli
+
+    # one control step for line position (0 => 250), dt seconds after the
+    # previous one; results are left in curve, limited and throt_L/R
+    def update(self, position, dt):
+        error = (125 - position) / 125
+
+        if self.have_prev and dt > 0:
+            raw = (error - self.prev_error) / dt
+            self.derivative += (raw - self.derivative) * (
+                dt / (self.d_filter_time + dt)
+            )
+        self.prev_error = error
+        self.have_prev = True
+
+        curve = self.kp * error + self.integral + self.kd * self.derivative
+        limit = self.limit
+        if curve > limit:
+            curve = limit
+            self.limited = 1
+        elif curve < -limit:
+            curve = -limit
+            self.limited = 1
+        else:
+            self.limited = 0
+
+        # anti-windup: don't integrate further into the clamp
+        if self.ki and dt > 0:
+            if not (
+                (self.limited and curve > 0 and error > 0)
+                or (self.limited and curve < 0 and error < 0)
+            ):
+                self.integral += self.ki * error * dt
+                if self.integral > limit:
+                    self.integral = limit
+                elif self.integral < -limit:
+                    self.integral = -limit
+
+        # same as curved_throttles() in device_motors, without the tuple
+        throttle = self.throttle
+        throt_L = throttle + (throttle * curve / 2)
+        if throt_L < 0:
+            throt_L = 0
+        if throt_L > 1:
+            throt_L = 1
+        throt_R = throttle - (throttle * curve / 2)
+        if throt_R < 0:
+            throt_R = 0
+        if throt_R > 1:
+            throt_R = 1
+
+        self.curve = curve
+        self.throt_L = throt_L
+        self.throt_R = throt_R
+        self.curve_milli = int(round(curve * 1000))
+        self.throt_L_milli = int(round(throt_L * 1000))
+        self.throt_R_milli = int(round(throt_R * 1000))